@@ -0,0 +1,59 @@
+import math
+from typing import Optional, Sequence
+
+
+def sign_test_p_value(wins: int, losses: int) -> float:
+    """One-sided sign test: chance of at least ``wins`` wins out of ``wins + losses`` fair coin flips."""
+    n = wins + losses
+    if n == 0:
+        return 1.0
+    return sum(math.comb(n, k) for k in range(wins, n + 1)) / 2 ** n
+
+
+class SequentialAcceptance:
+    """Accepts an instruction change only when it is significantly better.
+
+    Works on paired per-test differences ``new score - old score``; ties
+    carry no information and are ignored. After every round of samples the
+    change is accepted if a one-sided sign test is significant, and rejected
+    if it is significantly worse or if it could not become significant even
+    if every remaining sample were a win (futility). Otherwise another round
+    of ``round_size`` samples is drawn, up to ``max_rounds``; a change that is
+    still ambiguous after that is rejected. The significance level is split
+    evenly over the ``max_rounds + 1`` looks, which keeps the overall false
+    acceptance rate at or below ``alpha`` despite stopping early.
+    """
+
+    def __init__(self, alpha: float = 0.05, max_rounds: int = 3, round_size: int = 16):
+        self.alpha = alpha
+        self.max_rounds = max_rounds
+        self.round_size = round_size
+        self.accepted = 0
+        self.rejected = 0
+        self.extra_rounds = 0
+
+    @property
+    def alpha_per_look(self) -> float:
+        return self.alpha / (self.max_rounds + 1)
+
+    def decide(self, differences: Sequence[int], remaining_samples: int) -> Optional[bool]:
+        """``True`` to accept, ``False`` to reject, ``None`` if more samples are needed."""
+        wins = sum(1 for difference in differences if difference > 0)
+        losses = sum(1 for difference in differences if difference < 0)
+        if sign_test_p_value(wins, losses) <= self.alpha_per_look:
+            return True
+        if sign_test_p_value(losses, wins) <= self.alpha_per_look:
+            return False
+        if sign_test_p_value(wins + remaining_samples, losses) > self.alpha_per_look:
+            return False
+        return None
+
+    def record(self, accepted: bool, rounds: int) -> None:
+        if accepted:
+            self.accepted += 1
+        else:
+            self.rejected += 1
+        self.extra_rounds += rounds
+
+    def summary(self) -> str:
+        return f"{self.accepted} changes accepted, {self.rejected} rejected, {self.extra_rounds} extra sampling rounds"
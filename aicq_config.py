@@ -39,7 +39,7 @@ Answer only with the succinct search query and nothing else.
 SAMPLE_TEST_CASES = test_cases = [
     {
         "name": "Ambiguous pronoun resolution",
-        "question_history": [
+        "query_history": [
             "Who was the first person to walk on the moon?",
             "What was the name of his spacecraft?",
             "When did he return to Earth?",
@@ -50,7 +50,7 @@ SAMPLE_TEST_CASES = test_cases = [
     },
     {
         "name": "Irrelevant recent history",
-        "question_history": [
+        "query_history": [
             "What's the capital of Japan?",
             "What's the population of Tokyo?",
             "What's the tallest mountain in Japan?",
@@ -63,7 +63,7 @@ SAMPLE_TEST_CASES = test_cases = [
     },
     {
         "name": "Implicit context continuation",
-        "question_history": [
+        "query_history": [
             "What's the largest mammal on Earth?",
             "How long can blue whales live?",
             "What do they eat?",
@@ -74,7 +74,7 @@ SAMPLE_TEST_CASES = test_cases = [
     },
     {
         "name": "Context switch with similar terms",
-        "question_history": [
+        "query_history": [
             "What's the largest planet in our solar system?",
             "How many moons does Jupiter have?",
             "What's the Great Red Spot?",
@@ -86,7 +86,7 @@ SAMPLE_TEST_CASES = test_cases = [
     },
     {
         "name": "Long-term context recall",
-        "question_history": [
+        "query_history": [
             "Who wrote 'Pride and Prejudice'?",
             "When was it published?",
             "What's the plot of 'Sense and Sensibility'?",
@@ -164,7 +164,7 @@ Focus on creating a scenario that is particularly challenging for contextual que
 Output the new test case in the following format:
 {{
     "name": "Test case name",
-    "question_history": ["Question 1", "Question 2", "Question 3"],
+    "query_history": ["Question 1", "Question 2", "Question 3"],
     "new_query": "New question",
     "expected": ["expected1", "expected2", "expected3"],
     "unexpected": ["unexpected1", "unexpected2", "unexpected3"]
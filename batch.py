@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import glob
+
+from cache import SQLiteCache
+from jobs import QueuedChatModel
+from improvements import aadversarial_improvement, set_verbosity
+from main import aevaluate_final, finish_run, load_config, make_models, model_names, preflight_report, prepare_run, scheduler_settings
+
+
+async def run_batch(config_files, seeds, options, models, cache):
+    """Run every (config, seed) pair concurrently in one event loop.
+
+    Runs using the same model share it (and so its client, connection pool
+    and concurrency limit) and all runs share the response cache; each run
+    keeps its own budget, checkpoint, event log and results file.
+    """
+    runs = [prepare_run(config_file, options, models, cache, seed) for config_file in config_files for seed in seeds]
+    outcomes = await asyncio.gather(
+        *(aadversarial_improvement(*run["args"], settings=run["settings"]) for run in runs),
+        return_exceptions=True
+    )
+    await asyncio.gather(*(
+        aevaluate_final(run, *outcome) for run, outcome in zip(runs, outcomes) if not isinstance(outcome, BaseException)
+    ))
+
+    for run in runs:
+        finish_run(run)
+
+    print(f"\n{'run':<24}{'status':<8}{'budget used':<40}results")
+    for run, outcome in zip(runs, outcomes):
+        status = "failed" if isinstance(outcome, BaseException) else "ok"
+        used = f"{type(outcome).__name__}: {outcome}" if status == "failed" else run["settings"].budget.summary()
+        print(f"{run['name']:<24}{status:<8}{used:<40}{run['output_filename']}")
+    return outcomes
+
+
+def check_schedulers(config_files, options):
+    """Runs share one scheduler per model, so configs using a model must schedule it the same way."""
+    schedulers = {}
+    for config_file in config_files:
+        config = load_config(config_file)
+        roles, evaluation = model_names(config, options)
+        scheduler = scheduler_settings(config, options)
+        for name in [*roles.values(), *evaluation]:
+            other_file, other = schedulers.setdefault(name, (config_file, scheduler))
+            if other != scheduler:
+                differences = ", ".join(key.upper() for key in scheduler if scheduler[key] != other[key])
+                raise SystemExit(f"{config_file} and {other_file} set different {differences} for {name}; make them agree or set them on the command line")
+
+
+def main(options):
+    config_files = options.configs or sorted(glob.glob("*_config.py"))
+    seeds = options.seeds or [None]
+    set_verbosity(options.verbosity)
+
+    # Check every config before any run starts paying for calls
+    valid = [preflight_report(config_file, load_config(config_file), options) for config_file in config_files]
+    if not all(valid):
+        raise SystemExit("Some configs have errors; fix them before running")
+    check_schedulers(config_files, options)
+    if options.dry_run:
+        return
+
+    # One client per model for every run; its scheduler limits rate and calls in flight across all of them
+    models = {}
+    for config_file in config_files:
+        config = load_config(config_file)
+        roles, evaluation = model_names(config, options)
+        make_models([*roles.values(), *evaluation], config, options, models)
+    cache = SQLiteCache(options.cache_path) if options.cache_path else None
+    asyncio.run(run_batch(config_files, seeds, options, models, cache))
+    for name, llm in models.items():
+        print(f"{'Job queue' if isinstance(llm, QueuedChatModel) else 'Scheduler'} ({name}): {llm.summary()}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run several configs, or several seeds of one config, in one process.")
+    parser.add_argument("configs", nargs="*", help="config modules to run (default: every *_config.py)")
+    parser.add_argument("--seeds", type=int, nargs="+", help="run each config once per seed; outputs get a _seed<N> suffix")
+    parser.add_argument("--max-in-flight", type=int, help="upper limit on LLM calls in flight per model, across all runs (default 16)")
+    parser.add_argument("--adaptive-concurrency", action=argparse.BooleanOptionalAction, help="halve the calls in flight on a 429 and grow them back on success (default on)")
+    parser.add_argument("--requests-per-second", type=float, help="rate limit for LLM calls per model, across all runs")
+    parser.add_argument("--max-retries", type=int, help="retries for rate-limited, timed out or failed (5xx) calls (default 3)")
+    parser.add_argument("--job-queue", help="SQLite job queue; model calls are answered by worker.py processes")
+    parser.add_argument("--cache-path", default=".cache/llm_responses.sqlite", help="shared response cache; empty to disable")
+    parser.add_argument("--max-iterations", type=int, help="maximum number of iterations per run (default 100)")
+    parser.add_argument("--plateau-iterations", type=int, help="stop a run after this many iterations without any change")
+    parser.add_argument("--max-seconds", type=float, help="stop a run after this much wall-clock time")
+    parser.add_argument("--max-calls", type=int, help="stop a run after this many paid LLM calls")
+    parser.add_argument("--max-tokens", type=int, help="stop a run after this many LLM tokens")
+    parser.add_argument("--resume", action="store_true", help="continue each run from its last checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="check every config and estimate calls and tokens, without any model call")
+    parser.add_argument("--verbosity", type=int, choices=[0, 1, 2], default=0, help="console output; runs interleave, so the default is 0")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,109 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from fake_llm import FakeChatModel
+from improvements import ImprovementSettings, adversarial_improvement, aadversarial_improvement
+from instrumentation import PHASES
+from main import load_config
+
+DEFAULT_CONFIGS = ["qa_config", "aicc_config", "aicq_config"]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+def run_benchmark(config_name: str, options: argparse.Namespace) -> Dict[str, Any]:
+    config = load_config(config_name)
+    llm = FakeChatModel(
+        latency=options.latency,
+        jitter=options.jitter,
+        error_rate=options.error_rate,
+        seed=options.seed,
+    )
+
+    settings = ImprovementSettings(
+        max_iterations=options.iterations,
+        log_file_path=os.path.join(tempfile.gettempdir(), f"benchmark_{config_name}.txt"),
+        max_concurrency=options.concurrency,
+        rng=random.Random(options.seed),
+        num_candidates=options.num_candidates,
+        population_size=options.population_size,
+        bounded=options.bounded,
+        num_test_candidates=options.num_test_candidates,
+    )
+    args = (
+        llm,
+        config.MAIN_PROMPT,
+        config.INITIAL_INSTRUCTION,
+        config.SAMPLE_TEST_CASES,
+        config.INSTRUCTION_IMPROVEMENT_PROMPT,
+        config.TEST_CASE_IMPROVEMENT_PROMPT,
+    )
+
+    started = time.perf_counter()
+    # The loop prints every response; keep the benchmark output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        if options.use_async:
+            asyncio.run(aadversarial_improvement(*args, settings=settings))
+        else:
+            adversarial_improvement(*args, settings=settings)
+    wall_time = time.perf_counter() - started
+
+    records = [record for record in llm.records if record]
+    return {"config": config_name, "wall_time": wall_time, "records": records}
+
+
+def print_report(results: List[Dict[str, Any]]) -> None:
+    print(f"{'config':<14}{'calls':>7}{'errors':>8}{'wall s':>9}{'calls/s':>9}")
+    for result in results:
+        calls = len(result["records"])
+        errors = sum(1 for record in result["records"] if record["error"])
+        print(f"{result['config']:<14}{calls:>7}{errors:>8}{result['wall_time']:>9.2f}{calls / result['wall_time']:>9.1f}")
+
+    print()
+    print(f"{'config':<14}{'phase':<12}{'role':<11}{'calls':>7}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}")
+    for result in results:
+        seen = {record["phase"] for record in result["records"]}
+        for phase in [phase for phase in PHASES if phase in seen] + sorted(seen - set(PHASES)):
+            phase_records = [record for record in result["records"] if record["phase"] == phase]
+            latencies = [record["latency"] * 1000 for record in phase_records]
+            role = "/".join(sorted({record["role"] for record in phase_records}))
+            print(
+                f"{result['config']:<14}{phase:<12}{role:<11}{len(latencies):>7}"
+                f"{percentile(latencies, 50):>9.1f}{percentile(latencies, 90):>9.1f}{percentile(latencies, 99):>9.1f}"
+            )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the improvement loop against the offline fake LLM.")
+    parser.add_argument("configs", nargs="*", default=DEFAULT_CONFIGS, help="config modules to run (default: qa, aicc, aicq)")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.02, help="uniform +/- jitter on the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--num-candidates", type=int, default=1)
+    parser.add_argument("--population-size", type=int, default=1)
+    parser.add_argument("--num-test-candidates", type=int, default=1)
+    parser.add_argument("--bounded", action="store_true")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="use the asyncio loop")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    print_report([run_benchmark(config_name, options) for config_name in options.configs])
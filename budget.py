@@ -0,0 +1,90 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+
+class RunBudget(BaseCallbackHandler):
+    """Stopping criteria for the improvement loop.
+
+    Counts paid LLM calls and tokens through LangChain callbacks (responses
+    served from the response cache are free) and tracks how many iterations
+    in a row changed neither the instruction nor the test cases. Every limit
+    is optional; the loop checks them after each iteration.
+    """
+
+    def __init__(self, plateau_iterations: Optional[int] = None, max_seconds: Optional[float] = None, max_calls: Optional[int] = None, max_tokens: Optional[int] = None):
+        self.plateau_iterations = plateau_iterations
+        self.max_seconds = max_seconds
+        self.max_calls = max_calls
+        self.max_tokens = max_tokens
+
+        self.calls = 0
+        self.tokens = 0
+        self.unchanged_iterations = 0
+        self.started_at = time.monotonic()
+        # Time spent before the run was resumed from a checkpoint
+        self.previous_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        generations = [generation for batch in response.generations for generation in batch]
+        if any((generation.generation_info or {}).get("cache_hit") for generation in generations):
+            return
+
+        tokens = 0
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                tokens += usage.get("total_tokens", 0)
+        if not tokens and response.llm_output:
+            tokens = (response.llm_output.get("token_usage") or {}).get("total_tokens", 0)
+
+        with self._lock:
+            self.calls += 1
+            self.tokens += tokens
+
+    def start(self) -> None:
+        self.started_at = time.monotonic()
+
+    def elapsed(self) -> float:
+        return self.previous_seconds + time.monotonic() - self.started_at
+
+    def record_iteration(self, changed: bool) -> None:
+        self.unchanged_iterations = 0 if changed else self.unchanged_iterations + 1
+
+    def stop_reason(self) -> Optional[str]:
+        if self.plateau_iterations is not None and self.unchanged_iterations >= self.plateau_iterations:
+            return f"no change for {self.unchanged_iterations} iterations"
+        if self.max_seconds is not None and self.elapsed() >= self.max_seconds:
+            return f"wall-clock limit reached ({self.elapsed():.0f}s of {self.max_seconds:g}s)"
+        if self.max_calls is not None and self.calls >= self.max_calls:
+            return f"call limit reached ({self.calls} of {self.max_calls} calls)"
+        if self.max_tokens is not None and self.tokens >= self.max_tokens:
+            return f"token limit reached ({self.tokens} of {self.max_tokens} tokens)"
+        return None
+
+    def state(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "tokens": self.tokens, "unchanged_iterations": self.unchanged_iterations, "seconds": self.elapsed()}
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        """Carry the counters of an interrupted run over, so limits cover the whole run."""
+        self.calls = state["calls"]
+        self.tokens = state["tokens"]
+        self.unchanged_iterations = state["unchanged_iterations"]
+        self.previous_seconds = state["seconds"]
+        self.started_at = time.monotonic()
+
+    def summary(self) -> str:
+        return f"{self.calls} LLM calls, {self.tokens} tokens, {self.elapsed():.1f}s"
+
+
+def with_callbacks(llm: Any, *handlers: Optional[BaseCallbackHandler]) -> Any:
+    """Return a copy of ``llm`` that also reports to ``handlers`` (``None`` entries are skipped)."""
+    callbacks = list(llm.callbacks or [])
+    new_handlers = [handler for handler in handlers if handler is not None and handler not in callbacks]
+    if not new_handlers:
+        return llm
+    return llm.model_copy(update={"callbacks": callbacks + new_handlers})
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, Generation
+
+
+class SQLiteCache(BaseCache):
+    """On-disk LLM response cache with LRU eviction and hit/miss counters.
+
+    LangChain passes the fully rendered messages as ``prompt`` and the model
+    name plus generation parameters as ``llm_string``, so both together form
+    the cache key. Only the response text and token usage are stored.
+    """
+
+    def __init__(self, path: str = ".cache/llm_responses.sqlite", max_entries: int = 100_000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                llm_string TEXT NOT NULL,
+                generations TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            row = self._conn.execute("SELECT generations FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+
+        generations = []
+        for item in json.loads(row[0]):
+            message = AIMessage(
+                content=item["text"],
+                usage_metadata=item.get("usage_metadata"),
+                response_metadata={"cache_hit": True},
+            )
+            generations.append(ChatGeneration(message=message, generation_info={"cache_hit": True}))
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        generations = json.dumps([_dump_generation(generation) for generation in return_val])
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            exists = self._conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, llm_string, generations, last_used) VALUES (?, ?, ?, ?)",
+                (key, llm_string, generations, time.time()),
+            )
+            if not exists:
+                self._size += 1
+            if self._size > self.max_entries:
+                # Drop the least recently used entries
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (self._size - self.max_entries,),
+                )
+                self._size = self.max_entries
+            self._conn.commit()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": self._size}
+
+
+def _dump_generation(generation: Generation) -> Dict[str, Any]:
+    message = getattr(generation, "message", None)
+    return {
+        "text": generation.text,
+        "usage_metadata": getattr(message, "usage_metadata", None),
+    }
+
+
+def with_cache(llm: Any, cache: Optional[BaseCache]) -> Any:
+    """Return a copy of ``llm`` that reads and writes ``cache``.
+
+    The copy shares the original client, so it reuses the same connection pool.
+    """
+    if cache is None:
+        return llm
+    return llm.model_copy(update={"cache": cache})
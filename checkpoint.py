@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import random
+import tempfile
+from typing import Any, Dict, List, Optional
+
+from budget import RunBudget
+from scoring import ScoreTable
+
+CHECKPOINT_VERSION = 1
+
+
+def run_fingerprint(instruction: str, test_cases: List[Dict[str, Any]]) -> str:
+    """Identify the starting point of a run, so a checkpoint is not resumed into a different one."""
+    payload = json.dumps({"instruction": instruction, "test_cases": test_cases}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def save_checkpoint(path: str, state: Dict[str, Any]) -> None:
+    """Write ``state`` as JSON, atomically.
+
+    The state goes to a temporary file in the same directory, which is
+    fsynced and then renamed over ``path``. A crash mid-write leaves the
+    previous checkpoint intact.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".checkpoint-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as tmp_file:
+            json.dump(state, tmp_file)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_checkpoint(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as checkpoint_file:
+        state = json.load(checkpoint_file)
+    if state.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version in {path}: {state.get('version')}")
+    return state
+
+
+def _rng_state(rng: Optional[random.Random]) -> List[Any]:
+    version, internal_state, gauss_next = (rng or random).getstate()
+    return [version, list(internal_state), gauss_next]
+
+
+def _set_rng_state(rng: Optional[random.Random], state: List[Any]) -> None:
+    version, internal_state, gauss_next = state
+    (rng or random).setstate((version, tuple(internal_state), gauss_next))
+
+
+def run_state(
+    iteration: int,
+    fingerprint: str,
+    instruction: str,
+    population: List[str],
+    test_cases: List[Dict[str, Any]],
+    score_table: ScoreTable,
+    rng: Optional[random.Random],
+    budget: Optional[RunBudget],
+    confirmed_instruction: Optional[str] = None,
+    confirmed_score: Optional[int] = None
+) -> Dict[str, Any]:
+    """Everything the improvement loop needs to continue after ``iteration`` completed iterations."""
+    return {
+        "version": CHECKPOINT_VERSION,
+        "iteration": iteration,
+        "fingerprint": fingerprint,
+        "instruction": instruction,
+        "population": population,
+        "confirmed_instruction": confirmed_instruction if confirmed_instruction is not None else instruction,
+        # The full-suite total of the confirmed instruction; suite scores themselves are not kept
+        "confirmed_score": confirmed_score,
+        "test_cases": test_cases,
+        "scores": score_table.items(),
+        # Improvement prompts list the keywords each case missed, so a resumed run needs them too
+        "keywords": score_table.keyword_items(),
+        "rng_state": _rng_state(rng),
+        "budget": budget.state() if budget is not None else None,
+        "planner": score_table.planner.state() if score_table.planner is not None else None,
+    }
+
+
+def restore_run_state(
+    state: Dict[str, Any],
+    fingerprint: str,
+    score_table: ScoreTable,
+    rng: Optional[random.Random],
+    budget: Optional[RunBudget]
+) -> tuple[int, str, List[str], List[Dict[str, Any]], tuple[str, Optional[int]]]:
+    """Load ``state`` into the score table (and its planner), rng and budget.
+
+    Returns ``(iteration, instruction, population, test_cases, (confirmed_instruction, confirmed_score))``.
+    """
+    if state["fingerprint"] != fingerprint:
+        raise ValueError("Checkpoint was written for a different initial instruction or test cases")
+    score_table.load(state["scores"])
+    score_table.load_keywords(state.get("keywords", []))
+    if score_table.planner is not None and state.get("planner") is not None:
+        score_table.planner.restore(state["planner"])
+    _set_rng_state(rng, state["rng_state"])
+    if budget is not None and state.get("budget") is not None:
+        budget.restore(state["budget"])
+    return state["iteration"], state["instruction"], state["population"], state["test_cases"], (state.get("confirmed_instruction", state["instruction"]), state.get("confirmed_score"))
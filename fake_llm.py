@@ -0,0 +1,185 @@
+import ast
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+
+class FakeLLMError(Exception):
+    """Injected provider error. Looks like an HTTP error with a status code."""
+
+    def __init__(self, message: str, status_code: int = 429):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def classify_role(messages: List[BaseMessage]) -> str:
+    """Guess which role a call plays: "target", "optimizer" or "adversary".
+
+    The main prompts in the config modules have no system message, while the
+    improvement prompts open with one that describes their job ("improving
+    instructions" or "creating a challenging test case").
+    """
+    if messages and isinstance(messages[0], SystemMessage):
+        system = str(messages[0].content).lower()
+        return "adversary" if "creat" in system and "test case" in system else "optimizer"
+    return "target"
+
+
+def _find_test_cases(text: str) -> List[Dict[str, Any]]:
+    # Packed test cases are "- [annotation] {json}" lines
+    test_cases = []
+    for line in text.splitlines():
+        start = line.find("] {") if line.startswith("- [") else -1
+        while start != -1:
+            try:
+                test_cases.append(json.loads(line[start + 2:]))
+                break
+            except ValueError:
+                start = line.find("] {", start + 1)
+    if test_cases:
+        return test_cases
+
+    # A prompt may also embed str(test_cases), which is a Python literal
+    start = text.find("[{")
+    end = text.rfind("}]")
+    while start != -1 and end > start:
+        try:
+            value = ast.literal_eval(text[start:end + 2])
+            if isinstance(value, list) and all(isinstance(item, dict) for item in value):
+                return value
+        except (ValueError, SyntaxError):
+            pass
+        end = text.rfind("}]", start, end)
+    return []
+
+
+def default_responder(role: str, text: str, rng: random.Random) -> str:
+    """Seeded stand-in responses that keep the improvement loop busy."""
+    words = text.split()
+    if role == "target":
+        # Echo a sample of the prompt, so keywords from the context sometimes show up
+        return " ".join(rng.choice(words) for _ in range(min(60, len(words)))) if words else ""
+
+    if role == "optimizer":
+        sentences = [sentence.strip() for sentence in text.replace("\n", " ").split(".") if sentence.strip()]
+        picked = rng.sample(sentences, min(4, len(sentences)))
+        return ". ".join(picked) + f". Answer precisely (revision {rng.randint(0, 9999)})."
+
+    test_cases = _find_test_cases(text)
+    if not test_cases:
+        return "I could not come up with a new test case."
+    # Asked for several test cases at once: answer with a list
+    count = re.search(r"create (\d+) different new test cases", text)
+    new_test_cases = [_variant(rng.choice(test_cases), rng) for _ in range(int(count.group(1)) if count else 1)]
+    return repr(new_test_cases) if count else repr(new_test_cases[0])
+
+
+def _variant(test_case: Dict[str, Any], rng: random.Random) -> Dict[str, Any]:
+    new_test_case = dict(test_case)
+    new_test_case["name"] = f"{new_test_case.get('name', 'Test case')} (variant {rng.randint(0, 9999)})"
+    keywords = list(new_test_case.get("expected", [])) + list(new_test_case.get("unexpected", []))
+    rng.shuffle(keywords)
+    half = len(keywords) // 2
+    new_test_case["expected"], new_test_case["unexpected"] = keywords[:half], keywords[half:]
+    return new_test_case
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic offline stand-in for ChatUpstage.
+
+    Responses come from ``responses`` (cycled, for scripted runs), from a
+    custom ``responder(role, text, rng)``, or from ``default_responder``.
+    The rng is seeded from ``seed``, the prompt and how many times that
+    prompt was seen, so output does not depend on call interleaving. Latency
+    (with jitter) is simulated with sleeps, and ``error_rate`` injects
+    ``FakeLLMError`` failures. Every call is recorded in ``records`` with its
+    loop phase (from the call's ``phase`` metadata), role, latency and
+    outcome.
+    """
+
+    model_name: str = "fake-model"
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    error_status_code: int = 429
+    seed: int = 0
+    responses: Optional[List[str]] = None
+    responder: Optional[Callable[[str, str, random.Random], str]] = None
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _seen: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _records: List[Dict[str, Any]] = PrivateAttr(default_factory=list)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "seed": self.seed}
+
+    @property
+    def records(self) -> List[Dict[str, Any]]:
+        return self._records
+
+    def _plan(self, messages: List[BaseMessage], run_manager: Any = None) -> Dict[str, Any]:
+        text = "\n".join(str(message.content) for message in messages)
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            attempt = self._seen.get(key, 0)
+            self._seen[key] = attempt + 1
+            index = len(self._records)
+            self._records.append({})
+
+        rng = random.Random(f"{self.seed}:{key}:{attempt}")
+        delay = max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+        role = classify_role(messages)
+        phase = (run_manager.metadata.get("phase") if run_manager is not None else None) or role
+        return {"text": text, "role": role, "phase": phase, "rng": rng, "delay": delay, "index": index}
+
+    def _respond(self, plan: Dict[str, Any], started: float) -> ChatResult:
+        rng = plan["rng"]
+        failed = rng.random() < self.error_rate
+        self._records[plan["index"]] = {
+            "phase": plan["phase"],
+            "role": plan["role"],
+            "latency": time.perf_counter() - started,
+            "error": failed,
+        }
+        if failed:
+            raise FakeLLMError(f"Injected error {self.error_status_code}", self.error_status_code)
+
+        if self.responses:
+            content = self.responses[plan["index"] % len(self.responses)]
+        else:
+            content = (self.responder or default_responder)(plan["role"], plan["text"], rng)
+
+        input_tokens = len(plan["text"].split())
+        output_tokens = len(content.split())
+        message = AIMessage(
+            content=content,
+            usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        started = time.perf_counter()
+        plan = self._plan(messages, run_manager)
+        time.sleep(plan["delay"])
+        return self._respond(plan, started)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        started = time.perf_counter()
+        plan = self._plan(messages, run_manager)
+        await asyncio.sleep(plan["delay"])
+        return self._respond(plan, started)
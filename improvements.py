@@ -1,111 +1,895 @@
-from typing import List, Dict, Any
+from typing import Any, Callable, Dict, Generator, List, NamedTuple, Optional, TextIO, Tuple
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.caches import BaseCache
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from cache import with_cache
+from acceptance import SequentialAcceptance
+from budget import RunBudget, with_callbacks
+from checkpoint import load_checkpoint, restore_run_state, run_fingerprint, run_state, save_checkpoint
+from instrumentation import Instrumentation
+from jobs import QueuedChatModel
+from limits import LimitedChatModel
+from run_log import RunLog
+from parsing import MULTI_REPAIR_REQUEST, MULTI_TEST_CASE_REQUEST, REPAIR_REQUEST, TestCaseError, parse_test_case, parse_test_cases, required_test_case_keys
+from suites import JsonlSuite
+from packing import estimate_tokens, pack_test_cases
+from scoring import ResponseScore, ScoreBounds, ScoreTable, evaluate_response, normalize_instruction
+from concurrent.futures import as_completed
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+import asyncio
 import random
+import time
 
-def run_tests(instruction: str, test_cases: List[Dict[str, Any]], llm: Any, main_prompt: ChatPromptTemplate) -> int:
-    chain = main_prompt | llm | StrOutputParser()
-    print(f"\nRunning tests with {llm.model_name}")
-    total_score = 0
+# How much the loop prints: 0 for iteration progress only, 1 adds scores and
+# decisions, 2 adds every test result including the full model response
+VERBOSITY = 2
+
+def set_verbosity(level: int) -> None:
+    global VERBOSITY
+    VERBOSITY = level
+
+def _say(level: int, message: str) -> None:
+    if VERBOSITY >= level:
+        print(message)
+
+class ImprovementSettings(NamedTuple):
+    """Options of an improvement run, passed by keyword; the defaults give a plain sequential run.
+
+    ``optimizer_llm`` and ``adversary_llm`` default to the model under test.
+    """
+    max_iterations: int = 100
+    log_file_path: str = "adversarial_improvement_log.txt"
+    max_concurrency: int = 1
+    cache: Optional[BaseCache] = None
+    score_table: Optional[ScoreTable] = None
+    rng: Optional[random.Random] = None
+    num_candidates: int = 1
+    population_size: int = 1
+    bounded: bool = False
+    budget: Optional[RunBudget] = None
+    instrumentation: Optional[Instrumentation] = None
+    checkpoint_path: Optional[str] = None
+    resume: bool = False
+    run_log: Optional[RunLog] = None
+    num_test_candidates: int = 1
+    max_repairs: int = 1
+    suite: Optional[JsonlSuite] = None
+    minibatch_size: int = 0
+    confirm_every: int = 0
+    suite_seed: Any = 0
+    acceptance: Optional[SequentialAcceptance] = None
+    test_case_tokens: Optional[int] = None
+    optimizer_llm: Any = None
+    adversary_llm: Any = None
+
+# A step that calls the model is written once, as a generator that yields the
+# work it needs as (function, async function, args, kwargs) and is sent back
+# the result. _drive runs the work in the calling thread and _adrive awaits it,
+# so the sync and async loops share every step and only schedule them differently.
+_Step = Generator[Tuple[Callable[..., Any], Callable[..., Any], tuple, Dict[str, Any]], Any, Any]
+
+def _drive(step: _Step) -> Any:
+    result = None
+    while True:
+        try:
+            function, _, args, kwargs = step.send(result)
+        except StopIteration as done:
+            return done.value
+        result = function(*args, **kwargs)
+
+async def _adrive(step: _Step) -> Any:
+    result = None
+    while True:
+        try:
+            _, afunction, args, kwargs = step.send(result)
+        except StopIteration as done:
+            return done.value
+        result = await afunction(*args, **kwargs)
+
+def _pending_prompt_inputs(instruction: str, test_cases: List[Dict[str, Any]], main_prompt: ChatPromptTemplate, score_table: Optional[ScoreTable], plan: bool = True) -> Tuple[List[Optional[int]], List[int], List[Dict[str, Any]]]:
+    # Reuse scores of (instruction, test case) pairs that were already evaluated
+    known_scores = [score_table.get(instruction, test_case) if score_table is not None else None for test_case in test_cases]
+    if plan and score_table is not None and score_table.planner is not None:
+        # Saturated test cases are only re-checked now and then
+        known_scores = [score_table.plan(instruction, test_case, score) for score, test_case in zip(known_scores, test_cases)]
+    pending = [i for i, score in enumerate(known_scores) if score is None]
 
-    for i, test_case in enumerate(test_cases, 1):
-        print(f"\nRunning test {i}: {test_case['name']}")
-        
-        # Prepare input variables dynamically based on the prompt's expected input
-        input_variables = main_prompt.input_variables
+    # Prepare input variables dynamically based on the prompt's expected input
+    input_variables = main_prompt.input_variables
+    all_prompt_inputs = []
+    for i in pending:
         prompt_inputs = {
-            var: test_case.get(var, "") for var in input_variables
+            var: test_cases[i].get(var, "") for var in input_variables
         }
-        
+
         # Ensure 'instruction' is always present
         prompt_inputs["instruction"] = instruction
-        
-        
-        result = chain.invoke(prompt_inputs)
-        print(f"Result: {result}")
+        all_prompt_inputs.append(prompt_inputs)
+
+    return known_scores, pending, all_prompt_inputs
+
+def _total_score(instruction: str, test_cases: List[Dict[str, Any]], known_scores: List[Optional[int]], results: Dict[int, Tuple[str, ResponseScore]], score_table: Optional[ScoreTable], stopped_at: Optional[int] = None, plan: bool = True) -> int:
+    total_score = 0
+
+    for i, test_case in enumerate(test_cases):
+        if i not in results and known_scores[i] is None:
+            # Skipped by bounded evaluation
+            continue
 
-        expected_found = sum(1 for expected in test_case["expected"] if expected.lower() in result.lower())
-        unexpected_found = sum(1 for unexpected in test_case["unexpected"] if unexpected.lower() in result.lower())
+        _say(2, f"\nRunning test {i + 1}: {test_case['name']}")
+        if i not in results:
+            test_score = known_scores[i]
+            total_score += test_score
+            _say(2, f"Test score: {test_score} (already evaluated)")
+            continue
 
-        test_score = expected_found - unexpected_found
-        total_score += test_score
+        result, scored = results[i]
+        _say(2, f"Result: {result}")
 
-        print(f"Expected items found: {expected_found}/{len(test_case['expected'])}")
-        print(f"Unexpected items found: {unexpected_found}/{len(test_case['unexpected'])}")
-        print(f"Test score: {test_score}")
+        total_score += scored.score
+        if score_table is not None:
+            score_table.set(instruction, test_case, scored.score, observed=plan)
+            score_table.set_keywords(instruction, test_case, scored.missed, scored.found)
 
-    print(f"\nTotal score: {total_score}")
+        _say(2, f"Expected items found: {scored.expected_found}/{len(test_case['expected'])}")
+        _say(2, f"Unexpected items found: {scored.unexpected_found}/{len(test_case['unexpected'])}")
+        _say(2, f"Test score: {scored.score}")
+
+    if stopped_at is not None:
+        _say(1, f"\nStopped early: total score is bounded by {stopped_at}")
+        return stopped_at
+
+    _say(1, f"\nTotal score: {total_score}")
     return total_score
 
-def improve_instruction(instruction: str, test_cases: List[Dict[str, Any]], llm: Any, main_prompt: ChatPromptTemplate, improvement_prompt: ChatPromptTemplate) -> str:
-    initial_score = run_tests(instruction, test_cases, llm, main_prompt)
-    print(f"\nInitial Results:")
-    print(f"Total score: {initial_score}")
+def _pending_prompt_inputs_many(instructions: List[str], test_cases: List[Dict[str, Any]], main_prompt: ChatPromptTemplate, score_table: Optional[ScoreTable], plan: bool = True) -> Tuple[List[Tuple[List[Optional[int]], List[int], List[Dict[str, Any]]]], List[Tuple[int, int, Dict[str, Any]]]]:
+    plans = [_pending_prompt_inputs(instruction, test_cases, main_prompt, score_table, plan) for instruction in instructions]
+    # One job per (instruction index, test case index) cell that still needs a model call
+    jobs = [(k, i, prompt_inputs) for k, (_, pending, inputs) in enumerate(plans) for i, prompt_inputs in zip(pending, inputs)]
+    return plans, jobs
+
+def _scored_results(test_cases: List[Dict[str, Any]], jobs: List[Tuple[int, int, Dict[str, Any]]], outputs: List[str]) -> Dict[Tuple[int, int], Tuple[str, ResponseScore]]:
+    # Each response is scored once; the total, the packed prompts and the response store all reuse it
+    return {(k, i): (output, evaluate_response(output, test_cases[i])) for (k, i, _), output in zip(jobs, outputs)}
+
+def _record_responses(score_table: Optional[ScoreTable], main_prompt: ChatPromptTemplate, instructions: List[str], test_cases: List[Dict[str, Any]], plans: List[Tuple[List[Optional[int]], List[int], List[Dict[str, Any]]]], results: Dict[Tuple[int, int], Tuple[str, ResponseScore]], phase: str) -> None:
+    if score_table is None or score_table.responses is None:
+        return
+    # Rendered again from the same inputs, so the stored prompt is exactly what the model got
+    inputs = [dict(zip(pending, prompt_inputs)) for _, pending, prompt_inputs in plans]
+    rows = [(instructions[k], test_cases[i], main_prompt.format_messages(**inputs[k][i]), result, scored.score) for (k, i), (result, scored) in results.items()]
+    score_table.responses.record(phase, rows)
+
+def _total_scores(instructions: List[str], test_cases: List[Dict[str, Any]], plans: List[Tuple[List[Optional[int]], List[int], List[Dict[str, Any]]]], results: Dict[Tuple[int, int], Tuple[str, ResponseScore]], score_table: Optional[ScoreTable], bounds: Optional[ScoreBounds] = None, stopped: Optional[set] = None, plan: bool = True) -> List[int]:
+    total_scores = []
+    for k, (instruction, (known_scores, _, _)) in enumerate(zip(instructions, plans)):
+        instruction_results = {i: result for (owner, i), result in results.items() if owner == k}
+        stopped_at = bounds.bound(k) if stopped and k in stopped else None
+        total_scores.append(_total_score(instruction, test_cases, known_scores, instruction_results, score_table, stopped_at, plan))
+    return total_scores
+
+def _make_bounds(test_cases: List[Dict[str, Any]], plans: List[Tuple[List[Optional[int]], List[int], List[Dict[str, Any]]]], must_exceed: Optional[int], must_fall_below: Optional[int]) -> Tuple[Optional[ScoreBounds], set]:
+    if must_exceed is None and must_fall_below is None:
+        return None, set()
+    bounds = ScoreBounds(test_cases, [known_scores for known_scores, _, _ in plans], must_exceed, must_fall_below)
+    return bounds, {k for k in range(len(plans)) if bounds.hopeless(k)}
+
+def _record_bounded_result(test_cases: List[Dict[str, Any]], bounds: ScoreBounds, stopped: set, results: Dict[Tuple[int, int], Tuple[str, ResponseScore]], k: int, i: int, result: str) -> bool:
+    """Score and record one result and return True if instruction ``k`` just became hopeless."""
+    scored = evaluate_response(result, test_cases[i])
+    results[(k, i)] = (result, scored)
+    bounds.add(k, i, scored.score)
+    if bounds.hopeless(k):
+        stopped.add(k)
+        return True
+    return False
+
+class _TestRun:
+    """Everything run_tests_many does besides scheduling the model calls."""
+
+    def __init__(self, instructions: List[str], test_cases: List[Dict[str, Any]], llm: Any, main_prompt: ChatPromptTemplate, cache: Optional[BaseCache], score_table: Optional[ScoreTable], must_exceed: Optional[int], must_fall_below: Optional[int], phase: str, plan: bool):
+        # Only the scoring chain is cached: improvement prompts must keep producing fresh candidates
+        self.chain = main_prompt | with_cache(llm, cache) | StrOutputParser()
+        _say(2, f"\nRunning tests with {llm.model_name}")
+
+        self.instructions, self.test_cases, self.main_prompt = instructions, test_cases, main_prompt
+        self.score_table, self.phase, self.plan = score_table, phase, plan
+        self.plans, self.jobs = _pending_prompt_inputs_many(instructions, test_cases, main_prompt, score_table, plan)
+        self.bounds, self.stopped = _make_bounds(test_cases, self.plans, must_exceed, must_fall_below)
+        # The phase tag lets callbacks attribute calls to a step of the loop
+        self.config = {"metadata": {"phase": phase}}
+        self.results: Dict[Tuple[int, int], Tuple[str, ResponseScore]] = {}
+
+    def batch_inputs(self) -> List[Dict[str, Any]]:
+        return [prompt_inputs for _, _, prompt_inputs in self.jobs]
+
+    def batch_config(self, max_concurrency: int) -> Dict[str, Any]:
+        return {**self.config, "max_concurrency": max(1, max_concurrency)}
+
+    def open_jobs(self) -> List[Tuple[int, int, Dict[str, Any]]]:
+        return [(k, i, prompt_inputs) for k, i, prompt_inputs in self.jobs if k not in self.stopped]
+
+    def record(self, k: int, i: int, result: str) -> bool:
+        """Score one bounded result and return True if instruction ``k`` just became hopeless."""
+        return _record_bounded_result(self.test_cases, self.bounds, self.stopped, self.results, k, i, result)
+
+    def scores(self, outputs: Optional[List[str]] = None) -> List[int]:
+        """The total of every instruction, from the batch ``outputs`` or the recorded bounded results."""
+        if outputs is not None:
+            self.results = _scored_results(self.test_cases, self.jobs, outputs)
+        _record_responses(self.score_table, self.main_prompt, self.instructions, self.test_cases, self.plans, self.results, self.phase)
+        return _total_scores(self.instructions, self.test_cases, self.plans, self.results, self.score_table, self.bounds, self.stopped, self.plan)
+
+def run_tests_many(instructions: List[str], test_cases: List[Dict[str, Any]], llm: Any, main_prompt: ChatPromptTemplate, max_concurrency: int = 1, cache: Optional[BaseCache] = None, score_table: Optional[ScoreTable] = None, must_exceed: Optional[int] = None, must_fall_below: Optional[int] = None, phase: str = "baseline", plan: bool = True) -> List[int]:
+    """Score several instructions with a single batch, sharing one concurrency limit.
+
+    With ``must_exceed`` or ``must_fall_below`` set, an instruction stops being
+    evaluated as soon as its total provably cannot get past that score, and the
+    proving bound is returned in place of its total. With ``plan`` (and a
+    score table with a planner), saturated test cases are mostly skipped.
+    """
+    run = _TestRun(instructions, test_cases, llm, main_prompt, cache, score_table, must_exceed, must_fall_below, phase, plan)
+    if run.bounds is None:
+        # batch() keeps results in test case order, so scores stay deterministic
+        return run.scores(run.chain.batch(run.batch_inputs(), config=run.batch_config(max_concurrency)))
+
+    with ContextThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        futures = {executor.submit(run.chain.invoke, prompt_inputs, run.config): (k, i) for k, i, prompt_inputs in run.open_jobs()}
+        try:
+            for future in as_completed(futures):
+                k, i = futures[future]
+                if future.cancelled() or k in run.stopped:
+                    continue
+                if run.record(k, i, future.result()):
+                    # Calls that already started cannot be interrupted; the rest are dropped
+                    for other, (owner, _) in futures.items():
+                        if owner == k:
+                            other.cancel()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return run.scores()
+
+async def arun_tests_many(instructions: List[str], test_cases: List[Dict[str, Any]], llm: Any, main_prompt: ChatPromptTemplate, max_concurrency: int = 1, cache: Optional[BaseCache] = None, score_table: Optional[ScoreTable] = None, must_exceed: Optional[int] = None, must_fall_below: Optional[int] = None, phase: str = "baseline", plan: bool = True) -> List[int]:
+    run = _TestRun(instructions, test_cases, llm, main_prompt, cache, score_table, must_exceed, must_fall_below, phase, plan)
+    if run.bounds is None:
+        return run.scores(await run.chain.abatch(run.batch_inputs(), config=run.batch_config(max_concurrency)))
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def evaluate(prompt_inputs: Dict[str, Any]) -> str:
+        async with semaphore:
+            return await run.chain.ainvoke(prompt_inputs, run.config)
+
+    tasks = {asyncio.create_task(evaluate(prompt_inputs)): (k, i) for k, i, prompt_inputs in run.open_jobs()}
+    waiting = set(tasks)
+    try:
+        while waiting:
+            done, waiting = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                k, i = tasks[task]
+                if task.cancelled() or k in run.stopped:
+                    continue
+                if run.record(k, i, task.result()):
+                    # Cancel this instruction's queued and in-flight calls
+                    for other in waiting:
+                        if tasks[other][0] == k:
+                            other.cancel()
+    finally:
+        for task in waiting:
+            task.cancel()
+    return run.scores()
 
-    print(f"\nImprovement attempt:")
+def run_tests(instruction: str, test_cases: List[Dict[str, Any]], llm: Any, main_prompt: ChatPromptTemplate, max_concurrency: int = 1, cache: Optional[BaseCache] = None, score_table: Optional[ScoreTable] = None, must_exceed: Optional[int] = None, must_fall_below: Optional[int] = None, phase: str = "baseline", plan: bool = True) -> int:
+    return run_tests_many([instruction], test_cases, llm, main_prompt, max_concurrency, cache, score_table, must_exceed, must_fall_below, phase, plan)[0]
 
-    improvement_chain = improvement_prompt | llm | StrOutputParser()
+async def arun_tests(instruction: str, test_cases: List[Dict[str, Any]], llm: Any, main_prompt: ChatPromptTemplate, max_concurrency: int = 1, cache: Optional[BaseCache] = None, score_table: Optional[ScoreTable] = None, must_exceed: Optional[int] = None, must_fall_below: Optional[int] = None, phase: str = "baseline", plan: bool = True) -> int:
+    return (await arun_tests_many([instruction], test_cases, llm, main_prompt, max_concurrency, cache, score_table, must_exceed, must_fall_below, phase, plan))[0]
 
-    test_cases_str = "\n".join([f"- {case['name']}: {str(case)[:100]}..." for case in test_cases])
+def _tests(settings: ImprovementSettings, instructions: List[str], test_cases: List[Dict[str, Any]], llm: Any, main_prompt: ChatPromptTemplate, **options: Any) -> Tuple[Callable[..., Any], Callable[..., Any], tuple, Dict[str, Any]]:
+    # _Step work: run_tests_many with the run's concurrency, cache and score table unless ``options`` override them
+    options = {"max_concurrency": settings.max_concurrency, "cache": settings.cache, "score_table": settings.score_table, **options}
+    return run_tests_many, arun_tests_many, (instructions, test_cases, llm, main_prompt), options
 
-    improved_instruction = improvement_chain.invoke({
+def _chain_call(chain: Any, method: str, *args: Any, **kwargs: Any) -> Tuple[Callable[..., Any], Callable[..., Any], tuple, Dict[str, Any]]:
+    # _Step work: chain.invoke or chain.batch, or their async twins when awaited
+    return getattr(chain, method), getattr(chain, f"a{method}"), args, kwargs
+
+async def aevaluate_models(instruction: str, test_cases: List[Dict[str, Any]], llms: Dict[str, Any], main_prompt: ChatPromptTemplate, max_concurrency: int = 1, cache: Optional[BaseCache] = None) -> Dict[str, int]:
+    """Score ``instruction`` with every model in ``llms`` (by name) concurrently."""
+    # No score table: it is keyed by instruction and test case, not by model
+    scores = await asyncio.gather(*(arun_tests(instruction, test_cases, llm, main_prompt, max_concurrency, cache, phase="final") for llm in llms.values()))
+    return dict(zip(llms, scores))
+
+def _packed_test_cases(instruction: str, test_cases: List[Dict[str, Any]], score_table: Optional[ScoreTable], max_tokens: Optional[int], role: str) -> str:
+    # Failing cases and their missed keywords first, cut to the token budget
+    text, included = pack_test_cases(instruction, test_cases, score_table, max_tokens)
+    _say(1, f"{role} prompt: {included}/{len(test_cases)} test cases in ~{estimate_tokens(text)} tokens")
+    return text
+
+def instruction_improvement_inputs(instruction: str, test_cases: List[Dict[str, Any]], initial_score: int, main_prompt: ChatPromptTemplate, score_table: Optional[ScoreTable] = None, test_case_tokens: Optional[int] = None) -> Dict[str, Any]:
+    """Inputs of INSTRUCTION_IMPROVEMENT_PROMPT for ``instruction`` and its score on ``test_cases``."""
+    test_cases_str = _packed_test_cases(instruction, test_cases, score_table, test_case_tokens, "Optimizer")
+
+    return {
         "current_instruction": instruction,
         "test_cases": test_cases_str,
         "total_score": initial_score,
         "prompt_variables": ", ".join(main_prompt.input_variables)
-    })
+    }
 
-    new_score = run_tests(improved_instruction, test_cases, llm, main_prompt)
-    print(f"Improved Results:")
-    print(f"Total score: {new_score}")
+def _select_instruction(instruction: str, improved_instruction: str, initial_score: int, new_score: int) -> str:
+    _say(1, f"Improved Results:")
+    _say(1, f"Total score: {new_score}")
 
     if new_score > initial_score:
-        print(f"Improvement successful! Score increased by {new_score - initial_score}")
+        _say(1, f"Improvement successful! Score increased by {new_score - initial_score}")
         return improved_instruction
     else:
-        print(f"No improvement achieved. Returning original instruction.")
+        _say(1, f"No improvement achieved. Returning original instruction.")
         return instruction
 
-def improve_test_cases(test_cases: List[Dict[str, Any]], prompt: ChatPromptTemplate, llm: Any, test_case_improvement_prompt: ChatPromptTemplate) -> List[Dict[str, Any]]:
-    print("\nImproving test cases:")
-    
-    # Extract the instruction from the prompt
-    instruction = prompt.messages[0].prompt.template if hasattr(prompt.messages[0], 'prompt') else str(prompt.messages[0])
-    
-    # Create a dummy input that satisfies the prompt's input variables
-    dummy_input = {var: "dummy_value" for var in prompt.input_variables}
-    dummy_input['instruction'] = instruction  # Ensure 'instruction' is always present
-    
-    current_score = run_tests(instruction, test_cases, llm, prompt)
-
-    improvement_chain = test_case_improvement_prompt | llm | StrOutputParser()
-
-    new_test_case_str = improvement_chain.invoke({
+def _record_decision(score_table: Optional[ScoreTable], step: str, options: List[Tuple[str, List[Dict[str, Any]]]], chosen: List[int], keep: int = 1, lowest: bool = False) -> None:
+    if score_table is not None and score_table.responses is not None:
+        score_table.responses.decision(step, options, chosen, keep, lowest)
+
+def _instruction_step(instruction: str, test_cases: List[Dict[str, Any]], llm: Any, main_prompt: ChatPromptTemplate, improvement_prompt: ChatPromptTemplate, settings: ImprovementSettings) -> _Step:
+    initial_score = (yield _tests(settings, [instruction], test_cases, llm, main_prompt))[0]
+    _say(1, f"\nInitial Results:")
+    _say(1, f"Total score: {initial_score}")
+
+    _say(1, f"\nImprovement attempt:")
+
+    # The optimizer may be a different (e.g. cheaper) model than the one under test
+    improvement_chain = improvement_prompt | (settings.optimizer_llm or llm) | StrOutputParser()
+
+    improved_instruction = yield _chain_call(
+        improvement_chain, "invoke",
+        instruction_improvement_inputs(instruction, test_cases, initial_score, main_prompt, settings.score_table, settings.test_case_tokens),
+        config={"metadata": {"phase": "optimizer"}}
+    )
+
+    if normalize_instruction(improved_instruction) == normalize_instruction(instruction):
+        _say(1, f"Candidate is the same as the current instruction. Returning original instruction.")
+        return instruction
+
+    # A candidate only matters if it beats the current score
+    new_score = (yield _tests(settings, [improved_instruction], test_cases, llm, main_prompt, must_exceed=initial_score if settings.bounded else None, phase="candidate"))[0]
+    selected = _select_instruction(instruction, improved_instruction, initial_score, new_score)
+    _record_decision(settings.score_table, "instruction", [(instruction, test_cases), (improved_instruction, test_cases)], [int(selected is improved_instruction)])
+    return selected
+
+def improve_instruction(instruction: str, test_cases: List[Dict[str, Any]], llm: Any, main_prompt: ChatPromptTemplate, improvement_prompt: ChatPromptTemplate, settings: ImprovementSettings = ImprovementSettings()) -> str:
+    return _drive(_instruction_step(instruction, test_cases, llm, main_prompt, improvement_prompt, settings))
+
+async def aimprove_instruction(instruction: str, test_cases: List[Dict[str, Any]], llm: Any, main_prompt: ChatPromptTemplate, improvement_prompt: ChatPromptTemplate, settings: ImprovementSettings = ImprovementSettings()) -> str:
+    return await _adrive(_instruction_step(instruction, test_cases, llm, main_prompt, improvement_prompt, settings))
+
+def _new_candidates(population: List[str], candidates: List[str]) -> List[str]:
+    # Drop candidates that normalize to an instruction we already have
+    seen = {normalize_instruction(instruction) for instruction in population}
+    new_candidates = []
+    for candidate in candidates:
+        normalized = normalize_instruction(candidate)
+        if normalized not in seen:
+            seen.add(normalized)
+            new_candidates.append(candidate)
+    return new_candidates
+
+def _population_threshold(scores: List[int], population_size: int) -> Optional[int]:
+    # A candidate has to beat the weakest member that would otherwise be kept
+    if len(scores) < population_size:
+        return None
+    return sorted(scores, reverse=True)[population_size - 1]
+
+def _select_population(population: List[str], scores: List[int], candidates: List[str], candidate_scores: List[int], population_size: int) -> List[str]:
+    # Stable sort keeps current members ahead of candidates with the same score
+    ranked = sorted(zip(population + candidates, scores + candidate_scores), key=lambda item: -item[1])[:population_size]
+
+    _say(1, f"Population scores: {[score for _, score in ranked]}")
+    if ranked[0][0] != population[0]:
+        _say(1, f"Improvement successful! Best score increased by {ranked[0][1] - scores[0]}")
+    else:
+        _say(1, f"No improvement on the best instruction.")
+    return [instruction for instruction, _ in ranked]
+
+def _record_population_decision(score_table: Optional[ScoreTable], population: List[str], candidates: List[str], test_cases: List[Dict[str, Any]], selected: List[str], population_size: int) -> None:
+    options = population + candidates
+    _record_decision(score_table, "instruction", [(instruction, test_cases) for instruction in options], [options.index(instruction) for instruction in selected], keep=population_size)
+
+def _population_step(population: List[str], test_cases: List[Dict[str, Any]], llm: Any, main_prompt: ChatPromptTemplate, improvement_prompt: ChatPromptTemplate, settings: ImprovementSettings) -> _Step:
+    num_candidates, population_size = settings.num_candidates, settings.population_size
+    scores = yield _tests(settings, population, test_cases, llm, main_prompt)
+    _say(1, f"\nInitial Results:")
+    _say(1, f"Population scores: {scores}")
+
+    _say(1, f"\nImprovement attempt with {num_candidates} candidates:")
+
+    # The optimizer may be a different (e.g. cheaper) model than the one under test
+    improvement_chain = improvement_prompt | (settings.optimizer_llm or llm) | StrOutputParser()
+
+    parents = [i % len(population) for i in range(num_candidates)]
+    candidates = yield _chain_call(
+        improvement_chain, "batch",
+        [instruction_improvement_inputs(population[i], test_cases, scores[i], main_prompt, settings.score_table, settings.test_case_tokens) for i in parents],
+        config={"max_concurrency": max(1, settings.max_concurrency), "metadata": {"phase": "optimizer"}}
+    )
+    candidates = _new_candidates(population, candidates)
+
+    candidate_scores = yield _tests(settings, candidates, test_cases, llm, main_prompt, must_exceed=_population_threshold(scores, population_size) if settings.bounded else None, phase="candidate")
+    selected = _select_population(population, scores, candidates, candidate_scores, population_size)
+    _record_population_decision(settings.score_table, population, candidates, test_cases, selected, population_size)
+    return selected
+
+def improve_instruction_population(population: List[str], test_cases: List[Dict[str, Any]], llm: Any, main_prompt: ChatPromptTemplate, improvement_prompt: ChatPromptTemplate, settings: ImprovementSettings = ImprovementSettings(num_candidates=4, population_size=2)) -> List[str]:
+    """Population-based version of improve_instruction.
+
+    Asks for ``settings.num_candidates`` rewrites (round-robin over the current
+    population, best first), scores them all in one concurrent batch and
+    returns the best ``settings.population_size`` instructions, best first.
+    """
+    return _drive(_population_step(population, test_cases, llm, main_prompt, improvement_prompt, settings))
+
+async def aimprove_instruction_population(population: List[str], test_cases: List[Dict[str, Any]], llm: Any, main_prompt: ChatPromptTemplate, improvement_prompt: ChatPromptTemplate, settings: ImprovementSettings = ImprovementSettings(num_candidates=4, population_size=2)) -> List[str]:
+    return await _adrive(_population_step(population, test_cases, llm, main_prompt, improvement_prompt, settings))
+
+def prompt_instruction(prompt: ChatPromptTemplate) -> str:
+    """The text of the prompt's first message, the default instruction of ``improve_test_cases``."""
+    return prompt.messages[0].prompt.template if hasattr(prompt.messages[0], 'prompt') else str(prompt.messages[0])
+
+def test_case_improvement_inputs(instruction: str, test_cases: List[Dict[str, Any]], current_score: int, prompt: ChatPromptTemplate, score_table: Optional[ScoreTable] = None, test_case_tokens: Optional[int] = None) -> Dict[str, Any]:
+    """Inputs of TEST_CASE_IMPROVEMENT_PROMPT for the current test cases and their score."""
+    return {
         "prompt": instruction,
-        "test_cases": str(test_cases),
+        "test_cases": _packed_test_cases(instruction, test_cases, score_table, test_case_tokens, "Adversary"),
         "current_score": current_score,
         "prompt_variables": ", ".join(prompt.input_variables)
-    })
+    }
+
+def _test_case_messages(test_case_improvement_prompt: ChatPromptTemplate, inputs: Dict[str, Any], count: int) -> List[BaseMessage]:
+    messages = test_case_improvement_prompt.format_messages(**inputs)
+    if count > 1:
+        messages.append(HumanMessage(content=MULTI_TEST_CASE_REQUEST.format(count=count)))
+    return messages
+
+def _repair_messages(test_case_improvement_prompt: ChatPromptTemplate, inputs: Dict[str, Any], count: int, reply: str, error: TestCaseError, required_keys: List[str]) -> List[BaseMessage]:
+    # Continue the same conversation, so the model sees its own reply and what was wrong with it
+    request = REPAIR_REQUEST if count == 1 else MULTI_REPAIR_REQUEST
+    return [
+        *_test_case_messages(test_case_improvement_prompt, inputs, count),
+        AIMessage(content=reply),
+        HumanMessage(content=request.format(error=error, keys=", ".join(required_keys))),
+    ]
 
+def _parse_generated_test_cases(reply: str, required_keys: List[str], count: int, attempt: int, max_repairs: int) -> Tuple[List[Dict[str, Any]], Optional[TestCaseError]]:
     try:
-        new_test_case = eval(new_test_case_str)
-    except:
-        print("Error parsing new test case. Returning original test cases.")
-        return test_cases
+        if count == 1:
+            return [parse_test_case(reply, required_keys)], None
+        return parse_test_cases(reply, required_keys)[:count], None
+    except TestCaseError as e:
+        if attempt < max_repairs:
+            _say(1, f"Generated test case is unusable ({e}). Asking for a correction.")
+        else:
+            _say(1, f"Generated test case is unusable ({e}). Returning original test cases.")
+        return [], e
+
+def _generation_step(llm: Any, test_case_improvement_prompt: ChatPromptTemplate, inputs: Dict[str, Any], required_keys: List[str], count: int, max_repairs: int) -> _Step:
+    generation_chain = llm | StrOutputParser()
+    reply = yield _chain_call(generation_chain, "invoke", _test_case_messages(test_case_improvement_prompt, inputs, count), config={"metadata": {"phase": "adversary"}})
+    for attempt in range(max_repairs + 1):
+        new_test_cases, error = _parse_generated_test_cases(reply, required_keys, count, attempt, max_repairs)
+        if error is None or attempt == max_repairs:
+            return new_test_cases
+        reply = yield _chain_call(generation_chain, "invoke", _repair_messages(test_case_improvement_prompt, inputs, count, reply, error, required_keys), config={"metadata": {"phase": "repair"}})
 
-    replace_index = random.randint(0, len(test_cases) - 1)
+def _replace_test_case(test_cases: List[Dict[str, Any]], new_test_case: Dict[str, Any], rng: Any) -> Tuple[int, List[Dict[str, Any]]]:
+    replace_index = rng.randint(0, len(test_cases) - 1)
     new_test_cases = test_cases.copy()
     new_test_cases[replace_index] = new_test_case
+    return replace_index, new_test_cases
 
-    new_score = run_tests(instruction, new_test_cases, llm, prompt)
+def _replace_easiest_test_case(instruction: str, test_cases: List[Dict[str, Any]], candidates: List[Dict[str, Any]], score_table: ScoreTable, rng: Any) -> Tuple[int, List[Dict[str, Any]]]:
+    # Swapping the highest-scoring case for the lowest-scoring candidate lowers the total the most
+    case_scores = [score_table.peek(instruction, test_case) for test_case in test_cases]
+    candidate_scores = [score_table.peek(instruction, candidate) for candidate in candidates]
+    best = min(range(len(candidates)), key=lambda k: candidate_scores[k])
+    easiest = max(case_scores)
+    replace_index = rng.choice([i for i, score in enumerate(case_scores) if score == easiest])
+    _say(1, f"Candidate scores: {candidate_scores}. Trying candidate {best + 1} in place of test case {replace_index + 1} (score {easiest})")
 
+    new_test_cases = test_cases.copy()
+    new_test_cases[replace_index] = candidates[best]
+    return replace_index, new_test_cases
+
+def _select_test_cases(test_cases: List[Dict[str, Any]], new_test_cases: List[Dict[str, Any]], replace_index: int, current_score: int, new_score: int) -> List[Dict[str, Any]]:
     if new_score < current_score:
-        print(f"Improvement successful! Score decreased from {current_score} to {new_score}")
-        print(f"Replaced test case at index {replace_index}")
+        _say(1, f"Improvement successful! Score decreased from {current_score} to {new_score}")
+        _say(1, f"Replaced test case at index {replace_index}")
         return new_test_cases
     else:
-        print(f"No improvement achieved. Keeping original test cases")
+        _say(1, f"No improvement achieved. Keeping original test cases")
+        return test_cases
+
+def _test_case_step(instruction: str, test_cases: List[Dict[str, Any]], prompt: ChatPromptTemplate, llm: Any, test_case_improvement_prompt: ChatPromptTemplate, settings: ImprovementSettings) -> _Step:
+    _say(1, "\nImproving test cases:")
+    rng = settings.rng or random
+    num_candidates = settings.num_test_candidates
+    if settings.score_table is None and num_candidates > 1:
+        # Candidates are compared through their per-case scores
+        settings = settings._replace(score_table=ScoreTable())
+    score_table = settings.score_table
+
+    # Not fed to the test selection planner, which only follows the instruction step
+    current_score = (yield _tests(settings, [instruction], test_cases, llm, prompt, plan=False))[0]
+
+    # The reply is parsed as data, never executed; unusable replies get one short re-ask
+    inputs = test_case_improvement_inputs(instruction, test_cases, current_score, prompt, score_table, settings.test_case_tokens)
+    candidates = yield from _generation_step(settings.adversary_llm or llm, test_case_improvement_prompt, inputs, required_test_case_keys(prompt), num_candidates, settings.max_repairs)
+    if not candidates:
         return test_cases
+    if num_candidates == 1:
+        replace_index, new_test_cases = _replace_test_case(test_cases, candidates[0], rng)
+    else:
+        # Score every candidate alone, concurrently, and keep the most damaging one
+        yield _tests(settings, [instruction], candidates, llm, prompt, phase="re-score", plan=False)
+        replace_index, new_test_cases = _replace_easiest_test_case(instruction, test_cases, candidates, score_table, rng)
+
+    # A new test case only matters if it lowers the suite score
+    new_score = (yield _tests(settings, [instruction], new_test_cases, llm, prompt, must_fall_below=current_score if settings.bounded else None, phase="re-score", plan=False))[0]
+    selected = _select_test_cases(test_cases, new_test_cases, replace_index, current_score, new_score)
+    _record_decision(score_table, "test_cases", [(instruction, test_cases), (instruction, new_test_cases)], [int(selected is new_test_cases)], lowest=True)
+    return selected
+
+def improve_test_cases(test_cases: List[Dict[str, Any]], prompt: ChatPromptTemplate, llm: Any, test_case_improvement_prompt: ChatPromptTemplate, settings: ImprovementSettings = ImprovementSettings(), instruction: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Try one adversarial replacement (``settings.num_test_candidates`` candidates) that lowers the suite score.
+
+    Test cases are scored with ``instruction``, by default the prompt's own first message.
+    """
+    instruction = instruction if instruction is not None else prompt_instruction(prompt)
+    return _drive(_test_case_step(instruction, test_cases, prompt, llm, test_case_improvement_prompt, settings))
+
+async def aimprove_test_cases(test_cases: List[Dict[str, Any]], prompt: ChatPromptTemplate, llm: Any, test_case_improvement_prompt: ChatPromptTemplate, settings: ImprovementSettings = ImprovementSettings(), instruction: Optional[str] = None) -> List[Dict[str, Any]]:
+    instruction = instruction if instruction is not None else prompt_instruction(prompt)
+    return await _adrive(_test_case_step(instruction, test_cases, prompt, llm, test_case_improvement_prompt, settings))
+
+def _paired_differences(score_table: ScoreTable, previous_instruction: str, improved_instruction: str, test_cases: List[Dict[str, Any]]) -> List[int]:
+    differences = []
+    for test_case in test_cases:
+        old, new = score_table.peek(previous_instruction, test_case), score_table.peek(improved_instruction, test_case)
+        # Cells skipped by bounded evaluation carry no paired information
+        if old is not None and new is not None:
+            differences.append(new - old)
+    return differences
+
+def _acceptance_samples(settings: ImprovementSettings, iteration: int, round_number: int, test_cases: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[BaseCache]]:
+    """More paired samples: fresh suite cases if there is a suite, otherwise repeated calls on the same cases."""
+    if settings.suite is not None:
+        return settings.suite.minibatch(settings.acceptance.round_size, f"{settings.suite_seed}:acceptance:{round_number}", iteration), settings.cache
+    # A repeat marker gives the repeated cells their own score table entries; the response cache would only replay the first answer
+    return [{**test_case, "_repeat": round_number} for test_case in test_cases], None
+
+def _acceptance_verdict(log_file: Any, acceptance: SequentialAcceptance, previous_instruction: str, improved_instruction: str, differences: List[int], accepted: bool, rounds: int) -> str:
+    acceptance.record(accepted, rounds)
+    wins = sum(1 for difference in differences if difference > 0)
+    losses = sum(1 for difference in differences if difference < 0)
+    _say(1, f"Paired test: {wins} better, {losses} worse over {len(differences)} samples ({rounds} extra rounds)")
+    if accepted:
+        return improved_instruction
+    _say(1, "Improvement is not significant. Keeping the previous instruction.")
+    log_file.write(f"Rejected: not significantly better ({wins} better, {losses} worse over {len(differences)} paired samples).\n\n")
+    return previous_instruction
+
+def _acceptance_step(log_file: Any, settings: ImprovementSettings, iteration: int, previous_instruction: str, improved_instruction: str, test_cases: List[Dict[str, Any]], llm: Any, main_prompt: ChatPromptTemplate) -> _Step:
+    """Keep a changed instruction only if it is significantly better than the previous one.
+
+    Starts from the paired per-test differences already in the score table,
+    and draws more samples only while the outcome is ambiguous.
+    """
+    acceptance, score_table = settings.acceptance, settings.score_table
+    if acceptance is None or improved_instruction == previous_instruction:
+        return improved_instruction
+    differences = _paired_differences(score_table, previous_instruction, improved_instruction, test_cases)
+    for round_number in range(acceptance.max_rounds + 1):
+        remaining = (acceptance.max_rounds - round_number) * (acceptance.round_size if settings.suite is not None else len(test_cases))
+        decision = acceptance.decide(differences, remaining)
+        if decision is not None or round_number == acceptance.max_rounds:
+            break
+        samples, samples_cache = _acceptance_samples(settings, iteration, round_number, test_cases)
+        yield _tests(settings, [previous_instruction, improved_instruction], samples, llm, main_prompt, cache=samples_cache, phase="acceptance")
+        differences += _paired_differences(score_table, previous_instruction, improved_instruction, samples)
+    return _acceptance_verdict(log_file, acceptance, previous_instruction, improved_instruction, differences, bool(decision), round_number)
+
+def _promote(population: List[str], instruction: str) -> List[str]:
+    # Put a reverted instruction back in front, dropping the rejected one
+    if population and population[0] == instruction:
+        return population
+    return [instruction] + [member for member in population[1:] if member != instruction]
+
+def _minibatch_verdict(log_file: Any, previous_instruction: str, improved_instruction: str, batch_size: int, scores: List[int]) -> str:
+    _say(1, f"Minibatch of {batch_size} suite cases: {scores[0]} -> {scores[1]}")
+    if scores[1] >= scores[0]:
+        return improved_instruction
+    _say(1, "Instruction is worse on the minibatch. Keeping the previous instruction.")
+    log_file.write(f"Rejected on a minibatch of {batch_size} suite cases ({scores[0]} -> {scores[1]}).\n\n")
+    return previous_instruction
+
+def _confirm_verdict(log_file: Any, confirmed_instruction: str, improved_instruction: str, scores: List[int]) -> str:
+    _say(0, f"Full-suite confirmation: {scores[0]} -> {scores[1]}")
+    if scores[1] >= scores[0]:
+        log_file.write(f"Confirmed on the full suite ({scores[0]} -> {scores[1]}).\n\n")
+        return improved_instruction
+    log_file.write(f"Not confirmed on the full suite ({scores[0]} -> {scores[1]}). Reverted to the last confirmed instruction.\n\n")
+    return confirmed_instruction
+
+def _suite_scores(settings: ImprovementSettings, instructions: List[str], llm: Any, main_prompt: ChatPromptTemplate) -> _Step:
+    """Total scores of ``instructions`` on the whole suite, streamed batch by batch."""
+    # Each batch gets its own table, so suite cells never grow the run's score table or its checkpoints
+    responses = settings.score_table.responses if settings.score_table is not None else None
+    totals = [0] * len(instructions)
+    for batch in settings.suite.batches():
+        scores = yield _tests(settings, instructions, batch, llm, main_prompt, score_table=ScoreTable(responses=responses), phase="confirm")
+        totals = [total + score for total, score in zip(totals, scores)]
+    return totals
+
+def _suite_steps(settings: ImprovementSettings, iteration: int, previous_instruction: str, improved_instruction: str, confirmed_instruction: str, final: bool) -> Tuple[bool, bool]:
+    """Which suite checks are due: ``(minibatch, full-suite confirmation)``."""
+    if settings.suite is None:
+        return False, False
+    minibatch = not final and settings.minibatch_size > 0 and improved_instruction != previous_instruction
+    confirm = improved_instruction != confirmed_instruction and (final or (settings.confirm_every > 0 and iteration % settings.confirm_every == 0))
+    return minibatch, confirm
+
+def _suite_step(log_file: Any, settings: ImprovementSettings, iteration: int, previous_instruction: str, improved_instruction: str, confirmed: Tuple[str, Optional[int]], llm: Any, main_prompt: ChatPromptTemplate, final: bool = False) -> _Step:
+    """Check an instruction against the streaming suite; returns ``(instruction, confirmed)``.
+
+    ``confirmed`` is the last confirmed instruction and its suite total, if
+    known. A changed instruction must not score worse than the previous one
+    on this iteration's seeded minibatch. Every ``confirm_every`` iterations,
+    and at the end of the run, the whole suite decides between the current
+    and the last confirmed instruction.
+    """
+    suite = settings.suite
+    confirmed_instruction, confirmed_score = confirmed
+    minibatch, confirm = _suite_steps(settings, iteration, previous_instruction, improved_instruction, confirmed_instruction, final)
+    if minibatch:
+        batch = suite.minibatch(settings.minibatch_size, settings.suite_seed, iteration)
+        scores = yield _tests(settings, [previous_instruction, improved_instruction], batch, llm, main_prompt, phase="minibatch")
+        improved_instruction = _minibatch_verdict(log_file, previous_instruction, improved_instruction, len(batch), scores)
+    if confirm and improved_instruction != confirmed_instruction:
+        # Only the first confirmation scores both; later ones reuse the confirmed total
+        if confirmed_score is None:
+            totals = yield from _suite_scores(settings, [confirmed_instruction, improved_instruction], llm, main_prompt)
+        else:
+            totals = [confirmed_score, *(yield from _suite_scores(settings, [improved_instruction], llm, main_prompt))]
+        improved_instruction = _confirm_verdict(log_file, confirmed_instruction, improved_instruction, totals)
+        # The verdict keeps the higher total
+        confirmed = (improved_instruction, max(totals))
+    return improved_instruction, confirmed
+
+def _apply_instruction(log_file: Any, improved_instruction: str, new_instruction: str) -> str:
+    if new_instruction != improved_instruction:
+        log_file.write(f"Improved instruction:\n{new_instruction}\n\n")
+        return new_instruction
+    log_file.write("No change in instruction.\n\n")
+    return improved_instruction
+
+def _apply_test_cases(log_file: Any, improved_test_cases: List[Dict[str, Any]], new_test_cases: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if new_test_cases != improved_test_cases:
+        # Only the replaced cases; the final results list the whole suite
+        for i, (old_case, new_case) in enumerate(zip(improved_test_cases, new_test_cases)):
+            if old_case != new_case:
+                log_file.write(f"Replaced test case {i + 1}:\n{new_case}\n")
+        return new_test_cases
+    log_file.write("No change in test cases.\n")
+    return improved_test_cases
+
+def _write_final_results(log_file: Any, improved_instruction: str, improved_test_cases: List[Dict[str, Any]]) -> None:
+    # Store the final results log file
+    log_file.write(f"Final Results:\n")
+    log_file.write(f"Instruction: {improved_instruction}\n")
+    log_file.write(f"Test Cases: {improved_test_cases}\n")
+
+def _check_budget(budget: Optional[RunBudget], changed: bool) -> Optional[str]:
+    if budget is None:
+        return None
+    budget.record_iteration(changed)
+    return budget.stop_reason()
+
+def _write_stop_reason(log_file: Any, stop_reason: str) -> None:
+    print(f"Stopping: {stop_reason}")
+    log_file.write(f"\nStopped: {stop_reason}\n")
+
+def _resume_from_checkpoint(checkpoint_path: Optional[str], resume: bool, fingerprint: str, score_table: ScoreTable, rng: Optional[random.Random], budget: Optional[RunBudget]) -> Optional[tuple[int, str, List[str], List[Dict[str, Any]], Tuple[str, Optional[int]]]]:
+    if not (checkpoint_path and resume):
+        return None
+    state = load_checkpoint(checkpoint_path)
+    if state is None:
+        print(f"No checkpoint at '{checkpoint_path}'. Starting a new run.")
+        return None
+    print(f"Resuming from '{checkpoint_path}' after iteration {state['iteration']}")
+    return restore_run_state(state, fingerprint, score_table, rng, budget)
+
+def _save_checkpoint(checkpoint_path: Optional[str], iteration: int, fingerprint: str, instruction: str, population: List[str], test_cases: List[Dict[str, Any]], score_table: ScoreTable, rng: Optional[random.Random], budget: Optional[RunBudget], confirmed: Tuple[str, Optional[int]]) -> None:
+    if checkpoint_path:
+        save_checkpoint(checkpoint_path, run_state(iteration, fingerprint, instruction, population, test_cases, score_table, rng, budget, *confirmed))
+
+def _known_total_score(score_table: ScoreTable, instruction: str, test_cases: List[Dict[str, Any]]) -> Optional[int]:
+    scores = [score_table.peek(instruction, test_case) for test_case in test_cases]
+    return None if any(score is None for score in scores) else sum(scores)
+
+def _commit_decisions(score_table: ScoreTable, step: str, iteration: int) -> None:
+    if score_table.responses is not None:
+        score_table.responses.commit(step, iteration)
+
+def _log_iteration(run_log: Optional[RunLog], iteration: int, previous: Tuple[str, List[Dict[str, Any]]], instruction: str, test_cases: List[Dict[str, Any]], score_table: ScoreTable, started: float, budget: Optional[RunBudget]) -> None:
+    if score_table.responses is not None:
+        score_table.responses.iteration(iteration, instruction, previous[1])
+    if run_log is None:
+        return
+    if instruction != previous[0]:
+        run_log.instruction(iteration, instruction)
+    run_log.test_cases(iteration, previous[1], test_cases)
+    elapsed = budget.elapsed() if budget is not None else None
+    # The instruction was selected on the test cases the iteration started with
+    run_log.iteration(iteration, _known_total_score(score_table, instruction, previous[1]), time.perf_counter() - started, elapsed)
+
+def _scheduler_rows(llms: Tuple[Any, ...]) -> List[str]:
+    # One row per model; role copies of a model share its scheduler, so it is listed once
+    rows = {}
+    for llm in llms:
+        if isinstance(llm, LimitedChatModel):
+            rows.setdefault(llm.model_name, f"Scheduler ({llm.model_name}): {llm.summary()}")
+        elif isinstance(llm, QueuedChatModel):
+            name = llm.model_name or "default model"
+            rows.setdefault(name, f"Job queue ({name}): {llm.summary()}")
+    return list(rows.values())
+
+def _print_run_summary(log_file_path: str, cache: Optional[BaseCache], score_table: ScoreTable, budget: Optional[RunBudget] = None, instrumentation: Optional[Instrumentation] = None, llms: Tuple[Any, ...] = (), acceptance: Optional[SequentialAcceptance] = None) -> None:
+    if instrumentation is not None:
+        print(f"\nLLM calls by phase:\n{instrumentation.summary_table()}")
+    for row in _scheduler_rows(llms):
+        print(row)
+    if acceptance is not None:
+        print(f"Acceptance: {acceptance.summary()}")
+    if score_table.planner is not None:
+        print(f"Test selection: {score_table.planner.summary()}")
+    if budget is not None:
+        print(f"Budget used: {budget.summary()}")
+    if cache is not None:
+        print(f"Response cache: {cache.hits} hits, {cache.misses} misses")
+    print(f"Score table: {len(score_table)} cells, {score_table.hits} reused")
+    print(f"Improvement process completed. Results saved in '{log_file_path}'")
+
+class _ImprovementRun:
+    """State of one improvement loop and the steps an iteration is made of.
+
+    The sync and async loops share all of it; the async loop only overlaps
+    the steps and starts the next instruction step speculatively.
+    """
+
+    def __init__(self, llm: Any, main_prompt: ChatPromptTemplate, instruction: str, test_cases: List[Dict[str, Any]], instruction_improvement_prompt: ChatPromptTemplate, test_case_improvement_prompt: ChatPromptTemplate, settings: ImprovementSettings):
+        budget, instrumentation = settings.budget, settings.instrumentation
+        self.llm = with_callbacks(llm, budget, instrumentation)
+        # Generation roles default to the target model
+        self.settings = settings._replace(
+            score_table=settings.score_table if settings.score_table is not None else ScoreTable(),
+            optimizer_llm=with_callbacks(settings.optimizer_llm, budget, instrumentation) if settings.optimizer_llm is not None else self.llm,
+            adversary_llm=with_callbacks(settings.adversary_llm, budget, instrumentation) if settings.adversary_llm is not None else self.llm
+        )
+        self.main_prompt = main_prompt
+        self.instruction_improvement_prompt = instruction_improvement_prompt
+        self.test_case_improvement_prompt = test_case_improvement_prompt
+        self.instruction = instruction
+        self.test_cases = test_cases
+        # Keep a population of instructions (best first) when searching with several candidates
+        self.population = [instruction]
+        # The instruction that last won a full-suite confirmation, and its suite total once scored
+        self.confirmed: Tuple[str, Optional[int]] = (instruction, None)
+        self.stop_reason = f"reached max iterations ({settings.max_iterations})"
+        if budget is not None:
+            budget.start()
+
+        # Continue an interrupted run from its last completed iteration
+        score_table = self.settings.score_table
+        self.fingerprint = run_fingerprint(instruction, test_cases)
+        self.start_iteration = 0
+        self.resumed = _resume_from_checkpoint(settings.checkpoint_path, settings.resume, self.fingerprint, score_table, settings.rng, budget)
+        if self.resumed is not None:
+            self.start_iteration, self.instruction, self.population, self.test_cases, self.confirmed = self.resumed
+        if settings.run_log is not None:
+            settings.run_log.start(self.start_iteration, self.instruction, self.test_cases, self.resumed is not None)
+        if score_table.responses is not None:
+            score_table.responses.start(self.start_iteration)
+        self.completed_iterations = self.start_iteration
+        self.log_file: Optional[TextIO] = None
+        self.previous = (self.instruction, self.test_cases)
+        self.iteration_started = time.perf_counter()
+
+    def open_log(self) -> TextIO:
+        self.log_file = open(self.settings.log_file_path, "a" if self.resumed is not None else "w")
+        return self.log_file
+
+    def iterations(self) -> range:
+        return range(self.start_iteration, self.settings.max_iterations)
+
+    def begin_iteration(self, i: int) -> None:
+        print(f"Iteration {i+1}/{self.settings.max_iterations}")
+        self.log_file.write(f"\n--- Iteration {i+1} ---\n")
+        self.previous = (self.instruction, self.test_cases)
+        self.iteration_started = time.perf_counter()
+
+    def instruction_step(self, population: List[str], test_cases: List[Dict[str, Any]]) -> _Step:
+        """Propose the next population (one instruction unless searching with several candidates)."""
+        settings = self.settings
+        if settings.num_candidates > 1 or settings.population_size > 1:
+            return (yield from _population_step(population, test_cases, self.llm, self.main_prompt, self.instruction_improvement_prompt, settings))
+        return [(yield from _instruction_step(population[0], test_cases, self.llm, self.main_prompt, self.instruction_improvement_prompt, settings))]
+
+    def settle_instruction(self, iteration: int, population: List[str]) -> _Step:
+        """Take the proposed population's best instruction if it passes acceptance and the suite checks."""
+        previous_instruction, previous_test_cases = self.previous
+        self.population = population
+        self.instruction = _apply_instruction(self.log_file, self.instruction, population[0])
+        self.instruction = yield from _acceptance_step(
+            self.log_file, self.settings, iteration, previous_instruction, self.instruction, previous_test_cases, self.llm, self.main_prompt
+        )
+        self.instruction, self.confirmed = yield from _suite_step(
+            self.log_file, self.settings, iteration, previous_instruction, self.instruction, self.confirmed, self.llm, self.main_prompt
+        )
+        self.population = _promote(self.population, self.instruction)
+
+    def instruction_failed(self, error: Exception) -> None:
+        print(f"Error improving instruction: {error}")
+        self.log_file.write(f"Error improving instruction: {error}\n\n")
+
+    def test_case_step(self, test_cases: List[Dict[str, Any]]) -> _Step:
+        """Try to replace a test case, scoring against the settled instruction of this iteration."""
+        return _test_case_step(self.instruction, test_cases, self.main_prompt, self.llm, self.test_case_improvement_prompt, self.settings)
+
+    def settle_test_cases(self, new_test_cases: List[Dict[str, Any]]) -> None:
+        self.test_cases = _apply_test_cases(self.log_file, self.test_cases, new_test_cases)
+
+    def test_cases_failed(self, error: Exception) -> None:
+        print(f"Error improving test cases: {error}")
+        self.log_file.write(f"Error improving test cases: {error}\n")
+
+    def commit(self, step: str, iteration: int) -> None:
+        _commit_decisions(self.settings.score_table, step, iteration)
+
+    def end_iteration(self, iteration: int) -> bool:
+        """Log and checkpoint a finished iteration; returns True when a stopping criterion is met."""
+        settings = self.settings
+        self.log_file.flush()
+        reason = _check_budget(settings.budget, (self.instruction, self.test_cases) != self.previous)
+        _log_iteration(settings.run_log, iteration, self.previous, self.instruction, self.test_cases, settings.score_table, self.iteration_started, settings.budget)
+        self.completed_iterations = iteration
+        _save_checkpoint(settings.checkpoint_path, iteration, self.fingerprint, self.instruction, self.population, self.test_cases, settings.score_table, settings.rng, settings.budget, self.confirmed)
+        if reason is None:
+            return False
+        self.stop_reason = reason
+        return True
+
+    def finish(self) -> _Step:
+        """Confirm the final instruction on the suite and write the stop reason and final results."""
+        settings = self.settings
+        # An instruction is only final once it holds up on the whole suite
+        final_instruction, self.confirmed = yield from _suite_step(
+            self.log_file, settings, self.completed_iterations, self.instruction, self.instruction, self.confirmed, self.llm, self.main_prompt, final=True
+        )
+        if settings.run_log is not None and final_instruction != self.instruction:
+            settings.run_log.instruction(self.completed_iterations, final_instruction)
+        self.instruction = final_instruction
+        _write_stop_reason(self.log_file, self.stop_reason)
+        if settings.run_log is not None:
+            settings.run_log.stop(self.completed_iterations, self.stop_reason)
+        _write_final_results(self.log_file, self.instruction, self.test_cases)
+        return self.instruction, self.test_cases
+
+    def print_summary(self) -> None:
+        settings = self.settings
+        _print_run_summary(settings.log_file_path, settings.cache, settings.score_table, settings.budget, settings.instrumentation, (self.llm, settings.optimizer_llm, settings.adversary_llm), settings.acceptance)
 
 def adversarial_improvement(
     llm: Any,
@@ -114,51 +898,124 @@ def adversarial_improvement(
     test_cases: List[Dict[str, Any]],
     instruction_improvement_prompt: ChatPromptTemplate,
     test_case_improvement_prompt: ChatPromptTemplate,
-    max_iterations: int = 100,
-    log_file_path: str = "adversarial_improvement_log.txt"
+    settings: ImprovementSettings = ImprovementSettings()
 ) -> tuple[str, List[Dict[str, Any]]]:
-    improved_instruction = instruction
-    improved_test_cases = test_cases
+    run = _ImprovementRun(llm, main_prompt, instruction, test_cases, instruction_improvement_prompt, test_case_improvement_prompt, settings)
 
-    with open(log_file_path, "w") as log_file:
-        for i in range(max_iterations):
-            print(f"Iteration {i+1}/{max_iterations}")
-            log_file.write(f"\n--- Iteration {i+1} ---\n")
+    with run.open_log():
+        for i in run.iterations():
+            run.begin_iteration(i)
 
-            print("Improving instruction...")
+            _say(1, "Improving instruction...")
             try:
-                new_instruction = improve_instruction(
-                    improved_instruction, improved_test_cases, llm, main_prompt, instruction_improvement_prompt
-                )
-                if new_instruction != improved_instruction:
-                    log_file.write(f"Improved instruction:\n{new_instruction}\n\n")
-                    improved_instruction = new_instruction
-                else:
-                    log_file.write("No change in instruction.\n\n")
+                population = _drive(run.instruction_step(run.population, run.test_cases))
+                _drive(run.settle_instruction(i + 1, population))
             except Exception as e:
-                print(f"Error improving instruction: {e}")
-                log_file.write(f"Error improving instruction: {e}\n\n")
+                run.instruction_failed(e)
+            run.commit("instruction", i + 1)
 
-            print("Improving test cases...")
+            _say(1, "Improving test cases...")
             try:
-                new_test_cases = improve_test_cases(
-                    improved_test_cases, main_prompt, llm, test_case_improvement_prompt
-                )
-                if new_test_cases != improved_test_cases:
-                    log_file.write(f"Improved test cases:\n{new_test_cases}\n")
-                    improved_test_cases = new_test_cases
-                else:
-                    log_file.write("No change in test cases.\n")
+                run.settle_test_cases(_drive(run.test_case_step(run.test_cases)))
             except Exception as e:
-                print(f"Error improving test cases: {e}")
-                log_file.write(f"Error improving test cases: {e}\n")
+                run.test_cases_failed(e)
+            run.commit("test_cases", i + 1)
 
-            log_file.flush()
-        # Store the final results log file
-        log_file.write(f"Final Results:\n")
-        log_file.write(f"Instruction: {improved_instruction}\n")
-        log_file.write(f"Test Cases: {improved_test_cases}\n")
+            if run.end_iteration(i + 1):
+                break
+        result = _drive(run.finish())
 
+    run.print_summary()
+    return result
 
-    print(f"Improvement process completed. Results saved in '{log_file_path}'")
-    return improved_instruction, improved_test_cases
\ No newline at end of file
+async def aadversarial_improvement(
+    llm: Any,
+    main_prompt: ChatPromptTemplate,
+    instruction: str,
+    test_cases: List[Dict[str, Any]],
+    instruction_improvement_prompt: ChatPromptTemplate,
+    test_case_improvement_prompt: ChatPromptTemplate,
+    settings: ImprovementSettings = ImprovementSettings()
+) -> tuple[str, List[Dict[str, Any]]]:
+    """Async version of adversarial_improvement that overlaps independent steps.
+
+    The test case step scores against the settled instruction, so it starts
+    once the instruction is settled. The next iteration's instruction step is
+    started at the same time, speculatively, assuming the test cases stay the
+    same; if the test case step replaces a case, the speculative work is
+    cancelled and restarted. Every step therefore sees the same inputs as in
+    the sequential loop, and only the test case step draws from ``rng``, in
+    the same order.
+    """
+    run = _ImprovementRun(llm, main_prompt, instruction, test_cases, instruction_improvement_prompt, test_case_improvement_prompt, settings)
+    max_iterations = settings.max_iterations
+    score_table = run.settings.score_table
+    planner = score_table.planner
+    planner_mark = 0
+
+    def start_instruction_step() -> asyncio.Task:
+        nonlocal planner_mark
+        if planner is not None:
+            planner_mark = planner.mark()
+        return asyncio.create_task(_adrive(run.instruction_step(run.population, run.test_cases)))
+
+    async def cancel_instruction_step(task: asyncio.Task) -> None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        if planner is not None:
+            # The sequential loop never ran this step, so its scores must not steer test selection
+            planner.rollback(planner_mark)
+        if score_table.responses is not None:
+            score_table.responses.discard("instruction")
+
+    with run.open_log():
+        instruction_task = start_instruction_step() if run.start_iteration < max_iterations else None
+        test_case_task = None
+        try:
+            for i in run.iterations():
+                run.begin_iteration(i)
+
+                _say(1, "Improving instruction...")
+                try:
+                    await _adrive(run.settle_instruction(i + 1, await instruction_task))
+                except Exception as e:
+                    run.instruction_failed(e)
+                run.commit("instruction", i + 1)
+
+                _say(1, "Improving test cases...")
+                test_case_task = asyncio.create_task(_adrive(run.test_case_step(run.test_cases)))
+                # Speculate that the test cases will not change
+                instruction_task = start_instruction_step() if i + 1 < max_iterations else None
+
+                try:
+                    new_test_cases = await test_case_task
+                    if new_test_cases != run.test_cases and instruction_task is not None:
+                        await cancel_instruction_step(instruction_task)
+                        instruction_task = None
+                    run.settle_test_cases(new_test_cases)
+                except Exception as e:
+                    run.test_cases_failed(e)
+                run.commit("test_cases", i + 1)
+
+                if instruction_task is None and i + 1 < max_iterations:
+                    _say(1, "Test cases changed. Restarting speculative instruction step.")
+                    instruction_task = start_instruction_step()
+
+                if run.end_iteration(i + 1):
+                    break
+
+        finally:
+            # A cancelled run must not leave its steps calling the model
+            for task in (instruction_task, test_case_task):
+                if task is not None and not task.done():
+                    task.cancel()
+
+        if instruction_task is not None and not instruction_task.done():
+            # Drop speculative work for an iteration that will not run
+            await cancel_instruction_step(instruction_task)
+        if score_table.responses is not None:
+            score_table.responses.discard("instruction")
+        result = await _adrive(run.finish())
+
+    run.print_summary()
+    return result
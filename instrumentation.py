@@ -0,0 +1,166 @@
+import json
+import statistics
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+# Phases tagged by improvements.py through the run metadata
+PHASES = ["baseline", "candidate", "optimizer", "adversary", "repair", "re-score", "acceptance", "minibatch", "confirm", "final"]
+# The model role that answers each phase; every other phase is answered by the target model
+PHASE_ROLES = {"optimizer": "optimizer", "adversary": "adversary", "repair": "adversary", "final": "evaluation"}
+ROLES = ["target", "optimizer", "adversary", "evaluation"]
+
+
+def phase_role(phase: str) -> str:
+    return PHASE_ROLES.get(phase, "target")
+
+
+class Instrumentation(BaseCallbackHandler):
+    """Per-call latency, token and retry metrics, grouped by loop phase.
+
+    The improvement loop tags every LLM call with a ``phase`` in the run
+    metadata. Each finished call becomes one record, appended to the JSONL
+    trace if ``trace_path`` is set; ``write_prometheus`` and
+    ``summary_table`` aggregate the records per phase and model, and
+    ``role_table`` per model role, with costs from ``prices`` (input and
+    output price per million tokens, by model name).
+    """
+
+    def __init__(self, trace_path: Optional[str] = None, prices: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.trace_path = trace_path
+        self.prices = prices or {}
+        self.records: List[Dict[str, Any]] = []
+        self._running: Dict[UUID, Dict[str, Any]] = {}
+        self._retries: Dict[UUID, int] = {}
+        self._lock = threading.Lock()
+        self._trace = open(trace_path, "a") if trace_path else None
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        metadata = metadata or {}
+        invocation_params = kwargs.get("invocation_params") or {}
+        model = metadata.get("ls_model_name") or invocation_params.get("model_name") or invocation_params.get("model") or "unknown"
+        with self._lock:
+            self._running[run_id] = {
+                "phase": metadata.get("phase", "other"),
+                "model": model,
+                "started": time.time(),
+                "perf_started": time.perf_counter(),
+            }
+
+    def on_retry(self, retry_state: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._retries[run_id] = self._retries.get(run_id, 0) + 1
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        generations = [generation for batch in response.generations for generation in batch]
+        input_tokens = output_tokens = 0
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            input_tokens += usage.get("input_tokens", 0)
+            output_tokens += usage.get("output_tokens", 0)
+        cache_hit = any((generation.generation_info or {}).get("cache_hit") for generation in generations)
+        self._finish(run_id, {"input_tokens": input_tokens, "output_tokens": output_tokens, "cache_hit": cache_hit, "error": None})
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, {"input_tokens": 0, "output_tokens": 0, "cache_hit": False, "error": type(error).__name__})
+
+    def _finish(self, run_id: UUID, outcome: Dict[str, Any]) -> None:
+        with self._lock:
+            started = self._running.pop(run_id, None)
+            retries = self._retries.pop(run_id, 0)
+            if started is None:
+                return
+            record = {
+                "timestamp": started["started"],
+                "phase": started["phase"],
+                "model": started["model"],
+                "latency": time.perf_counter() - started["perf_started"],
+                "retries": retries,
+                **outcome,
+            }
+            self.records.append(record)
+            if self._trace is not None:
+                self._trace.write(json.dumps(record) + "\n")
+                self._trace.flush()
+
+    def close(self) -> None:
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+    def _groups(self) -> Dict[tuple, List[Dict[str, Any]]]:
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        with self._lock:
+            for record in self.records:
+                groups.setdefault((record["phase"], record["model"]), []).append(record)
+        order = {phase: i for i, phase in enumerate(PHASES)}
+        return dict(sorted(groups.items(), key=lambda item: (order.get(item[0][0], len(order)), item[0])))
+
+    def write_prometheus(self, path: str) -> None:
+        """Write the aggregated metrics in the Prometheus text exposition format."""
+        metrics = [
+            ("llm_calls_total", "counter", "LLM calls", lambda records: len(records)),
+            ("llm_errors_total", "counter", "Failed LLM calls", lambda records: sum(1 for r in records if r["error"])),
+            ("llm_cache_hits_total", "counter", "Calls served from the response cache", lambda records: sum(1 for r in records if r["cache_hit"])),
+            ("llm_retries_total", "counter", "Retried attempts", lambda records: sum(r["retries"] for r in records)),
+            ("llm_prompt_tokens_total", "counter", "Prompt tokens", lambda records: sum(r["input_tokens"] for r in records)),
+            ("llm_completion_tokens_total", "counter", "Completion tokens", lambda records: sum(r["output_tokens"] for r in records)),
+            ("llm_latency_seconds_sum", "counter", "Total call latency", lambda records: sum(r["latency"] for r in records)),
+        ]
+        groups = self._groups()
+        lines = []
+        for name, metric_type, help_text, value in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (phase, model), records in groups.items():
+                lines.append(f'{name}{{phase="{phase}",model="{model}"}} {value(records):g}')
+        with open(path, "w") as metrics_file:
+            metrics_file.write("\n".join(lines) + "\n")
+
+    def summary_table(self) -> str:
+        header = f"{'phase':<11}{'model':<16}{'calls':>7}{'errors':>8}{'retries':>8}{'cached':>8}{'in tok':>9}{'in/call':>9}{'out tok':>9}{'p50 ms':>9}{'p95 ms':>9}"
+        lines = [header]
+        for (phase, model), records in self._groups().items():
+            latencies = sorted(r["latency"] * 1000 for r in records)
+            p95 = statistics.quantiles(latencies, n=20, method="inclusive")[18] if len(latencies) > 1 else latencies[0]
+            lines.append(
+                f"{phase:<11}{model[:15]:<16}{len(records):>7}"
+                f"{sum(1 for r in records if r['error']):>8}{sum(r['retries'] for r in records):>8}"
+                f"{sum(1 for r in records if r['cache_hit']):>8}"
+                f"{sum(r['input_tokens'] for r in records):>9}{sum(r['input_tokens'] for r in records) // len(records):>9}"
+                f"{sum(r['output_tokens'] for r in records):>9}"
+                f"{statistics.median(latencies):>9.1f}{p95:>9.1f}"
+            )
+        return "\n".join(lines)
+
+    def cost(self, model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+        if model not in self.prices:
+            return None
+        input_price, output_price = self.prices[model]
+        return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+    def role_table(self) -> str:
+        """Calls, throughput and cost per model role and model."""
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        with self._lock:
+            for record in self.records:
+                groups.setdefault((phase_role(record["phase"]), record["model"]), []).append(record)
+        order = {role: i for i, role in enumerate(ROLES)}
+
+        lines = [f"{'role':<11}{'model':<16}{'calls':>7}{'in tok':>9}{'out tok':>9}{'calls/s':>9}{'out tok/s':>11}{'cost':>10}"]
+        for (role, model), records in sorted(groups.items(), key=lambda item: (order[item[0][0]], item[0][1])):
+            input_tokens = sum(r["input_tokens"] for r in records)
+            output_tokens = sum(r["output_tokens"] for r in records)
+            # Throughput over the span in which the role had calls running
+            span = max(r["timestamp"] + r["latency"] for r in records) - min(r["timestamp"] for r in records)
+            span = max(span, 1e-9)
+            cost = self.cost(model, input_tokens, output_tokens)
+            lines.append(
+                f"{role:<11}{model[:15]:<16}{len(records):>7}{input_tokens:>9}{output_tokens:>9}"
+                f"{len(records) / span:>9.1f}{output_tokens / span:>11.1f}{'-' if cost is None else f'{cost:.4f}':>10}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict, messages_to_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+
+class JobFailed(RuntimeError):
+    """A worker gave up on a job; the message carries the worker's error."""
+
+
+class JobQueue:
+    """Model calls waiting for worker processes, in a SQLite database.
+
+    Each job holds the fully rendered messages of one call and the name of
+    the model that should answer it. Workers claim pending jobs in
+    submission order and write back the response message or an error. A job claimed by a worker that has not answered within
+    ``lease_seconds`` (e.g. because it crashed) is handed out again. The
+    database can live on a shared filesystem, so workers may run on other
+    machines.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 300.0):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        # Autocommit; claims take the write lock explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                messages TEXT NOT NULL,
+                stop TEXT,
+                model TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                submitted_at REAL NOT NULL,
+                claimed_at REAL,
+                result TEXT
+            )"""
+        )
+        # Queues created before jobs named their model
+        if "model" not in [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN model TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+    def submit(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, model: Optional[str] = None) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (messages, stop, model, submitted_at) VALUES (?, ?, ?, ?)",
+                (json.dumps(messages_to_dict(messages)), json.dumps(stop), model, time.time()),
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker: str, limit: int = 1, models: Optional[List[str]] = None) -> List[Tuple[int, Optional[str], List[BaseMessage], Optional[List[str]]]]:
+        """Take up to ``limit`` jobs for ``worker``: ``(job id, model, messages, stop)`` each.
+
+        With ``models``, only jobs for those models are taken.
+        """
+        if limit < 1:
+            return []
+        now = time.time()
+        model_filter = f" AND model IN ({', '.join('?' * len(models))})" if models else ""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    f"""SELECT id, model, messages, stop FROM jobs
+                       WHERE (status = 'pending' OR (status = 'running' AND claimed_at < ?)){model_filter}
+                       ORDER BY id LIMIT ?""",
+                    (now - self.lease_seconds, *(models or []), limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE jobs SET status = 'running', worker = ?, claimed_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    [(worker, now, row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(job_id, model, messages_from_dict(json.loads(messages)), json.loads(stop)) for job_id, model, messages, stop in rows]
+
+    def complete(self, job_id: int, message: BaseMessage) -> None:
+        self._finish(job_id, "done", json.dumps(message_to_dict(message)))
+
+    def fail(self, job_id: int, error: str) -> None:
+        self._finish(job_id, "failed", error)
+
+    def _finish(self, job_id: int, status: str, result: str) -> None:
+        # A cancelled job is gone already, so its late answer is dropped here
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = ?, result = ? WHERE id = ? AND status = 'running'", (status, result, job_id))
+
+    def poll(self, job_id: int) -> Optional[Tuple[str, str]]:
+        """``(status, result)`` once the job is done or failed, else ``None``."""
+        with self._lock:
+            row = self._conn.execute("SELECT status, result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise JobFailed(f"Job {job_id} is no longer in the queue")
+        return row if row[0] in ("done", "failed") else None
+
+    def remove(self, job_id: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class QueuedChatModel(BaseChatModel):
+    """Sends every call to a ``JobQueue`` and waits for a worker to answer it.
+
+    A drop-in replacement for the model in the improvement loop: prompt
+    rendering, the response cache, callbacks and scoring stay in this
+    process, while the provider calls (with their rate limits and retries)
+    run in ``worker.py`` processes. Every job carries ``model_name``, and
+    workers answer it with that model; without one, a worker uses its
+    default model. A call whose caller is cancelled is removed from the
+    queue.
+    """
+
+    queue_path: str
+    model_name: Optional[str] = None
+    poll_interval: float = 0.05
+    timeout: Optional[float] = None
+
+    _state: Dict[str, Any] = PrivateAttr(default_factory=dict)
+
+    def model_post_init(self, __context: Any) -> None:
+        # Kept in one dict so model_copy shares the queue connection and counters
+        self._state.update(queue=JobQueue(self.queue_path), lock=threading.Lock(), submitted=0, failed=0, waited_seconds=0.0)
+
+    @property
+    def queue(self) -> JobQueue:
+        return self._state["queue"]
+
+    @property
+    def _llm_type(self) -> str:
+        return "job-queue"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name}
+
+    def _submit(self, messages: List[BaseMessage], stop: Optional[List[str]]) -> Tuple[int, float]:
+        job_id = self.queue.submit(messages, stop, self.model_name)
+        with self._state["lock"]:
+            self._state["submitted"] += 1
+        return job_id, time.monotonic()
+
+    def _result(self, job_id: int, submitted_at: float) -> Optional[ChatResult]:
+        finished = self.queue.poll(job_id)
+        if finished is None:
+            if self.timeout is not None and time.monotonic() - submitted_at > self.timeout:
+                self.queue.remove(job_id)
+                raise TimeoutError(f"No worker answered job {job_id} within {self.timeout}s")
+            return None
+
+        self.queue.remove(job_id)
+        status, result = finished
+        with self._state["lock"]:
+            self._state["waited_seconds"] += time.monotonic() - submitted_at
+            if status == "failed":
+                self._state["failed"] += 1
+        if status == "failed":
+            raise JobFailed(f"Job {job_id} failed: {result}")
+        message = messages_from_dict([json.loads(result)])[0]
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        job_id, submitted_at = self._submit(messages, stop)
+        while True:
+            result = self._result(job_id, submitted_at)
+            if result is not None:
+                return result
+            time.sleep(self.poll_interval)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        job_id, submitted_at = self._submit(messages, stop)
+        try:
+            while True:
+                result = self._result(job_id, submitted_at)
+                if result is not None:
+                    return result
+                await asyncio.sleep(self.poll_interval)
+        except asyncio.CancelledError:
+            self.queue.remove(job_id)
+            raise
+
+    def summary(self) -> str:
+        with self._state["lock"]:
+            submitted, failed, waited = self._state["submitted"], self._state["failed"], self._state["waited_seconds"]
+        mean_wait = waited / submitted if submitted else 0.0
+        return f"{submitted} jobs submitted, {failed} failed, {mean_wait:.2f}s mean wait"
@@ -0,0 +1,239 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from pydantic import PrivateAttr
+from tenacity import RetryCallState
+
+# HTTP status codes worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def error_status_code(error: BaseException) -> Optional[int]:
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def is_rate_limit(error: BaseException) -> bool:
+    return error_status_code(error) == 429 or "RateLimit" in type(error).__name__
+
+
+def is_retryable(error: BaseException) -> bool:
+    if is_rate_limit(error) or isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if error_status_code(error) in RETRYABLE_STATUS_CODES:
+        return True
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+class LimitedChatModel(BaseChatModel):
+    """Client-side scheduler around ``llm``: rate limit, retries and concurrency.
+
+    - ``requests_per_second`` is a token-bucket rate limit that allows bursts
+      of up to ``burst`` calls (unlimited if ``None``).
+    - Calls failing with a retryable error (429, 5xx, timeouts, connection
+      errors) are retried up to ``max_retries`` times with full-jitter
+      exponential backoff, so a rate-limit spike no longer costs a whole
+      iteration. Each retry is reported to the callbacks' ``on_retry``.
+    - At most ``max_concurrency`` calls are in flight. With ``adaptive`` the
+      limit follows AIMD: it is halved on a 429 (at most once per backoff
+      window) and grows by ``1 / limit`` after each success.
+
+    Several improvement runs can share one wrapper (and through it one client
+    and connection pool); the limits then hold across all of them. Copies made
+    with ``model_copy``, e.g. by ``with_cache`` or ``with_callbacks``, share
+    the same state. Cache lookups happen before a slot is taken, so cached
+    responses never wait. Model identity is delegated to ``llm``, so cache
+    entries are shared with runs that use the bare model.
+    """
+
+    llm: BaseChatModel
+    max_concurrency: int = 8
+    min_concurrency: int = 1
+    adaptive: bool = False
+    requests_per_second: Optional[float] = None
+    burst: Optional[int] = None
+    max_retries: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 30.0
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _state: Dict[str, Any] = PrivateAttr(default_factory=dict)
+    _rng: random.Random = PrivateAttr(default_factory=random.Random)
+
+    def model_post_init(self, __context: Any) -> None:
+        # Kept in one dict so model_copy shares it between copies
+        self._state.update(
+            limit=float(self.max_concurrency),
+            in_flight=0,
+            sync_wakeup=threading.Condition(self._lock),
+            async_waiters=[],
+            tokens=float(self._bucket_size()),
+            refilled_at=time.monotonic(),
+            decreased_at=0.0,
+            stats={"calls": 0, "retries": 0, "rate_limited": 0, "failed": 0, "throttled_seconds": 0.0, "lowest_limit": float(self.max_concurrency)},
+        )
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.llm, "model_name", None) or getattr(self.llm, "model", None) or self.llm._llm_type
+
+    @property
+    def _llm_type(self) -> str:
+        return self.llm._llm_type
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return self.llm._identifying_params
+
+    def _get_ls_params(self, stop: Optional[List[str]] = None, **kwargs: Any) -> Any:
+        return self.llm._get_ls_params(stop=stop, **kwargs)
+
+    def _bucket_size(self) -> int:
+        return self.burst or max(1, int(self.requests_per_second or 1))
+
+    def _reserve_request(self) -> float:
+        """Take a token from the bucket; returns how long to wait before using it."""
+        if not self.requests_per_second:
+            return 0.0
+        state = self._state
+        with self._lock:
+            now = time.monotonic()
+            state["tokens"] = min(self._bucket_size(), state["tokens"] + (now - state["refilled_at"]) * self.requests_per_second)
+            state["refilled_at"] = now
+            state["tokens"] -= 1
+            wait = max(0.0, -state["tokens"] / self.requests_per_second)
+            state["stats"]["throttled_seconds"] += wait
+            return wait
+
+    def _try_acquire(self) -> bool:
+        # Caller holds self._lock
+        state = self._state
+        if state["in_flight"] < max(1, int(state["limit"])):
+            state["in_flight"] += 1
+            return True
+        return False
+
+    def _wake_waiters(self) -> None:
+        # Caller holds self._lock; waiters re-check the limit when they wake up
+        state = self._state
+        state["sync_wakeup"].notify_all()
+        waiters, state["async_waiters"] = state["async_waiters"], []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(lambda waiter=waiter: waiter.done() or waiter.set_result(None))
+
+    def _acquire(self) -> None:
+        with self._lock:
+            while not self._try_acquire():
+                self._state["sync_wakeup"].wait()
+
+    async def _aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._try_acquire():
+                    return
+                waiter = loop.create_future()
+                self._state["async_waiters"].append((loop, waiter))
+            await waiter
+
+    def _release(self, error: Optional[BaseException]) -> None:
+        state = self._state
+        with self._lock:
+            state["in_flight"] -= 1
+            state["stats"]["calls"] += 1
+            if error is not None and is_rate_limit(error):
+                state["stats"]["rate_limited"] += 1
+                now = time.monotonic()
+                if self.adaptive and now - state["decreased_at"] >= self.backoff_base:
+                    state["limit"] = max(float(self.min_concurrency), state["limit"] / 2)
+                    state["decreased_at"] = now
+                    state["stats"]["lowest_limit"] = min(state["stats"]["lowest_limit"], state["limit"])
+            elif error is None and self.adaptive:
+                state["limit"] = min(float(self.max_concurrency), state["limit"] + 1 / state["limit"])
+            self._wake_waiters()
+
+    def _backoff(self, attempt: int, error: BaseException) -> Optional[float]:
+        """Seconds to sleep before retrying, or ``None`` if the error is final."""
+        if attempt >= self.max_retries or not is_retryable(error):
+            with self._lock:
+                self._state["stats"]["failed"] += 1
+            return None
+        delay = self._rng.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        with self._lock:
+            self._state["stats"]["retries"] += 1
+        return delay
+
+    @staticmethod
+    def _retry_state(attempt: int, delay: float) -> RetryCallState:
+        retry_state = RetryCallState(None, None, (), {})
+        retry_state.attempt_number = attempt + 1
+        retry_state.idle_for = delay
+        return retry_state
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        attempt = 0
+        while True:
+            time.sleep(self._reserve_request())
+            self._acquire()
+            try:
+                result = self.llm._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                self._release(e)
+                delay = self._backoff(attempt, e)
+                if delay is None:
+                    raise
+                if run_manager is not None:
+                    run_manager.on_retry(self._retry_state(attempt, delay))
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._release(None)
+            return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._reserve_request())
+            await self._aacquire()
+            try:
+                result = await self.llm._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except asyncio.CancelledError:
+                with self._lock:
+                    self._state["in_flight"] -= 1
+                    self._wake_waiters()
+                raise
+            except Exception as e:
+                self._release(e)
+                delay = self._backoff(attempt, e)
+                if delay is None:
+                    raise
+                if run_manager is not None:
+                    await run_manager.on_retry(self._retry_state(attempt, delay))
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self._release(None)
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._state["stats"], "limit": self._state["limit"]}
+
+    def summary(self) -> str:
+        stats = self.stats()
+        text = (
+            f"{stats['calls']} attempts, {stats['retries']} retries, {stats['rate_limited']} rate-limited, "
+            f"{stats['failed']} failed, {stats['throttled_seconds']:.1f}s throttled"
+        )
+        if self.adaptive:
+            text += f", concurrency {stats['limit']:.1f} (lowest {stats['lowest_limit']:.1f}, max {self.max_concurrency})"
+        return text
@@ -1,8 +1,21 @@
-import sys
+import argparse
 import importlib
 import os
-from langchain_upstage import ChatUpstage
-from improvements import adversarial_improvement
+import random
+import asyncio
+from improvements import ImprovementSettings, adversarial_improvement, aadversarial_improvement, aevaluate_models, set_verbosity
+from cache import SQLiteCache
+from budget import RunBudget, with_callbacks
+from instrumentation import Instrumentation
+from run_log import RunLog
+from limits import LimitedChatModel
+from jobs import QueuedChatModel
+from suites import JsonlSuite
+from acceptance import SequentialAcceptance
+from planner import EvaluationPlanner
+from scoring import ScoreTable
+from responses import ResponseStore
+from preflight import run_preflight
 
 def load_config(config_file):
     # Remove .py extension if present
@@ -12,42 +25,337 @@ def load_config(config_file):
     config = importlib.import_module(config_name)
     return config
 
-def main(config_file):
-    # Load the configuration
-    config = load_config(config_file)
+def setting(config, options, name, default=None):
+    # Command line options override values from the config module
+    value = getattr(options, name.lower(), None) if options is not None else None
+    return value if value is not None else getattr(config, name, default)
+
+def make_cache(config):
+    # Responses to the main prompt are cached on disk, so re-runs don't pay twice
+    cache_path = getattr(config, "CACHE_PATH", ".cache/llm_responses.sqlite")
+    return SQLiteCache(cache_path, getattr(config, "CACHE_MAX_ENTRIES", 100_000)) if cache_path else None
+
+DEFAULT_MODEL = "solar-pro"
+
+def model_names(config, options=None):
+    """The model of each role, and the models the final instruction is evaluated on."""
+    target = setting(config, options, "TARGET_MODEL", DEFAULT_MODEL)
+    roles = {
+        "target": target,
+        # Few, latency-insensitive calls: a cheaper or faster model often does
+        "optimizer": setting(config, options, "OPTIMIZER_MODEL", target),
+        "adversary": setting(config, options, "ADVERSARY_MODEL", target),
+    }
+    return roles, list(setting(config, options, "EVALUATION_MODELS", None) or [])
+
+def model_prices(config, names):
+    # Input and output price per million tokens; MODEL_PRICES overrides the config-wide price per model
+    default = (getattr(config, "PRICE_PER_MILLION_INPUT_TOKENS", None), getattr(config, "PRICE_PER_MILLION_OUTPUT_TOKENS", None))
+    prices = getattr(config, "MODEL_PRICES", None) or {}
+    return {name: tuple(prices.get(name, default)) for name in names if name in prices or None not in default}
+
+def scheduler_settings(config, options=None):
+    """How a model's calls are scheduled: through a job queue, or by its client-side scheduler."""
+    return {
+        "job_queue": setting(config, options, "JOB_QUEUE"),
+        "max_in_flight": setting(config, options, "MAX_IN_FLIGHT", 16),
+        "adaptive_concurrency": setting(config, options, "ADAPTIVE_CONCURRENCY", True),
+        "requests_per_second": setting(config, options, "REQUESTS_PER_SECOND"),
+        "max_retries": setting(config, options, "MAX_RETRIES", 3),
+    }
+
+def make_llm(config, options=None, use_queue=True, model_name=None):
+    model_name = model_name or setting(config, options, "TARGET_MODEL", DEFAULT_MODEL)
+    scheduler = scheduler_settings(config, options)
+
+    # With a job queue, calls are answered by worker.py processes instead
+    if use_queue and scheduler["job_queue"]:
+        return QueuedChatModel(queue_path=scheduler["job_queue"], model_name=model_name)
+
+    # Imported here, so config checks and dry runs start without loading the provider SDK
+    from langchain_upstage import ChatUpstage
+
+    # Rate limit, retries with backoff and adaptive concurrency around the provider client
+    return LimitedChatModel(
+        llm=ChatUpstage(model_name=model_name),
+        max_concurrency=scheduler["max_in_flight"],
+        adaptive=scheduler["adaptive_concurrency"],
+        requests_per_second=scheduler["requests_per_second"],
+        max_retries=scheduler["max_retries"]
+    )
+
+def make_models(names, config, options=None, models=None):
+    """Add a model for each of ``names`` to ``models`` (a dict by model name) and return it.
+
+    Each model name gets one client and scheduler, shared by every role and
+    run that uses it.
+    """
+    models = {} if models is None else models
+    for name in names:
+        if name not in models:
+            models[name] = make_llm(config, options, model_name=name)
+    return models
+
+def with_suffix(path, suffix):
+    if not path or not suffix:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}{suffix}{ext}"
+
+def make_acceptance(config):
+    # Optional: accept instruction changes only when they are significantly better
+    if not getattr(config, "SEQUENTIAL_ACCEPTANCE", False):
+        return None
+    return SequentialAcceptance(
+        alpha=getattr(config, "ACCEPTANCE_ALPHA", 0.05),
+        max_rounds=getattr(config, "ACCEPTANCE_MAX_ROUNDS", 3),
+        round_size=getattr(config, "ACCEPTANCE_ROUND_SIZE", 16)
+    )
+
+def working_set(config, suite, suite_seed):
+    test_cases = getattr(config, "SAMPLE_TEST_CASES", None)
+    if test_cases is None and suite is not None:
+        # No hand-written cases: start the adversarial set from a sample of the suite
+        test_cases = suite.minibatch(getattr(config, "WORKING_SET_SIZE", 5), suite_seed, 0)
+    return test_cases
+
+def check_config(config_file, config, options=None):
+    """Validate a config's prompts and test cases and estimate its cost, without any model call."""
+    suite_file = getattr(config, "TEST_SUITE_FILE", None)
+    suite = JsonlSuite(suite_file) if suite_file and os.path.exists(suite_file) else None
+    seed = getattr(config, "SEED", None)
+    try:
+        preflight = run_preflight(
+            config_file,
+            config.MAIN_PROMPT,
+            config.INITIAL_INSTRUCTION,
+            working_set(config, suite, seed if seed is not None else 0),
+            config.INSTRUCTION_IMPROVEMENT_PROMPT,
+            config.TEST_CASE_IMPROVEMENT_PROMPT,
+            suite=suite,
+            max_iterations=setting(config, options, "MAX_ITERATIONS", 100),
+            num_candidates=getattr(config, "NUM_CANDIDATES", 1),
+            num_test_candidates=getattr(config, "NUM_TEST_CANDIDATES", 1),
+            minibatch_size=getattr(config, "MINIBATCH_SIZE", 32),
+            confirm_every=getattr(config, "CONFIRM_EVERY", 10),
+            acceptance=make_acceptance(config),
+            max_calls=setting(config, options, "MAX_CALLS"),
+            max_tokens=setting(config, options, "MAX_TOKENS"),
+            test_case_tokens=getattr(config, "TEST_CASE_TOKENS", None),
+            evaluation_models=len(model_names(config, options)[1])
+        )
+    finally:
+        if suite is not None:
+            suite.close()
+    if suite_file and suite is None:
+        preflight.errors.append(f"TEST_SUITE_FILE {suite_file!r} does not exist")
+    return preflight
+
+def preflight_report(config_file, config, options=None):
+    """Print the config check; returns False if the config must not run."""
+    preflight = check_config(config_file, config, options)
+    if getattr(options, "dry_run", False) or preflight.errors:
+        roles, evaluation = model_names(config, options)
+        prices = model_prices(config, [*roles.values(), *evaluation])
+        role_prices = {role: prices[name] for role, name in roles.items() if name in prices}
+        if evaluation and all(name in prices for name in evaluation):
+            # Final evaluation calls are split evenly between the models
+            role_prices["evaluation"] = tuple(sum(prices[name][i] for name in evaluation) / len(evaluation) for i in range(2))
+        print(preflight.report(role_prices))
+    else:
+        for warning in preflight.warnings:
+            print(f"Warning: {config_file}: {warning}")
+    return not preflight.errors
+
+def prepare_run(config_file, options, models, cache, seed=None, config=None, results_dir="results"):
+    """Arguments and output files for one improvement run of a config.
+
+    ``models`` holds a model for each model name the config uses (see
+    ``make_models``). With ``seed`` set, it replaces the config's SEED and every output file
+    gets a ``_seed<N>`` suffix, so several seeds of one config can run side
+    by side. An already loaded ``config`` is used as is; ``config_file`` then
+    only names the run's output files. Files the config does not name go to
+    ``results_dir``.
+    """
+    if config is None:
+        config = load_config(config_file)
+    suffix = f"_seed{seed}" if seed is not None else ""
 
     # results will be in results directory. Create it if it doesn't exist
-    results_dir = 'results'
     if not os.path.exists(results_dir):
         os.makedirs(results_dir)
 
     # Create output filename based on config filename
-    output_filename = f"{results_dir}/{os.path.splitext(config_file)[0]}_results.txt"
+    run_name = os.path.splitext(os.path.basename(config_file))[0] + suffix
+    output_filename = f"{results_dir}/{run_name}_results.txt"
 
-    llm = ChatUpstage(model_name="solar-pro")
+    # A fixed seed makes test case replacement reproducible
+    if seed is None:
+        seed = getattr(config, "SEED", None)
+    rng = random.Random(seed) if seed is not None else None
 
-    final_instruction, final_test_cases = adversarial_improvement(
-        llm,
+    # A large JSONL suite is sampled every iteration and confirms instructions in full
+    suite_file = getattr(config, "TEST_SUITE_FILE", None)
+    suite = JsonlSuite(suite_file) if suite_file else None
+    suite_seed = seed if seed is not None else 0
+    test_cases = working_set(config, suite, suite_seed)
+    roles, evaluation = model_names(config, options)
+
+    args = (
+        models[roles["target"]],
         config.MAIN_PROMPT,
         config.INITIAL_INSTRUCTION,
-        config.SAMPLE_TEST_CASES,
+        test_cases,
         config.INSTRUCTION_IMPROVEMENT_PROMPT,
         config.TEST_CASE_IMPROVEMENT_PROMPT,
-        log_file_path=output_filename
     )
+    budget = RunBudget(
+        plateau_iterations=setting(config, options, "PLATEAU_ITERATIONS"),
+        max_seconds=setting(config, options, "MAX_SECONDS"),
+        max_calls=setting(config, options, "MAX_CALLS"),
+        max_tokens=setting(config, options, "MAX_TOKENS")
+    )
+
+    # The loop state is saved after every iteration; --resume continues from it
+    checkpoint_path = with_suffix(getattr(config, "CHECKPOINT_FILE", None), suffix) or f"{results_dir}/{run_name}_checkpoint.json"
+
+    # Structured event log; rebuild any iteration with `python run_log.py`
+    run_log = RunLog(with_suffix(getattr(config, "RUN_LOG_FILE", None), suffix) or f"{results_dir}/{run_name}_events.jsonl")
+
+    # Every scored response with its prompt, for offline re-scoring with `python responses.py`
+    responses = ResponseStore(with_suffix(getattr(config, "RESPONSE_STORE", None), suffix) or f"{results_dir}/{run_name}_responses.sqlite")
+
+    # Per-call latency, token and retry metrics, tagged with the loop phase
+    instrumentation = Instrumentation(with_suffix(setting(config, options, "TRACE_FILE"), suffix), model_prices(config, [*roles.values(), *evaluation]))
+
+    # Optional: stop paying for test cases that score the same for every instruction
+    planner = None
+    if getattr(config, "TEST_SELECTION", False):
+        planner = EvaluationPlanner(
+            window=getattr(config, "SATURATION_WINDOW", 3),
+            recheck_every=getattr(config, "RECHECK_EVERY", 5)
+        )
+
+    settings = ImprovementSettings(
+        max_iterations=setting(config, options, "MAX_ITERATIONS", 100),
+        log_file_path=output_filename,
+        max_concurrency=getattr(config, "MAX_CONCURRENCY", 1),
+        cache=cache,
+        score_table=ScoreTable(planner, responses),
+        rng=rng,
+        num_candidates=getattr(config, "NUM_CANDIDATES", 1),
+        population_size=getattr(config, "POPULATION_SIZE", 1),
+        bounded=getattr(config, "BOUNDED_EVALUATION", False),
+        budget=budget,
+        instrumentation=instrumentation,
+        checkpoint_path=checkpoint_path,
+        resume=bool(getattr(options, "resume", False)),
+        run_log=run_log,
+        num_test_candidates=getattr(config, "NUM_TEST_CANDIDATES", 1),
+        suite=suite,
+        minibatch_size=getattr(config, "MINIBATCH_SIZE", 32),
+        confirm_every=getattr(config, "CONFIRM_EVERY", 10),
+        suite_seed=suite_seed,
+        acceptance=make_acceptance(config),
+        test_case_tokens=getattr(config, "TEST_CASE_TOKENS", None),
+        optimizer_llm=models[roles["optimizer"]],
+        adversary_llm=models[roles["adversary"]]
+    )
+    return {
+        "name": run_name,
+        "args": args,
+        "settings": settings,
+        "use_async": getattr(config, "USE_ASYNC", False),
+        "output_filename": output_filename,
+        "metrics_file": with_suffix(setting(config, options, "METRICS_FILE"), suffix),
+        "evaluation_llms": {name: models[name] for name in evaluation},
+    }
+
+async def aevaluate_final(run, instruction, test_cases):
+    """Score the final instruction on every EVALUATION_MODELS model concurrently and add the scores to the results file."""
+    if not run["evaluation_llms"]:
+        return None
+    settings = run["settings"]
+    llms = {name: with_callbacks(llm, settings.instrumentation) for name, llm in run["evaluation_llms"].items()}
+    scores = await aevaluate_models(instruction, test_cases, llms, run["args"][1], settings.max_concurrency, settings.cache)
+
+    max_score = sum(len(test_case["expected"]) for test_case in test_cases)
+    lines = [f"Final evaluation on {len(scores)} models:"] + [f"  {name}: {score}/{max_score}" for name, score in scores.items()]
+    print("\n".join(lines))
+    with open(run["output_filename"], "a") as results_file:
+        results_file.write("\n" + "\n".join(lines) + "\n")
+    return scores
+
+def finish_run(run):
+    settings = run["settings"]
+    instrumentation = settings.instrumentation
+    print(f"\nLLM calls by role ({run['name']}):\n{instrumentation.role_table()}")
+    instrumentation.close()
+    settings.run_log.close()
+    settings.score_table.responses.close()
+    if settings.suite is not None:
+        settings.suite.close()
+
+    metrics_file = run["metrics_file"]
+    if metrics_file:
+        instrumentation.write_prometheus(metrics_file)
+        print(f"Metrics saved to: {metrics_file}")
+
+def main(config_file, options=None):
+    # Load the configuration
+    config = load_config(config_file)
+
+    set_verbosity(setting(config, options, "VERBOSITY", 2))
+
+    # Catch broken configs before the first paid call
+    if not preflight_report(config_file, config, options):
+        raise SystemExit(f"{config_file} has errors; fix them before running")
+    if getattr(options, "dry_run", False):
+        return
+
+    roles, evaluation = model_names(config, options)
+    models = make_models([*roles.values(), *evaluation], config, options)
+
+    run = prepare_run(config_file, options, models, make_cache(config))
+    if run["use_async"]:
+        final_instruction, final_test_cases = asyncio.run(aadversarial_improvement(*run["args"], settings=run["settings"]))
+    else:
+        final_instruction, final_test_cases = adversarial_improvement(*run["args"], settings=run["settings"])
+    asyncio.run(aevaluate_final(run, final_instruction, final_test_cases))
+    finish_run(run)
 
     #Optionally, you can also print the results to the console
     print("Final improved instruction:", final_instruction)
     print("Final improved test cases:", final_test_cases)
 
-    print(f"Final improved instruction saved to: {output_filename}")
-    print(f"Final improved test cases saved to: {output_filename}")
+    print(f"Final improved instruction saved to: {run['output_filename']}")
+    print(f"Final improved test cases saved to: {run['output_filename']}")
 
    
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Adversarially improve a prompt instruction and its test cases.")
+    parser.add_argument("config_file", help="config module, e.g. qa_config.py")
+    parser.add_argument("--max-iterations", type=int, help="maximum number of iterations (default 100)")
+    parser.add_argument("--plateau-iterations", type=int, help="stop after this many iterations without any change")
+    parser.add_argument("--max-seconds", type=float, help="stop after this much wall-clock time")
+    parser.add_argument("--max-calls", type=int, help="stop after this many paid LLM calls")
+    parser.add_argument("--max-tokens", type=int, help="stop after this many LLM tokens")
+    parser.add_argument("--trace-file", help="append a JSONL record for every LLM call to this file")
+    parser.add_argument("--metrics-file", help="write Prometheus-style metrics to this file at the end of the run")
+    parser.add_argument("--requests-per-second", type=float, help="client-side rate limit for LLM calls")
+    parser.add_argument("--max-retries", type=int, help="retries for rate-limited, timed out or failed (5xx) calls (default 3)")
+    parser.add_argument("--max-in-flight", type=int, help="upper limit on LLM calls in flight (default 16)")
+    parser.add_argument("--adaptive-concurrency", action=argparse.BooleanOptionalAction, help="halve the calls in flight on a 429 and grow them back on success (default on)")
+    parser.add_argument("--verbosity", type=int, choices=[0, 1, 2], help="0: progress only, 1: scores and decisions, 2: every model response (default)")
+    parser.add_argument("--target-model", help="model whose instruction is improved and that answers the test cases (default solar-pro)")
+    parser.add_argument("--optimizer-model", help="model that rewrites the instruction (default: the target model)")
+    parser.add_argument("--adversary-model", help="model that writes new test cases (default: the target model)")
+    parser.add_argument("--evaluation-models", nargs="+", help="also score the final instruction on these models, concurrently")
+    parser.add_argument("--job-queue", help="SQLite job queue; model calls are answered by worker.py processes")
+    parser.add_argument("--resume", action="store_true", help="continue from the last checkpoint of this config")
+    parser.add_argument("--dry-run", action="store_true", help="check the config and estimate calls and tokens, without any model call")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python main.py <config_file>")
-        sys.exit(1)
-    
-    config_file = sys.argv[1]
-    main(config_file)
\ No newline at end of file
+    options = parse_args()
+    main(options.config_file, options)
@@ -0,0 +1,80 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from scoring import ScoreTable
+
+# Rough size of a token; close enough for a budget without a provider tokenizer
+CHARS_PER_TOKEN = 4
+# Long text fields (contexts, page contents) are cut to this many characters
+FIELD_CHARS = 600
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _shorten(value: Any, field_chars: int) -> Any:
+    if isinstance(value, str) and len(value) > field_chars:
+        return value[:field_chars] + "..."
+    if isinstance(value, list):
+        return [_shorten(item, field_chars) for item in value]
+    return value
+
+
+def compact_test_case(test_case: Dict[str, Any], field_chars: int = FIELD_CHARS) -> str:
+    """One-line JSON for a test case, with long text fields cut short."""
+    return json.dumps({key: _shorten(value, field_chars) for key, value in test_case.items()}, ensure_ascii=False)
+
+
+def _annotation(test_case: Dict[str, Any], score: Optional[int], keywords: Optional[Tuple[List[str], List[str]]]) -> str:
+    if score is None:
+        return "not scored yet"
+    notes = [f"score {score}/{len(test_case['expected'])}"]
+    if keywords is not None:
+        missed, found = keywords
+        if missed:
+            notes.append("missed " + ", ".join(json.dumps(keyword, ensure_ascii=False) for keyword in missed))
+        if found:
+            notes.append("contains unexpected " + ", ".join(json.dumps(keyword, ensure_ascii=False) for keyword in found))
+    return "; ".join(notes)
+
+
+def rank_test_cases(instruction: str, test_cases: List[Dict[str, Any]], score_table: Optional[ScoreTable]) -> List[int]:
+    """Test case indices, most informative first.
+
+    A case is more informative the further its score under ``instruction``
+    is below the best possible score. Unscored cases come last; ties keep
+    their order in ``test_cases``.
+    """
+    def shortfall(index: int) -> int:
+        score = score_table.peek(instruction, test_cases[index]) if score_table is not None else None
+        return -1 if score is None else len(test_cases[index]["expected"]) - score
+
+    return sorted(range(len(test_cases)), key=lambda index: -shortfall(index))
+
+
+def pack_test_cases(instruction: str, test_cases: List[Dict[str, Any]], score_table: Optional[ScoreTable] = None, max_tokens: Optional[int] = None, field_chars: int = FIELD_CHARS) -> Tuple[str, int]:
+    """Test cases for an improvement prompt, most informative first, within ``max_tokens``.
+
+    Each case is one line: its score under ``instruction`` with the
+    expected keywords the response missed and the unexpected ones it
+    contained, then the case as compact JSON. Cases that do not fit are
+    counted at the end. Returns the text and the number of cases included.
+    """
+    lines = []
+    used = 0
+    for index in rank_test_cases(instruction, test_cases, score_table):
+        test_case = test_cases[index]
+        score = score_table.peek(instruction, test_case) if score_table is not None else None
+        keywords = score_table.keywords(instruction, test_case) if score_table is not None else None
+        line = f"- [{_annotation(test_case, score, keywords)}] {compact_test_case(test_case, field_chars)}"
+        tokens = estimate_tokens(line)
+        if max_tokens is not None and lines and used + tokens > max_tokens:
+            break
+        lines.append(line)
+        used += tokens
+
+    included = len(lines)
+    if included < len(test_cases):
+        lines.append(f"- ({len(test_cases) - included} more test cases left out to save space)")
+    return "\n".join(lines), included
@@ -0,0 +1,148 @@
+import ast
+import io
+import json
+import re
+import tokenize
+from typing import Any, Dict, List, Sequence
+
+from langchain_core.prompts import ChatPromptTemplate
+
+FENCE = re.compile(r"```[a-zA-Z]*\s*(.*?)```", re.DOTALL)
+
+REPAIR_REQUEST = (
+    "That test case could not be used: {error}\n"
+    "Reply with only the corrected test case: a single JSON object with the keys {keys}. "
+    "No comments, no markdown, no other text."
+)
+
+MULTI_TEST_CASE_REQUEST = (
+    "Instead of 1, create {count} different new test cases, each in the format above. "
+    "Output them as a JSON list of {count} objects and nothing else."
+)
+
+MULTI_REPAIR_REQUEST = (
+    "Those test cases could not be used: {error}\n"
+    "Reply with only the corrected test cases: a JSON list of objects with the keys {keys}. "
+    "No comments, no markdown, no other text."
+)
+
+
+class TestCaseError(ValueError):
+    """Generated text that is not a usable test case."""
+
+
+def required_test_case_keys(main_prompt: ChatPromptTemplate) -> List[str]:
+    """Keys a test case needs to be run against ``main_prompt`` and scored."""
+    variables = [var for var in main_prompt.input_variables if var != "instruction"]
+    return ["name", *variables, "expected", "unexpected"]
+
+
+def _strip_comments(text: str) -> str:
+    # Drop "# ..." comments (the prompt's own format has "# Optional"), but not '#' inside strings
+    try:
+        tokens = [token for token in tokenize.generate_tokens(io.StringIO(text).readline) if token.type != tokenize.COMMENT]
+        return tokenize.untokenize(tokens)
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return text
+
+
+_VALUE_END = {tokenize.STRING, tokenize.NUMBER, tokenize.NAME}
+_SKIPPED = {tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT, tokenize.ENDMARKER}
+
+
+def _add_missing_commas(text: str) -> str:
+    # Once its "# Optional" comments are gone, the prompt's own format lacks the comma that
+    # followed them; add one where a line ends a value and the next line starts another
+    try:
+        tokens = [token for token in tokenize.generate_tokens(io.StringIO(text).readline) if token.type not in _SKIPPED]
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return text
+    line_starts = [0]
+    for line in text.splitlines(keepends=True):
+        line_starts.append(line_starts[-1] + len(line))
+    commas = []
+    for previous, token in zip(tokens, tokens[1:]):
+        ends_value = previous.type in _VALUE_END or previous.string in ("}", "]")
+        starts_value = token.type in _VALUE_END or token.string in ("{", "[")
+        if token.start[0] > previous.end[0] and ends_value and starts_value:
+            commas.append(line_starts[previous.end[0] - 1] + previous.end[1])
+    for offset in reversed(commas):
+        text = text[:offset] + "," + text[offset:]
+    return text
+
+
+def _literal_text(text: str, opener: str, closer: str) -> str:
+    fenced = FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    start, end = text.find(opener), text.rfind(closer)
+    if start == -1 or end < start:
+        raise TestCaseError(f"no {opener}...{closer} found in the reply")
+    return text[start:end + 1]
+
+
+def _load_literal(text: str, opener: str = "{", closer: str = "}") -> Any:
+    """Parse JSON, falling back to a Python literal. Nothing is ever executed."""
+    candidate = _literal_text(text, opener, closer)
+    for source in (candidate, _strip_comments(candidate), _add_missing_commas(_strip_comments(candidate))):
+        try:
+            return json.loads(source)
+        except ValueError:
+            pass
+        try:
+            return ast.literal_eval(source)
+        except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+            pass
+    raise TestCaseError("the reply is neither valid JSON nor a Python literal")
+
+
+def validate_test_case(test_case: Any, required_keys: Sequence[str]) -> Dict[str, Any]:
+    if not isinstance(test_case, dict):
+        raise TestCaseError(f"expected an object, got {type(test_case).__name__}")
+    missing = [key for key in required_keys if key not in test_case]
+    if missing:
+        raise TestCaseError(f"missing keys: {', '.join(missing)}")
+    if not isinstance(test_case["name"], str):
+        raise TestCaseError("'name' must be a string")
+    for key in ("expected", "unexpected"):
+        keywords = test_case[key]
+        if not isinstance(keywords, list) or not all(isinstance(keyword, str) and keyword for keyword in keywords):
+            raise TestCaseError(f"'{key}' must be a list of non-empty strings")
+    if not test_case["expected"] and not test_case["unexpected"]:
+        raise TestCaseError("'expected' and 'unexpected' are both empty")
+    return test_case
+
+
+def parse_test_case(text: str, required_keys: Sequence[str]) -> Dict[str, Any]:
+    """Parse and check one generated test case.
+
+    Tolerates markdown fences, text around the object, ``# comments``, a
+    missing comma at the end of a line and Python literals (single quotes,
+    trailing commas, True/None). Raises
+    ``TestCaseError`` with a short reason that can be sent back to the model.
+    """
+    return validate_test_case(_load_literal(text), required_keys)
+
+
+def parse_test_cases(text: str, required_keys: Sequence[str]) -> List[Dict[str, Any]]:
+    """Parse a list of generated test cases, dropping unusable entries.
+
+    A reply holding a single object counts as a list of one. Raises
+    ``TestCaseError`` if no entry is usable.
+    """
+    try:
+        test_cases = _load_literal(text, "[", "]")
+    except TestCaseError:
+        test_cases = None
+    if not isinstance(test_cases, list) or not all(isinstance(test_case, dict) for test_case in test_cases):
+        return [parse_test_case(text, required_keys)]
+
+    usable, errors = [], []
+    for i, test_case in enumerate(test_cases):
+        try:
+            usable.append(validate_test_case(test_case, required_keys))
+        except TestCaseError as e:
+            errors.append(f"test case {i + 1}: {e}")
+    if not usable:
+        raise TestCaseError("; ".join(errors) or "the list is empty")
+    return usable
@@ -0,0 +1,74 @@
+import hashlib
+import itertools
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class EvaluationPlanner:
+    """Skips test cases whose score no longer depends on the instruction.
+
+    Keeps every test case's score under each instruction it was evaluated
+    with. Once the last ``window`` of them are all equal the case is
+    saturated (or constant): new instructions reuse that score instead of
+    calling the model. About one instruction in ``recheck_every`` still runs
+    the case, which ends the saturation if the score changes.
+
+    Which instructions re-check a case is fixed by a hash, and an instruction
+    seen again is not observed twice, so decisions do not depend on the order
+    in which concurrent steps report their scores.
+    """
+
+    def __init__(self, window: int = 3, recheck_every: int = 5):
+        self.window = window
+        self.recheck_every = recheck_every
+        self._history: Dict[str, Dict[str, int]] = {}
+        # (test case key, instruction) in observation order, for rollback and checkpoints
+        self._journal: List[Tuple[str, str]] = []
+        self.skipped = 0
+        self.rechecked = 0
+
+    def saturated(self, key: str) -> bool:
+        latest = list(itertools.islice(reversed(self._history.get(key, {}).values()), self.window))
+        return len(latest) >= self.window and len(set(latest)) == 1
+
+    def skip(self, key: str, instruction: str) -> Optional[int]:
+        """The score to reuse for this cell, or ``None`` to evaluate it."""
+        if not self.saturated(key):
+            return None
+        digest = hashlib.sha1(f"{instruction}\0{key}".encode("utf-8")).digest()
+        if int.from_bytes(digest[:4], "big") % self.recheck_every == 0:
+            self.rechecked += 1
+            return None
+        self.skipped += 1
+        return next(reversed(self._history[key].values()))
+
+    def observe(self, key: str, instruction: str, score: int) -> None:
+        scores = self._history.setdefault(key, {})
+        if instruction not in scores:
+            scores[instruction] = score
+            self._journal.append((key, instruction))
+
+    def mark(self) -> int:
+        return len(self._journal)
+
+    def rollback(self, mark: int) -> None:
+        """Forget the observations made since ``mark``, e.g. by cancelled speculative work."""
+        for key, instruction in self._journal[mark:]:
+            del self._history[key][instruction]
+        del self._journal[mark:]
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "observations": [[key, instruction, self._history[key][instruction]] for key, instruction in self._journal],
+            "skipped": self.skipped,
+            "rechecked": self.rechecked,
+        }
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        for key, instruction, score in state["observations"]:
+            self.observe(key, instruction, score)
+        self.skipped = state["skipped"]
+        self.rechecked = state["rechecked"]
+
+    def summary(self) -> str:
+        saturated = sum(1 for key in self._history if self.saturated(key))
+        return f"{self.skipped} model calls skipped, {self.rechecked} re-checks, {saturated}/{len(self._history)} test cases saturated"
@@ -0,0 +1,196 @@
+import itertools
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from acceptance import SequentialAcceptance
+from improvements import instruction_improvement_inputs, test_case_improvement_inputs
+from instrumentation import phase_role
+from packing import estimate_tokens
+from suites import JsonlSuite
+
+# The main prompt's responses are not known before the run; assume answers of about this length
+TARGET_OUTPUT_TOKENS = 200
+TEST_CASE_KEYS = ("name", "expected", "unexpected")
+# Per-test-case problems listed before the rest are only counted
+MAX_LISTED_PROBLEMS = 10
+
+
+def _messages_text(messages: List[Any]) -> str:
+    return "\n".join(str(message.content) for message in messages)
+
+
+class Preflight:
+    """Problems found in a config before any paid call, and what a run would cost.
+
+    Errors (a prompt variable no test case provides, a prompt that does not
+    render) make the run pointless; warnings (test case keys that never
+    reach the model) are worth a look. The estimate assumes no response
+    cache hits and a changed instruction in every iteration, so it is an
+    upper bound for most runs.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.errors: List[str] = []
+        self.warnings: List[str] = []
+        self.notes: List[str] = []
+        self.estimate: Dict[str, List[int]] = {}
+
+    def add(self, phase: str, calls: int, input_tokens: int, output_tokens: int) -> None:
+        """Add ``calls`` calls of ``input_tokens`` and ``output_tokens`` tokens each."""
+        row = self.estimate.setdefault(phase, [0, 0, 0])
+        row[0] += calls
+        row[1] += calls * input_tokens
+        row[2] += calls * output_tokens
+
+    def totals(self) -> List[int]:
+        return [sum(row[column] for row in self.estimate.values()) for column in range(3)]
+
+    def report(self, prices: Optional[Dict[str, Tuple[float, float]]] = None) -> str:
+        """The check's findings and estimate; ``prices`` are per million input and output tokens, by model role."""
+        lines = [f"Pre-flight check of {self.name}"]
+        lines += [f"  {note}" for note in self.notes]
+        lines += [f"  warning: {warning}" for warning in self.warnings]
+        lines += [f"  error: {error}" for error in self.errors]
+        if not self.estimate:
+            return "\n".join(lines)
+
+        lines.append(f"\n{'phase':<12}{'calls':>8}{'input tokens':>15}{'output tokens':>15}")
+        for phase, (calls, input_tokens, output_tokens) in self.estimate.items():
+            lines.append(f"{phase:<12}{calls:>8}{input_tokens:>15}{output_tokens:>15}")
+        calls, input_tokens, output_tokens = self.totals()
+        lines.append(f"{'total':<12}{calls:>8}{input_tokens:>15}{output_tokens:>15}")
+        if prices:
+            cost = 0.0
+            for phase, (_, phase_input, phase_output) in self.estimate.items():
+                input_price, output_price = prices.get(phase_role(phase), (0.0, 0.0))
+                cost += (phase_input * input_price + phase_output * output_price) / 1_000_000
+            line = f"Estimated cost: {cost:.2f}"
+            unpriced = sorted({phase_role(phase) for phase in self.estimate} - set(prices))
+            if unpriced:
+                line += f" (no price for the {', '.join(unpriced)} model)"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+def check_test_cases(preflight: Preflight, main_prompt: ChatPromptTemplate, test_cases: Iterable[Any], source: str) -> None:
+    variables = [var for var in main_prompt.input_variables if var != "instruction"]
+    problems: List[str] = []
+    missing: Dict[str, List[str]] = {}
+    unused: Dict[str, int] = {}
+    total = 0
+    for index, test_case in enumerate(test_cases):
+        total += 1
+        label = f"{source} test case {index + 1}"
+        if not isinstance(test_case, dict):
+            problems.append(f"{label} is a {type(test_case).__name__}, not a dict")
+            continue
+        label = f"{label} ({test_case.get('name', 'unnamed')!r})"
+        for key in TEST_CASE_KEYS:
+            if key not in test_case:
+                problems.append(f"{label} has no {key!r}")
+        for key in ("expected", "unexpected"):
+            keywords = test_case.get(key, [])
+            if not isinstance(keywords, list) or not all(isinstance(keyword, str) for keyword in keywords):
+                problems.append(f"{label}: {key!r} must be a list of strings")
+        for var in variables:
+            if var not in test_case:
+                missing.setdefault(var, []).append(str(test_case.get("name", index + 1)))
+        for key in test_case:
+            if key not in variables and key not in TEST_CASE_KEYS:
+                unused[key] = unused.get(key, 0) + 1
+
+    preflight.errors += problems[:MAX_LISTED_PROBLEMS]
+    if len(problems) > MAX_LISTED_PROBLEMS:
+        preflight.errors.append(f"... and {len(problems) - MAX_LISTED_PROBLEMS} more problems in {source} test cases")
+    # Missing variables are rendered as empty strings, which silently wastes every call
+    for var, names in missing.items():
+        preflight.errors.append(f"{len(names)} of {total} {source} test cases lack {{{var}}}, which MAIN_PROMPT expects (e.g. {names[0]!r})")
+    for key, count in unused.items():
+        preflight.warnings.append(f"{key!r} in {count} {source} test cases is not a MAIN_PROMPT variable and never reaches the model")
+
+
+def _render(preflight: Preflight, prompt_name: str, prompt: ChatPromptTemplate, inputs: Dict[str, Any]) -> str:
+    missing = [var for var in prompt.input_variables if var not in inputs]
+    if missing:
+        preflight.errors.append(f"{prompt_name} expects {', '.join('{' + var + '}' for var in missing)}, which the loop does not provide (it provides {', '.join(sorted(inputs))})")
+        return ""
+    try:
+        return _messages_text(prompt.format_messages(**inputs))
+    except Exception as e:
+        preflight.errors.append(f"{prompt_name} does not render: {type(e).__name__}: {e}")
+        return ""
+
+
+def run_preflight(
+    name: str,
+    main_prompt: ChatPromptTemplate,
+    instruction: str,
+    test_cases: Optional[List[Dict[str, Any]]],
+    instruction_improvement_prompt: ChatPromptTemplate,
+    test_case_improvement_prompt: ChatPromptTemplate,
+    suite: Optional[JsonlSuite] = None,
+    max_iterations: int = 100,
+    num_candidates: int = 1,
+    num_test_candidates: int = 1,
+    minibatch_size: int = 32,
+    confirm_every: int = 10,
+    acceptance: Optional[SequentialAcceptance] = None,
+    max_calls: Optional[int] = None,
+    max_tokens: Optional[int] = None,
+    test_case_tokens: Optional[int] = None,
+    evaluation_models: int = 0
+) -> Preflight:
+    """Check a config's prompts and test cases, render every prompt locally and estimate the run's calls and tokens."""
+    preflight = Preflight(name)
+    if "instruction" not in main_prompt.input_variables:
+        preflight.errors.append("MAIN_PROMPT has no {instruction} variable, so instruction changes never reach the model")
+    if not test_cases:
+        preflight.errors.append("no test cases: set SAMPLE_TEST_CASES or TEST_SUITE_FILE")
+        return preflight
+
+    check_test_cases(preflight, main_prompt, test_cases, "working set")
+    if suite is not None:
+        check_test_cases(preflight, main_prompt, itertools.chain.from_iterable(suite.batches()), "suite")
+    if preflight.errors:
+        return preflight
+    preflight.notes.append(f"{len(test_cases)} test cases{f', suite of {len(suite)}' if suite is not None else ''}; MAIN_PROMPT variables: {', '.join(main_prompt.input_variables)}")
+
+    # Render every prompt the first iteration sends, with the inputs the loop would pass
+    target_inputs = [estimate_tokens(_messages_text(main_prompt.format_messages(
+        **{**{var: test_case.get(var, "") for var in main_prompt.input_variables}, "instruction": instruction}
+    ))) for test_case in test_cases]
+    optimizer_prompt = _render(preflight, "INSTRUCTION_IMPROVEMENT_PROMPT", instruction_improvement_prompt, instruction_improvement_inputs(instruction, test_cases, 0, main_prompt, test_case_tokens=test_case_tokens))
+    adversary_prompt = _render(preflight, "TEST_CASE_IMPROVEMENT_PROMPT", test_case_improvement_prompt, test_case_improvement_inputs(instruction, test_cases, 0, main_prompt, test_case_tokens=test_case_tokens))
+    if preflight.errors:
+        return preflight
+
+    working_set = len(test_cases)
+    target_input = sum(target_inputs) // working_set
+    test_case_tokens = sum(estimate_tokens(str(test_case)) for test_case in test_cases) // working_set
+    # Only the initial instruction needs a baseline; later instructions and added test cases are scored as candidates
+    preflight.add("baseline", working_set, target_input, TARGET_OUTPUT_TOKENS)
+    preflight.add("optimizer", max_iterations * num_candidates, estimate_tokens(optimizer_prompt), estimate_tokens(instruction))
+    preflight.add("candidate", max_iterations * num_candidates * working_set, target_input, TARGET_OUTPUT_TOKENS)
+    preflight.add("adversary", max_iterations, estimate_tokens(adversary_prompt), num_test_candidates * test_case_tokens)
+    preflight.add("re-score", max_iterations * num_test_candidates, target_input, TARGET_OUTPUT_TOKENS)
+    if acceptance is not None:
+        samples = min(acceptance.round_size, len(suite)) if suite is not None else working_set
+        preflight.add("acceptance", max_iterations * acceptance.max_rounds * samples * 2, target_input, TARGET_OUTPUT_TOKENS)
+    if suite is not None:
+        preflight.add("minibatch", max_iterations * min(minibatch_size, len(suite)) * 2, target_input, TARGET_OUTPUT_TOKENS)
+        confirmations = (max_iterations // confirm_every if confirm_every else 0) + 1
+        # Both instructions on the first confirmation, then only the new one
+        preflight.add("confirm", (confirmations + 1) * len(suite), target_input, TARGET_OUTPUT_TOKENS)
+
+    if evaluation_models:
+        preflight.add("final", evaluation_models * working_set, target_input, TARGET_OUTPUT_TOKENS)
+
+    calls, input_tokens, output_tokens = preflight.totals()
+    preflight.notes.append(f"estimate for {max_iterations} iterations, assuming no cache hits and ~{TARGET_OUTPUT_TOKENS} tokens per answer")
+    if max_calls is not None and calls > max_calls:
+        preflight.notes.append(f"the run will stop at --max-calls {max_calls}")
+    if max_tokens is not None and input_tokens + output_tokens > max_tokens:
+        preflight.notes.append(f"the run will stop at --max-tokens {max_tokens}")
+    return preflight
@@ -0,0 +1,304 @@
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, messages_to_dict
+
+from scoring import ScoringEngine, normalize_instruction, test_case_key
+
+
+def instruction_key(instruction: str) -> str:
+    return hashlib.sha1(normalize_instruction(instruction).encode("utf-8")).hexdigest()
+
+
+class ResponseStore:
+    """Every scored model response of a run, in a SQLite database.
+
+    Each response is stored with the rendered prompt messages, the
+    instruction, the test case ID (``test_case_key``) and the score it got.
+    The store also holds the loop's selection decisions (which of several
+    scored options it kept) and the state after every iteration, so
+    ``rescore_store`` can replay the run under other keywords or scoring
+    functions without any model call.
+
+    Decisions are buffered per step (``"instruction"`` or ``"test_cases"``)
+    until the loop ``commit``s them to an iteration; speculative steps that
+    are cancelled ``discard`` theirs.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List[Tuple[Any, ...]]] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS instructions (id TEXT PRIMARY KEY, text TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS test_cases (id TEXT PRIMARY KEY, body TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS responses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                phase TEXT NOT NULL,
+                instruction TEXT NOT NULL,
+                test_case TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                response TEXT NOT NULL,
+                score INTEGER NOT NULL,
+                recorded_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS decisions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                iteration INTEGER NOT NULL,
+                step TEXT NOT NULL,
+                options TEXT NOT NULL,
+                keep INTEGER NOT NULL,
+                lowest INTEGER NOT NULL,
+                chosen TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS iterations (
+                iteration INTEGER PRIMARY KEY,
+                instruction TEXT NOT NULL,
+                test_cases TEXT NOT NULL
+            );
+            """
+        )
+
+    def _ids(self, instructions: Iterable[str], test_cases: Iterable[Dict[str, Any]]) -> None:
+        # Caller holds the transaction
+        self._conn.executemany("INSERT OR IGNORE INTO instructions VALUES (?, ?)", [(instruction_key(instruction), instruction) for instruction in instructions])
+        self._conn.executemany("INSERT OR IGNORE INTO test_cases VALUES (?, ?)", [(test_case_key(test_case), json.dumps(test_case, default=str)) for test_case in test_cases])
+
+    def start(self, iteration: int) -> None:
+        """Drop what was recorded after ``iteration``; a new run (``0``) starts empty."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM decisions WHERE iteration > ?", (iteration,))
+            self._conn.execute("DELETE FROM iterations WHERE iteration > ?", (iteration,))
+            if iteration == 0:
+                self._conn.execute("DELETE FROM responses")
+            self._pending.clear()
+
+    def record(self, phase: str, rows: List[Tuple[str, Dict[str, Any], List[BaseMessage], str, int]]) -> None:
+        """Store ``(instruction, test case, prompt messages, response, score)`` rows."""
+        if not rows:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._ids({row[0] for row in rows}, [row[1] for row in rows])
+            self._conn.executemany(
+                "INSERT INTO responses (phase, instruction, test_case, prompt, response, score, recorded_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (phase, instruction_key(instruction), test_case_key(test_case), json.dumps(messages_to_dict(messages)), response, score, now)
+                    for instruction, test_case, messages, response, score in rows
+                ],
+            )
+
+    def decision(self, step: str, options: List[Tuple[str, List[Dict[str, Any]]]], chosen: List[int], keep: int = 1, lowest: bool = False) -> None:
+        """Buffer a selection among ``(instruction, test cases)`` options.
+
+        The loop ranks the options by total score (ascending with ``lowest``),
+        earlier options first on ties, and keeps the first ``keep``; ``chosen``
+        are the indices it kept.
+        """
+        with self._lock, self._conn:
+            self._ids({instruction for instruction, _ in options}, [test_case for _, test_cases in options for test_case in test_cases])
+        encoded = json.dumps([[instruction_key(instruction), [test_case_key(test_case) for test_case in test_cases]] for instruction, test_cases in options])
+        with self._lock:
+            self._pending.setdefault(step, []).append((step, encoded, keep, int(lowest), json.dumps(sorted(chosen))))
+
+    def commit(self, step: str, iteration: int) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO decisions (iteration, step, options, keep, lowest, chosen) VALUES (?, ?, ?, ?, ?, ?)",
+                [(iteration, *decision) for decision in self._pending.pop(step, [])],
+            )
+
+    def discard(self, step: str) -> None:
+        with self._lock:
+            self._pending.pop(step, None)
+
+    def iteration(self, iteration: int, instruction: str, test_cases: List[Dict[str, Any]]) -> None:
+        """The instruction after ``iteration`` and the test cases it was selected on."""
+        with self._lock, self._conn:
+            self._ids([instruction], test_cases)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO iterations VALUES (?, ?, ?)",
+                (iteration, instruction_key(instruction), json.dumps([test_case_key(test_case) for test_case in test_cases])),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class Flip(NamedTuple):
+    iteration: int
+    step: str
+    chosen: List[int]
+    rescored_chosen: List[int]
+    scores: List[int]
+    rescores: List[int]
+
+
+class Rescore(NamedTuple):
+    path: str
+    responses: int
+    changed_cells: int
+    trajectory: List[Tuple[int, int, int, int, int]]
+    decisions: int
+    incomplete: int
+    flips: List[Flip]
+
+
+def load_overrides(path: str) -> Dict[str, Dict[str, Any]]:
+    """New keyword lists from a JSONL file, keyed by test case ID or name.
+
+    Each line has ``expected`` and/or ``unexpected`` and the ``id`` (see
+    ``test_case_key``) or ``name`` of the test cases it applies to.
+    """
+    overrides = {}
+    with open(path) as overrides_file:
+        for line_number, line in enumerate(overrides_file, 1):
+            if not line.strip():
+                continue
+            override = json.loads(line)
+            key = override.get("id") or override.get("name")
+            if key is None:
+                raise ValueError(f"{path}:{line_number}: an override needs an 'id' or a 'name'")
+            overrides[key] = {field: override[field] for field in ("expected", "unexpected") if field in override}
+    return overrides
+
+
+def load_scorer(spec: str) -> Callable[[str, Dict[str, Any]], int]:
+    """``module:function``, called as ``function(response, test_case)`` and returning the score."""
+    module_name, _, function_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name[:-3] if module_name.endswith(".py") else module_name), function_name or "score")
+
+
+def _ranked(totals: List[int], keep: int, lowest: bool) -> List[int]:
+    # Stable sort: the loop keeps earlier options (the incumbents) on ties
+    order = sorted(range(len(totals)), key=lambda k: totals[k] if lowest else -totals[k])
+    return sorted(order[:keep])
+
+
+def _keyword_rescores(test_cases: Dict[str, Dict[str, Any]], cell_responses: Dict[Tuple[str, str], str]) -> Dict[Tuple[str, str], int]:
+    # One matrix row per instruction, one column per test case, each compiled once
+    case_ids = list(test_cases)
+    column = {case_id: index for index, case_id in enumerate(case_ids)}
+    rows: Dict[str, List[Optional[str]]] = {}
+    for (instruction, case_id), response in cell_responses.items():
+        rows.setdefault(instruction, [None] * len(case_ids))[column[case_id]] = response
+    matrix = ScoringEngine([test_cases[case_id] for case_id in case_ids]).score_matrix(list(rows.values()))
+    row = {instruction: index for index, instruction in enumerate(rows)}
+    return {cell: int(matrix[row[cell[0]], column[cell[1]]]) for cell in cell_responses}
+
+
+def rescore_store(path: str, overrides: Optional[Dict[str, Dict[str, Any]]] = None, scorer: Optional[Callable[[str, Dict[str, Any]], int]] = None) -> Rescore:
+    """Re-score a recorded run and replay its decisions, without any model call.
+
+    Responses are re-scored with the overridden keywords (compiled once per
+    test case by ``ScoringEngine``) or with ``scorer``. A decision whose
+    options include a cell without a recorded response (skipped by bounded
+    evaluation or test selection) is counted as incomplete, not replayed.
+    """
+    overrides = overrides or {}
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        test_cases = {}
+        for case_id, body in conn.execute("SELECT id, body FROM test_cases"):
+            test_case = json.loads(body)
+            override = overrides.get(case_id) or overrides.get(test_case.get("name"))
+            test_cases[case_id] = {**test_case, **override} if override else test_case
+
+        # The loop scores each (instruction, test case) cell once; the first response is the one it used
+        scores: Dict[Tuple[str, str], int] = {}
+        cell_responses: Dict[Tuple[str, str], str] = {}
+        responses = 0
+        for instruction, case_id, response, score in conn.execute("SELECT instruction, test_case, response, score FROM responses ORDER BY id"):
+            responses += 1
+            cell = (instruction, case_id)
+            if cell not in scores:
+                scores[cell] = score
+                cell_responses[cell] = response
+        if scorer is not None:
+            rescores = {cell: scorer(response, test_cases[cell[1]]) for cell, response in cell_responses.items()}
+        else:
+            rescores = _keyword_rescores(test_cases, cell_responses)
+
+        def total(table: Dict[Tuple[str, str], int], instruction: str, cases: List[str]) -> Optional[int]:
+            cells = [table.get((instruction, case_id)) for case_id in cases]
+            return None if any(score is None for score in cells) else sum(cells)
+
+        trajectory = []
+        for iteration, instruction, cases in conn.execute("SELECT iteration, instruction, test_cases FROM iterations ORDER BY iteration"):
+            cases = json.loads(cases)
+            known = [case_id for case_id in cases if (instruction, case_id) in scores]
+            trajectory.append((iteration, sum(scores[(instruction, c)] for c in known), sum(rescores[(instruction, c)] for c in known), len(known), len(cases)))
+
+        decisions = incomplete = 0
+        flips = []
+        for iteration, step, options, keep, lowest, chosen in conn.execute("SELECT iteration, step, options, keep, lowest, chosen FROM decisions ORDER BY id"):
+            decisions += 1
+            options = json.loads(options)
+            old = [total(scores, instruction, cases) for instruction, cases in options]
+            new = [total(rescores, instruction, cases) for instruction, cases in options]
+            if any(score is None for score in old):
+                incomplete += 1
+                continue
+            rescored_chosen = _ranked(new, keep, bool(lowest))
+            if rescored_chosen != json.loads(chosen):
+                flips.append(Flip(iteration, step, json.loads(chosen), rescored_chosen, old, new))
+    finally:
+        conn.close()
+
+    changed = sum(1 for cell, score in scores.items() if rescores[cell] != score)
+    return Rescore(path, responses, changed, trajectory, decisions, incomplete, flips)
+
+
+def format_rescore(result: Rescore, show_trajectory: bool = True) -> str:
+    lines = [
+        f"{result.path}: {result.responses} responses, {result.changed_cells} cells scored differently, "
+        f"{len(result.flips)} of {result.decisions} decisions flipped ({result.incomplete} incomplete, not replayed)"
+    ]
+    if show_trajectory and result.trajectory:
+        lines.append(f"{'iteration':>10}{'score':>8}{'rescored':>10}{'cells':>10}")
+        for iteration, score, rescore, known, cases in result.trajectory:
+            lines.append(f"{iteration:>10}{score:>8}{rescore:>10}{f'{known}/{cases}':>10}")
+    for flip in result.flips:
+        lines.append(
+            f"  iteration {flip.iteration} {flip.step}: kept options {flip.chosen} with scores {flip.scores}; "
+            f"re-scored {flip.rescores} would keep {flip.rescored_chosen}"
+        )
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score recorded runs under new keywords or a new scoring function, without any model call.")
+    parser.add_argument("stores", nargs="+", help="response stores, e.g. results/qa_config_responses.sqlite")
+    parser.add_argument("--keywords", help="JSONL of new expected/unexpected lists, by test case 'id' or 'name'")
+    parser.add_argument("--scorer", help="scoring function as module:function, called with (response, test_case)")
+    parser.add_argument("--no-trajectory", action="store_true", help="only print the summary and flipped decisions")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    overrides = load_overrides(options.keywords) if options.keywords else None
+    scorer = load_scorer(options.scorer) if options.scorer else None
+    started = time.perf_counter()
+    results = [rescore_store(path, overrides, scorer) for path in options.stores]
+    for result in results:
+        print(format_rescore(result, not options.no_trajectory))
+    print(f"Re-scored {sum(result.responses for result in results)} responses in {time.perf_counter() - started:.2f}s")
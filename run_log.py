@@ -0,0 +1,109 @@
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, TextIO
+
+
+class RunState(NamedTuple):
+    iteration: int
+    instruction: str
+    test_cases: List[Dict[str, Any]]
+    score: Optional[int]
+
+
+class RunLog:
+    """Append-only JSONL event log of an improvement run.
+
+    A ``start`` event holds the full instruction and test cases. After that,
+    events only record what changed: the new instruction text, or the index
+    and content of each replaced test case. Every iteration ends with an
+    ``iteration`` event carrying the score and timings. A new run replaces
+    the log of the previous one; a resumed run appends a fresh ``start``
+    event, so ``replay_run_log`` can rebuild the state at any iteration in
+    one pass. If set, ``listener`` is called with every
+    event as it is written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.listener: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._file: Optional[TextIO] = None
+
+    def write(self, event: str, iteration: int, **fields: Any) -> None:
+        record = {"event": event, "iteration": iteration, "time": time.time(), **fields}
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        if self.listener is not None:
+            self.listener(record)
+
+    def start(self, iteration: int, instruction: str, test_cases: List[Dict[str, Any]], resumed: bool = False) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a" if resumed else "w")
+        self.write("start", iteration, instruction=instruction, test_cases=test_cases)
+
+    def instruction(self, iteration: int, instruction: str) -> None:
+        self.write("instruction", iteration, instruction=instruction)
+
+    def test_cases(self, iteration: int, old: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> None:
+        if len(old) != len(new):
+            self.write("test_cases", iteration, test_cases=new)
+            return
+        for index, (old_case, new_case) in enumerate(zip(old, new)):
+            if old_case != new_case:
+                self.write("test_case", iteration, index=index, test_case=new_case)
+
+    def iteration(self, iteration: int, score: Optional[int], seconds: float, elapsed: float) -> None:
+        self.write("iteration", iteration, score=score, seconds=seconds, elapsed=elapsed)
+
+    def stop(self, iteration: int, reason: str) -> None:
+        self.write("stop", iteration, reason=reason)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+def replay_run_log(path: str, iteration: Optional[int] = None) -> RunState:
+    """Rebuild the instruction and test cases after ``iteration`` (default: the last one)."""
+    state: Optional[Dict[str, Any]] = None
+    with open(path) as log_file:
+        for line in log_file:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            # Events past the target can still be followed by a resumed run's "start"
+            if iteration is not None and event["iteration"] > iteration:
+                continue
+
+            kind = event["event"]
+            if kind == "start":
+                state = {"iteration": event["iteration"], "instruction": event["instruction"], "test_cases": list(event["test_cases"]), "score": None}
+                continue
+            if state is None:
+                raise ValueError(f"{path} does not begin with a start event")
+            state["iteration"] = event["iteration"]
+            if kind == "instruction":
+                state["instruction"] = event["instruction"]
+            elif kind == "test_case":
+                state["test_cases"][event["index"]] = event["test_case"]
+            elif kind == "test_cases":
+                state["test_cases"] = list(event["test_cases"])
+            elif kind == "iteration":
+                state["score"] = event["score"]
+
+    if state is None:
+        raise ValueError(f"No run state found in {path}")
+    return RunState(state["iteration"], state["instruction"], state["test_cases"], state["score"])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the state of a run from its JSONL event log.")
+    parser.add_argument("run_log", help="event log, e.g. results/qa_config_events.jsonl")
+    parser.add_argument("--iteration", type=int, help="state after this iteration (default: the last one)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    state = replay_run_log(options.run_log, options.iteration)
+    print(json.dumps(state._asdict(), indent=2))
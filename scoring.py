@@ -0,0 +1,238 @@
+import functools
+import hashlib
+import json
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from planner import EvaluationPlanner
+
+if TYPE_CHECKING:
+    # responses.py re-scores with this module
+    from responses import ResponseStore
+
+try:
+    # Optional: pyahocorasick finds all keywords of a test case in one pass
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+class ResponseScore(NamedTuple):
+    """A scored response: its score, the keyword counts and which keywords it missed or wrongly contained."""
+    score: int
+    expected_found: int
+    unexpected_found: int
+    missed: List[str]
+    found: List[str]
+
+
+class KeywordMatcher:
+    """All expected/unexpected keywords of one test case, compiled once.
+
+    Keywords are matched case-insensitively as substrings: a response scores
+    one point per expected keyword it contains and loses one per unexpected
+    keyword. With pyahocorasick installed every keyword is found in a single
+    pass over the response; otherwise each distinct keyword is searched for
+    in the response, which is lowercased only once.
+    """
+
+    def __init__(self, expected: Sequence[str], unexpected: Sequence[str]):
+        self.expected = list(expected)
+        self.unexpected = list(unexpected)
+
+        keywords: Dict[str, int] = {}
+        for keyword in self.expected + self.unexpected:
+            keywords.setdefault(keyword.lower(), len(keywords))
+        self.keywords = list(keywords)
+        self._expected_ids = [keywords[keyword.lower()] for keyword in self.expected]
+        self._unexpected_ids = [keywords[keyword.lower()] for keyword in self.unexpected]
+
+        self._automaton = None
+        if ahocorasick is not None and self.keywords:
+            self._automaton = ahocorasick.Automaton()
+            for keyword, index in keywords.items():
+                self._automaton.add_word(keyword, index)
+            self._automaton.make_automaton()
+
+    def _found(self, text: str) -> List[bool]:
+        """Which distinct keywords occur in an already lowercased ``text``."""
+        if self._automaton is not None:
+            found = [False] * len(self.keywords)
+            for _, index in self._automaton.iter(text):
+                found[index] = True
+            return found
+        return [keyword in text for keyword in self.keywords]
+
+    def score(self, result: str) -> int:
+        found = self._found(result.lower())
+        return sum(found[index] for index in self._expected_ids) - sum(found[index] for index in self._unexpected_ids)
+
+    def evaluate(self, result: str) -> ResponseScore:
+        """Score, counts and keyword lists of one response, all from a single pass."""
+        found = self._found(result.lower())
+        missed = [keyword for keyword, index in zip(self.expected, self._expected_ids) if not found[index]]
+        contained = [keyword for keyword, index in zip(self.unexpected, self._unexpected_ids) if found[index]]
+        expected_found = len(self.expected) - len(missed)
+        return ResponseScore(expected_found - len(contained), expected_found, len(contained), missed, contained)
+
+
+@functools.lru_cache(maxsize=4096)
+def _matcher(expected: Tuple[str, ...], unexpected: Tuple[str, ...]) -> KeywordMatcher:
+    return KeywordMatcher(expected, unexpected)
+
+
+def evaluate_response(result: str, test_case: Dict[str, Any]) -> ResponseScore:
+    """Score one response in the live loop, with the test case's compiled (and cached) matcher."""
+    return _matcher(tuple(test_case["expected"]), tuple(test_case["unexpected"])).evaluate(result)
+
+
+class ScoringEngine:
+    """Scores many responses against a fixed list of test cases.
+
+    Each test case's keywords are compiled once, which pays off when
+    re-scoring recorded responses in bulk.
+    """
+
+    def __init__(self, test_cases: Sequence[Dict[str, Any]]):
+        self.test_cases = list(test_cases)
+        self.matchers = [KeywordMatcher(test_case["expected"], test_case["unexpected"]) for test_case in self.test_cases]
+
+    def score_matrix(self, responses: Sequence[Sequence[Optional[str]]]) -> np.ndarray:
+        """Score ``responses[row][test_index]`` into a ``rows x test cases`` matrix.
+
+        Missing responses (``None``) score 0.
+        """
+        scores = [
+            [0 if result is None else self.matchers[test_index].score(result) for test_index, result in enumerate(row_responses)]
+            for row_responses in responses
+        ]
+        return np.array(scores, dtype=np.int64).reshape(len(responses), len(self.test_cases))
+
+
+def normalize_instruction(instruction: str) -> str:
+    """Collapse whitespace so trivially different instructions share scores."""
+    return " ".join(instruction.split())
+
+
+def test_case_key(test_case: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(test_case, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ScoreTable:
+    """Per-(instruction, test case) scores collected over a run.
+
+    Lets the improvement loop evaluate only the cells it has not seen yet,
+    instead of re-running whole suites for unchanged instructions and cases.
+    With a ``planner``, cells of saturated test cases are filled in without a
+    model call; such planned cells are not saved in checkpoints. With a
+    ``responses`` store, every scored response is recorded for re-scoring.
+    """
+
+    def __init__(self, planner: Optional[EvaluationPlanner] = None, responses: Optional["ResponseStore"] = None):
+        self._scores: Dict[Tuple[str, str], int] = {}
+        self._planned: set = set()
+        self._keywords: Dict[Tuple[str, str], Tuple[List[str], List[str]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.planner = planner
+        self.responses = responses
+
+    def get(self, instruction: str, test_case: Dict[str, Any]) -> Optional[int]:
+        score = self._scores.get((normalize_instruction(instruction), test_case_key(test_case)))
+        if score is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return score
+
+    def peek(self, instruction: str, test_case: Dict[str, Any]) -> Optional[int]:
+        """Like ``get``, without counting towards the hit/miss statistics."""
+        return self._scores.get((normalize_instruction(instruction), test_case_key(test_case)))
+
+    def set(self, instruction: str, test_case: Dict[str, Any], score: int, observed: bool = True) -> None:
+        cell = (normalize_instruction(instruction), test_case_key(test_case))
+        self._scores[cell] = score
+        self._planned.discard(cell)
+        if observed and self.planner is not None:
+            self.planner.observe(cell[1], cell[0], score)
+
+    def set_keywords(self, instruction: str, test_case: Dict[str, Any], missed: List[str], found: List[str]) -> None:
+        """Remember which keywords a scored response missed or wrongly contained."""
+        self._keywords[(normalize_instruction(instruction), test_case_key(test_case))] = (missed, found)
+
+    def keywords(self, instruction: str, test_case: Dict[str, Any]) -> Optional[Tuple[List[str], List[str]]]:
+        return self._keywords.get((normalize_instruction(instruction), test_case_key(test_case)))
+
+    def plan(self, instruction: str, test_case: Dict[str, Any], score: Optional[int]) -> Optional[int]:
+        """Pass one cell through the planner.
+
+        A known real score is recorded as an observation; a missing score may
+        be filled in for a saturated test case. Returns the cell's score, or
+        ``None`` if it still has to be evaluated.
+        """
+        cell = (normalize_instruction(instruction), test_case_key(test_case))
+        if score is not None:
+            if cell not in self._planned:
+                self.planner.observe(cell[1], cell[0], score)
+            return score
+        score = self.planner.skip(cell[1], cell[0])
+        if score is not None:
+            self._scores[cell] = score
+            self._planned.add(cell)
+        return score
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def items(self) -> List[Tuple[str, str, int]]:
+        """``(normalized instruction, test case key, score)`` rows, for checkpoints."""
+        return [(instruction, key, score) for (instruction, key), score in self._scores.items() if (instruction, key) not in self._planned]
+
+    def load(self, rows: Sequence[Sequence[Any]]) -> None:
+        for instruction, key, score in rows:
+            self._scores[(instruction, key)] = score
+
+    def keyword_items(self) -> List[Tuple[str, str, List[str], List[str]]]:
+        """``(normalized instruction, test case key, missed, found)`` rows, for checkpoints."""
+        return [(instruction, key, missed, found) for (instruction, key), (missed, found) in self._keywords.items()]
+
+    def load_keywords(self, rows: Sequence[Sequence[Any]]) -> None:
+        for instruction, key, missed, found in rows:
+            self._keywords[(instruction, key)] = (list(missed), list(found))
+
+
+class ScoreBounds:
+    """Running lower/upper bounds on the total score of several instructions.
+
+    Each test score lies between ``-len(unexpected)`` and ``len(expected)``,
+    so while results come in we know the range every total can still end up
+    in. An instruction is hopeless once its total provably cannot exceed
+    ``must_exceed`` or provably cannot fall below ``must_fall_below``.
+    """
+
+    def __init__(self, test_cases: List[Dict[str, Any]], known_scores: List[List[Optional[int]]], must_exceed: Optional[int] = None, must_fall_below: Optional[int] = None):
+        self.test_cases = test_cases
+        self.must_exceed = must_exceed
+        self.must_fall_below = must_fall_below
+        self.lowest = []
+        self.highest = []
+        for scores in known_scores:
+            self.lowest.append(sum(-len(case["unexpected"]) if score is None else score for case, score in zip(test_cases, scores)))
+            self.highest.append(sum(len(case["expected"]) if score is None else score for case, score in zip(test_cases, scores)))
+
+    def add(self, instruction_index: int, test_index: int, score: int) -> None:
+        test_case = self.test_cases[test_index]
+        self.lowest[instruction_index] += score + len(test_case["unexpected"])
+        self.highest[instruction_index] += score - len(test_case["expected"])
+
+    def hopeless(self, instruction_index: int) -> bool:
+        if self.must_exceed is not None and self.highest[instruction_index] <= self.must_exceed:
+            return True
+        return self.must_fall_below is not None and self.lowest[instruction_index] >= self.must_fall_below
+
+    def bound(self, instruction_index: int) -> int:
+        """The bound that proves a hopeless instruction cannot meet its target."""
+        if self.must_exceed is not None and self.highest[instruction_index] <= self.must_exceed:
+            return self.highest[instruction_index]
+        return self.lowest[instruction_index]
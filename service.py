@@ -0,0 +1,478 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from cache import SQLiteCache
+from improvements import aadversarial_improvement, set_verbosity
+from jobs import QueuedChatModel
+from limits import LimitedChatModel
+from main import DEFAULT_MODEL, aevaluate_final, check_config, finish_run, load_config, make_llm, model_names, prepare_run
+
+# A config without a module must provide these settings itself
+REQUIRED_SETTINGS = ("MAIN_PROMPT", "INITIAL_INSTRUCTION", "INSTRUCTION_IMPROVEMENT_PROMPT", "TEST_CASE_IMPROVEMENT_PROMPT")
+# Only config modules are importable through the service, never arbitrary modules
+CONFIG_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*_config$")
+# The settings a client may override, with the type of their config defaults;
+# everything else is the service's to choose
+PROMPT = (str, list)
+CLIENT_SETTINGS: Dict[str, Tuple[type, ...]] = {
+    "MAIN_PROMPT": PROMPT, "INSTRUCTION_IMPROVEMENT_PROMPT": PROMPT, "TEST_CASE_IMPROVEMENT_PROMPT": PROMPT,
+    "INITIAL_INSTRUCTION": (str,), "SAMPLE_TEST_CASES": (list,),
+    "TARGET_MODEL": (str,), "OPTIMIZER_MODEL": (str,), "ADVERSARY_MODEL": (str,), "EVALUATION_MODELS": (list,),
+    "MAX_ITERATIONS": (int,), "MAX_SECONDS": (int, float), "MAX_CALLS": (int,), "MAX_TOKENS": (int,), "PLATEAU_ITERATIONS": (int,), "SEED": (int,),
+    "MAX_CONCURRENCY": (int,), "NUM_CANDIDATES": (int,), "POPULATION_SIZE": (int,), "NUM_TEST_CANDIDATES": (int,),
+    "BOUNDED_EVALUATION": (bool,), "WORKING_SET_SIZE": (int,), "TEST_CASE_TOKENS": (int,),
+    "TEST_SELECTION": (bool,), "SATURATION_WINDOW": (int,), "RECHECK_EVERY": (int,),
+    "SEQUENTIAL_ACCEPTANCE": (bool,), "ACCEPTANCE_ALPHA": (int, float), "ACCEPTANCE_MAX_ROUNDS": (int,), "ACCEPTANCE_ROUND_SIZE": (int,),
+}
+# Settings that default to None, so a client may send null to turn them off
+NULLABLE_SETTINGS = frozenset({
+    "OPTIMIZER_MODEL", "ADVERSARY_MODEL", "EVALUATION_MODELS", "MAX_SECONDS", "MAX_CALLS", "MAX_TOKENS", "PLATEAU_ITERATIONS", "SEED", "WORKING_SET_SIZE", "TEST_CASE_TOKENS",
+})
+# The type of each item of a list setting
+LIST_ITEMS = {"SAMPLE_TEST_CASES": dict, "EVALUATION_MODELS": str}
+# Files a config can name. Jobs read none of them, even from a config module,
+# and write theirs under results/<job name>
+PATH_SETTINGS = ("CACHE_PATH", "CHECKPOINT_FILE", "JOB_QUEUE", "METRICS_FILE", "RESPONSE_STORE", "RUN_LOG_FILE", "TEST_SUITE_FILE", "TRACE_FILE")
+MAX_PAYLOAD_BYTES = 10_000_000
+# An idle event stream gets a comment this often, so proxies and clients keep it open
+KEEPALIVE_SECONDS = 15.0
+FINISHED = ("done", "failed", "cancelled")
+
+
+class PayloadError(ValueError):
+    pass
+
+
+def check_setting(key: str, value: Any) -> None:
+    """Raise ``PayloadError`` unless a client may set ``key`` to ``value``."""
+    if key in PATH_SETTINGS:
+        raise PayloadError(f"{key} cannot be set: a job's files always go to results/<job name>")
+    if key not in CLIENT_SETTINGS:
+        raise PayloadError(f"setting {key!r} cannot be set through the service")
+    if value is None and key in NULLABLE_SETTINGS:
+        return
+    types = CLIENT_SETTINGS[key]
+    # JSON true is a Python int too, but not a count
+    if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+        raise PayloadError(f"{key} must be {' or '.join(t.__name__ for t in types)}, not {type(value).__name__}")
+    item_type = LIST_ITEMS.get(key)
+    if item_type is not None and not all(isinstance(item, item_type) for item in value):
+        raise PayloadError(f"every item of {key} must be {item_type.__name__}")
+
+
+def job_config(payload: Dict[str, Any]) -> Any:
+    """The config of a job: the ``config`` module's settings, overridden by ``settings``.
+
+    Settings are config module names (``MAX_ITERATIONS``, ``SAMPLE_TEST_CASES``,
+    ...) from ``CLIENT_SETTINGS``, of the type of their default. A ``*_PROMPT`` setting is a template string
+    or a list of ``[role, template]`` messages. File settings are dropped.
+    """
+    values = {}
+    name = payload.get("config")
+    if name is not None:
+        if isinstance(name, str) and name.endswith(".py"):
+            name = name[:-3]
+        if not isinstance(name, str) or not CONFIG_NAME.match(name):
+            raise PayloadError(f"'config' must name a *_config module, not {name!r}")
+        try:
+            module = load_config(name)
+        except ImportError as e:
+            raise PayloadError(f"cannot load config {name!r}: {e}")
+        values = {key: getattr(module, key) for key in dir(module) if key.isupper() and key not in PATH_SETTINGS}
+
+    settings = payload.get("settings") or {}
+    if not isinstance(settings, dict):
+        raise PayloadError("'settings' must be an object")
+    for key, value in settings.items():
+        check_setting(key, value)
+        if key.endswith("_PROMPT"):
+            try:
+                value = ChatPromptTemplate.from_template(value) if isinstance(value, str) else ChatPromptTemplate.from_messages([tuple(message) for message in value])
+            except (TypeError, ValueError) as e:
+                raise PayloadError(f"{key} is not a prompt: {e}")
+        values[key] = value
+
+    missing = [key for key in REQUIRED_SETTINGS if key not in values]
+    if missing:
+        raise PayloadError(f"no 'config' module and no {', '.join(missing)} in 'settings'")
+    return SimpleNamespace(**values)
+
+
+class EnhancementJob:
+    """One submitted improvement run, its events and its result.
+
+    The run writes on the service's event loop thread and HTTP handlers read
+    from theirs; every change happens under ``changed``, which wakes the
+    handlers streaming the job's events.
+    """
+
+    def __init__(self, job_id: str, name: str, config: Any, seed: Optional[int], warnings: List[str]):
+        self.id = job_id
+        self.name = name
+        self.config = config
+        self.seed = seed
+        self.warnings = warnings
+        self.status = "queued"
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.iteration = 0
+        self.score: Optional[int] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []
+        self.changed = threading.Condition()
+        self.future: Any = None
+        self.cancel_requested = False
+
+    def publish(self, record: Dict[str, Any]) -> None:
+        with self.changed:
+            if record["event"] == "iteration":
+                self.iteration = record["iteration"]
+                self.score = record["score"]
+            self.events.append(record)
+            self.changed.notify_all()
+
+    def set_status(self, status: str, **fields: Any) -> None:
+        with self.changed:
+            self.status = status
+            if status == "running":
+                self.started = time.time()
+            if status in FINISHED:
+                self.finished = time.time()
+            for key, value in fields.items():
+                setattr(self, key, value)
+        self.publish({"event": "status", "iteration": self.iteration, "time": time.time(), "status": status, **fields})
+
+    def finish(self, status: str, **fields: Any) -> None:
+        """Set the final status, once; a job whose cancel was accepted always ends cancelled."""
+        with self.changed:
+            if self.status in FINISHED:
+                return
+            if self.cancel_requested:
+                status, fields = "cancelled", {}
+            self.set_status(status, **fields)
+
+    def events_after(self, seen: int, timeout: float) -> List[Dict[str, Any]]:
+        """Events after the first ``seen``, waiting up to ``timeout`` seconds for one."""
+        with self.changed:
+            self.changed.wait_for(lambda: len(self.events) > seen or self.status in FINISHED, timeout)
+            return self.events[seen:]
+
+    def summary(self) -> Dict[str, Any]:
+        with self.changed:
+            return {
+                "id": self.id,
+                "name": self.name,
+                "status": self.status,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+                "iteration": self.iteration,
+                "max_iterations": getattr(self.config, "MAX_ITERATIONS", 100),
+                "score": self.score,
+                "warnings": self.warnings,
+                "error": self.error,
+                "result": self.result,
+            }
+
+
+def make_service_llm(name: str, options: argparse.Namespace) -> Any:
+    """The client and scheduler of one of the service's ``--models``."""
+    if options.fake:
+        from fake_llm import FakeChatModel
+        # The fake model gets the same scheduler as a provider client, so jobs share its limits
+        return LimitedChatModel(
+            llm=FakeChatModel(model_name=name, seed=options.seed, latency=options.fake_latency),
+            max_concurrency=options.max_in_flight or 16,
+            adaptive=options.adaptive_concurrency is not False,
+            requests_per_second=options.requests_per_second
+        )
+    return make_llm(None, options, model_name=name)
+
+
+class EnhancementService:
+    """Runs submitted configs as jobs on one event loop, at most ``max_jobs`` at a time.
+
+    Jobs may only use the models in ``options.models``. Each of them has one
+    client and scheduler, shared by every job, so its rate limit and cap on
+    calls in flight hold across all jobs; all jobs share the response cache. Each job keeps its own budget, event log,
+    response store and results file in ``results/<job name>``, named after
+    its config and job ID.
+    """
+
+    def __init__(self, options: argparse.Namespace):
+        self.options = options
+        self.cache = SQLiteCache(options.cache_path) if options.cache_path else None
+        self.models = {name: make_service_llm(name, options) for name in options.models}
+        self.jobs: Dict[str, EnhancementJob] = {}
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._slots = asyncio.Semaphore(options.max_jobs)
+        self._thread = threading.Thread(target=self._loop.run_forever, name="jobs", daemon=True)
+        self._thread.start()
+
+    def submit(self, payload: Dict[str, Any]) -> EnhancementJob:
+        """Check a job's config and queue it; raises ``PayloadError`` if it must not run."""
+        config = job_config(payload)
+        seed = payload.get("seed")
+        if seed is not None and not isinstance(seed, int):
+            raise PayloadError("'seed' must be an integer")
+        job_id = uuid.uuid4().hex[:12]
+        base = payload.get("config") or "job"
+        name = f"{base[:-3] if base.endswith('.py') else base}_{job_id}"
+
+        # Catch broken configs before the job takes a slot or pays for a call
+        try:
+            preflight = check_config(name, config)
+        except Exception as e:
+            raise PayloadError(f"config check failed: {type(e).__name__}: {e}")
+        if preflight.errors:
+            raise PayloadError("; ".join(preflight.errors))
+
+        # A model name from a client must not create another scheduler with its own limits
+        roles, evaluation = model_names(config)
+        unknown = sorted({model for model in [*roles.values(), *evaluation] if model not in self.models})
+        if unknown:
+            raise PayloadError(f"model {', '.join(unknown)} is not served here; use one of: {', '.join(self.models)}")
+        with self._lock:
+            job = EnhancementJob(job_id, name, config, seed, preflight.warnings)
+            job.set_status("queued")
+            job.future = asyncio.run_coroutine_threadsafe(self._run(job), self._loop)
+            self.jobs[job_id] = job
+        return job
+
+    async def _run(self, job: EnhancementJob) -> None:
+        try:
+            async with self._slots:
+                with job.changed:
+                    # Cancelled while it waited for a slot
+                    if job.cancel_requested:
+                        return
+                    job.set_status("running")
+                await self._run_improvement(job)
+        except asyncio.CancelledError:
+            job.finish("cancelled")
+        except Exception as e:
+            job.finish("failed", error=f"{type(e).__name__}: {e}")
+
+    async def _run_improvement(self, job: EnhancementJob) -> None:
+        run = prepare_run(job.name, None, self.models, self.cache, job.seed, config=job.config, results_dir=os.path.join("results", job.name))
+        run["settings"].run_log.listener = job.publish
+        try:
+            instruction, test_cases = await aadversarial_improvement(*run["args"], settings=run["settings"])
+            scores = await aevaluate_final(run, instruction, test_cases)
+            if scores is not None:
+                job.publish({"event": "final", "iteration": job.iteration, "time": time.time(), "scores": scores})
+            result = {
+                "instruction": instruction,
+                "test_cases": test_cases,
+                "final_scores": scores,
+                "budget": run["settings"].budget.summary(),
+                "results_file": run["output_filename"],
+            }
+        finally:
+            finish_run(run)
+        job.finish("done", result=result)
+
+    def cancel(self, job: EnhancementJob) -> bool:
+        """Cancel a queued or running job; False if it has already finished."""
+        with job.changed:
+            if job.status in FINISHED:
+                return False
+            job.cancel_requested = True
+            if job.status == "queued":
+                # Its run never starts, so it is cancelled right away
+                job.finish("cancelled")
+        # Cancels the job's task on the event loop, which cancels its model calls
+        job.future.cancel()
+        return True
+
+    def close(self) -> None:
+        for job in list(self.jobs.values()):
+            self.cancel(job)
+        for job in list(self.jobs.values()):
+            try:
+                job.future.result(timeout=30)
+            except BaseException:
+                pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        for name, llm in self.models.items():
+            print(f"{'Job queue' if isinstance(llm, QueuedChatModel) else 'Scheduler'} ({name}): {llm.summary()}")
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """HTTP API of the service:
+
+    - ``POST /jobs`` submits a JSON config payload and returns the job (202)
+    - ``GET /jobs`` lists every job, ``GET /jobs/<id>`` returns one with its result
+    - ``GET /jobs/<id>/events`` streams the job's events as server-sent events
+    - ``POST /jobs/<id>/cancel`` cancels a queued or running job
+    """
+
+    server_version = "adv-prompt-enhancer"
+    # Server-sent events need a connection that stays open
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self) -> EnhancementService:
+        return self.server.service
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.service.options.verbosity >= 1:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body: Any) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job(self, job_id: str) -> Optional[EnhancementJob]:
+        job = self.service.jobs.get(job_id)
+        if job is None:
+            self._send_json(404, {"error": f"no job {job_id!r}"})
+        return job
+
+    def do_GET(self) -> None:
+        parts = self.path.strip("/").split("/")
+        if parts == ["jobs"]:
+            self._send_json(200, [job.summary() for job in list(self.service.jobs.values())])
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self._job(parts[1])
+            if job is not None:
+                self._send_json(200, job.summary())
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+            job = self._job(parts[1])
+            if job is not None:
+                self._stream_events(job)
+        else:
+            self._send_json(404, {"error": f"no route {self.path!r}"})
+
+    def do_POST(self) -> None:
+        parts = self.path.strip("/").split("/")
+        if parts == ["jobs"]:
+            self._submit()
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            job = self._job(parts[1])
+            if job is None:
+                return
+            if self.service.cancel(job):
+                self._send_json(202, job.summary())
+            else:
+                self._send_json(409, {"error": f"job {job.id} has already finished ({job.status})"})
+        else:
+            self._send_json(404, {"error": f"no route {self.path!r}"})
+
+    def _submit(self) -> None:
+        # Browsers send cross-site form posts without a preflight, but never as JSON
+        if self.headers.get_content_type() != "application/json":
+            # The body is left unread, so the connection cannot carry another request
+            self.close_connection = True
+            self._send_json(415, {"error": "send the job as Content-Type: application/json"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            self.close_connection = True
+            self._send_json(400, {"error": "Content-Length must be a number"})
+            return
+        if length > MAX_PAYLOAD_BYTES:
+            self.close_connection = True
+            self._send_json(413, {"error": f"payload larger than {MAX_PAYLOAD_BYTES} bytes"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(payload, dict):
+                raise PayloadError("the payload must be a JSON object")
+            job = self.service.submit(payload)
+        except ValueError as e:
+            # Malformed JSON (or not UTF-8) and rejected payloads
+            self._send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            # The client still gets an answer, not a dropped connection
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._send_json(202, job.summary())
+
+    def _stream_events(self, job: EnhancementJob) -> None:
+        # A reconnecting client resumes after the last event it saw
+        try:
+            seen = int(self.headers.get("Last-Event-ID") or 0)
+        except ValueError:
+            seen = -1
+        if seen < 0:
+            self._send_json(400, {"error": "Last-Event-ID must be the number of an event"})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while True:
+                events = job.events_after(seen, KEEPALIVE_SECONDS)
+                if not events and job.status in FINISHED:
+                    return
+                chunk = ":\n\n" if not events else ""
+                for event in events:
+                    seen += 1
+                    chunk += f"id: {seen}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+                self.wfile.write(chunk.encode())
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+
+def main(options):
+    set_verbosity(options.verbosity)
+    service = EnhancementService(options)
+    server = ThreadingHTTPServer((options.host, options.port), ServiceHandler)
+    server.service = service
+    print(f"Serving on http://{options.host}:{server.server_port} (up to {options.max_jobs} jobs at a time)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run improvement jobs submitted over HTTP, with progress streamed as server-sent events.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1, this machine only)")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on (default 8765)")
+    parser.add_argument("--max-jobs", type=int, default=4, help="jobs running at a time; later jobs wait in line (default 4)")
+    parser.add_argument("--models", nargs="+", default=[DEFAULT_MODEL], help=f"models jobs may use, each with one scheduler shared by all jobs (default {DEFAULT_MODEL})")
+    parser.add_argument("--max-in-flight", type=int, help="upper limit on LLM calls in flight per model, across all jobs (default 16)")
+    parser.add_argument("--adaptive-concurrency", action=argparse.BooleanOptionalAction, help="halve the calls in flight on a 429 and grow them back on success (default on)")
+    parser.add_argument("--requests-per-second", type=float, help="rate limit for LLM calls per model, across all jobs")
+    parser.add_argument("--max-retries", type=int, help="retries for rate-limited, timed out or failed (5xx) calls (default 3)")
+    parser.add_argument("--job-queue", help="SQLite job queue; model calls are answered by worker.py processes")
+    parser.add_argument("--cache-path", default=".cache/llm_responses.sqlite", help="shared response cache; empty to disable")
+    parser.add_argument("--fake", action="store_true", help="answer with the offline fake model instead of the provider")
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="seconds per fake model call")
+    parser.add_argument("--seed", type=int, default=0, help="fake model seed")
+    parser.add_argument("--verbosity", type=int, choices=[0, 1, 2], default=0, help="console output; jobs interleave, so the default is 0")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,84 @@
+import argparse
+import importlib
+import json
+import random
+import threading
+from array import array
+from typing import Any, Dict, Iterator, List, Sequence
+
+
+class JsonlSuite:
+    """A test suite stored as one JSON test case per line, read on demand.
+
+    Only the byte offset of every line is kept in memory (8 bytes per case),
+    so suites with tens of thousands of cases can be sampled and streamed
+    without loading them. Blank lines are skipped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._offsets = array("q")
+        with open(path, "rb") as suite_file:
+            offset = 0
+            for line in suite_file:
+                if line.strip():
+                    self._offsets.append(offset)
+                offset += len(line)
+        self._file = open(path, "rb")
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        return self.read([index])[0]
+
+    def read(self, indices: Sequence[int]) -> List[Dict[str, Any]]:
+        with self._lock:
+            test_cases = []
+            for index in indices:
+                self._file.seek(self._offsets[index])
+                test_cases.append(json.loads(self._file.readline()))
+            return test_cases
+
+    def minibatch(self, size: int, seed: Any, iteration: int) -> List[Dict[str, Any]]:
+        """A reproducible sample of ``size`` cases for one iteration, in file order."""
+        rng = random.Random(f"{seed}:{iteration}")
+        return self.read(sorted(rng.sample(range(len(self)), min(size, len(self)))))
+
+    def batches(self, batch_size: int = 256) -> Iterator[List[Dict[str, Any]]]:
+        """Stream the whole suite in batches of ``batch_size`` cases."""
+        batch = []
+        with open(self.path, "rb") as suite_file:
+            for line in suite_file:
+                if not line.strip():
+                    continue
+                batch.append(json.loads(line))
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def write_jsonl_suite(path: str, test_cases: Sequence[Dict[str, Any]]) -> None:
+    with open(path, "w") as suite_file:
+        for test_case in test_cases:
+            suite_file.write(json.dumps(test_case) + "\n")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export a config's SAMPLE_TEST_CASES to a JSONL test suite.")
+    parser.add_argument("config_file", help="config module, e.g. qa_config.py")
+    parser.add_argument("suite_file", help="JSONL file to write")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    config = importlib.import_module(options.config_file[:-3] if options.config_file.endswith(".py") else options.config_file)
+    write_jsonl_suite(options.suite_file, config.SAMPLE_TEST_CASES)
+    print(f"Wrote {len(config.SAMPLE_TEST_CASES)} test cases to {options.suite_file}")
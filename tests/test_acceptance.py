@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+from acceptance import SequentialAcceptance, sign_test_p_value
+
+
+def test_sign_test_p_value():
+    assert sign_test_p_value(0, 0) == 1.0
+    assert sign_test_p_value(5, 0) == 1 / 32
+    assert sign_test_p_value(0, 5) == 1.0
+    # At least 9 of 10: (10 + 1) / 1024
+    assert sign_test_p_value(9, 1) == pytest.approx(11 / 1024)
+    assert sign_test_p_value(3, 3) > 0.5
+
+
+def test_decisions():
+    acceptance = SequentialAcceptance(alpha=0.05, max_rounds=3, round_size=16)
+    assert acceptance.alpha_per_look == 0.0125
+    assert acceptance.decide([1] * 8, 16) is True
+    assert acceptance.decide([-1] * 8, 16) is False
+    # Ties carry no information
+    assert acceptance.decide([1] * 8 + [0] * 20, 16) is True
+    assert acceptance.decide([1, -1, 1, 0], 16) is None
+    # Even winning every remaining sample would not be significant
+    assert acceptance.decide([1, -1, 1, -1, 1, -1], 2) is False
+
+
+def sequential_trial(acceptance, rng, p_win):
+    differences = []
+    for round_number in range(acceptance.max_rounds + 1):
+        differences += [1 if rng.random() < p_win else -1 for _ in range(acceptance.round_size)]
+        remaining = (acceptance.max_rounds - round_number) * acceptance.round_size
+        decision = acceptance.decide(differences, remaining)
+        if decision is not None or round_number == acceptance.max_rounds:
+            return bool(decision)
+
+
+def test_false_acceptance_rate_stays_below_alpha():
+    acceptance = SequentialAcceptance(alpha=0.05, max_rounds=3, round_size=8)
+    rng = random.Random(0)
+    accepted = sum(sequential_trial(acceptance, rng, 0.5) for _ in range(4000))
+    assert accepted / 4000 <= 0.05
+    # A real improvement is still found most of the time
+    assert sum(sequential_trial(acceptance, rng, 0.8) for _ in range(1000)) > 800
+
+
+def test_summary():
+    acceptance = SequentialAcceptance()
+    acceptance.record(True, 0)
+    acceptance.record(False, 2)
+    assert acceptance.summary() == "1 changes accepted, 1 rejected, 2 extra sampling rounds"
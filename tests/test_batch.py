@@ -0,0 +1,25 @@
+import pytest
+
+from batch import check_schedulers, parse_args
+
+
+@pytest.fixture
+def configs(tmp_path, monkeypatch):
+    def write(name, text):
+        (tmp_path / f"{name}.py").write_text(f"from qa_config import *\n{text}\n")
+        return name
+    monkeypatch.syspath_prepend(str(tmp_path))
+    return write
+
+
+def test_configs_sharing_a_model_must_agree_on_its_scheduler(configs):
+    files = [configs("few_config", "MAX_IN_FLIGHT = 4"), configs("many_config", "MAX_IN_FLIGHT = 32")]
+    with pytest.raises(SystemExit, match="set different MAX_IN_FLIGHT for solar-pro"):
+        check_schedulers(files, parse_args(files))
+    # The command line applies to every config
+    check_schedulers(files, parse_args([*files, "--max-in-flight", "8"]))
+
+
+def test_configs_with_different_models_may_differ(configs):
+    files = [configs("pro_config", "MAX_IN_FLIGHT = 4"), configs("mini_config", "MAX_IN_FLIGHT = 32\nTARGET_MODEL = 'solar-mini'")]
+    check_schedulers(files, parse_args(files))
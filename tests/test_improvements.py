@@ -0,0 +1,153 @@
+import asyncio
+import json
+import random
+
+import pytest
+
+import qa_config as config
+from budget import RunBudget
+from cache import SQLiteCache
+from fake_llm import FakeChatModel, default_responder
+from limits import LimitedChatModel
+from improvements import ImprovementSettings, aadversarial_improvement, adversarial_improvement, improve_test_cases, prompt_instruction, set_verbosity
+from scoring import ScoreTable, normalize_instruction
+# Renamed so that pytest does not mistake it for a test
+from scoring import test_case_key as case_key
+from suites import JsonlSuite, write_jsonl_suite
+
+
+@pytest.fixture(autouse=True)
+def quiet(tmp_path, monkeypatch):
+    set_verbosity(0)
+    monkeypatch.chdir(tmp_path)
+
+
+def by_prompt(role, text, rng):
+    # Answers depend on the prompt only, not on how often it was seen, like a cached provider
+    return default_responder(role, text, random.Random(text))
+
+
+def improvement_args(llm):
+    return llm, config.MAIN_PROMPT, config.INITIAL_INSTRUCTION, config.SAMPLE_TEST_CASES, config.INSTRUCTION_IMPROVEMENT_PROMPT, config.TEST_CASE_IMPROVEMENT_PROMPT
+
+
+def settings(max_iterations, **options):
+    options = {"score_table": ScoreTable(), "rng": random.Random(1), "budget": RunBudget(), **options}
+    return ImprovementSettings(max_iterations=max_iterations, log_file_path="log.txt", max_concurrency=4, **options)
+
+
+SEARCHES = [
+    {},
+    {"num_candidates": 3, "population_size": 2, "bounded": True, "num_test_candidates": 3},
+]
+
+
+@pytest.mark.parametrize("search", SEARCHES)
+def test_sync_and_async_loops_agree(search):
+    # Cancelled speculative steps make extra calls, so answers must not depend on how often a prompt was seen
+    sync_result = adversarial_improvement(*improvement_args(FakeChatModel(seed=3, responder=by_prompt)), settings=settings(5, **search))
+    async_result = asyncio.run(aadversarial_improvement(*improvement_args(FakeChatModel(seed=3, responder=by_prompt)), settings=settings(5, **search)))
+
+    assert async_result == sync_result
+    # The loop did change something, so the comparison means something
+    assert sync_result != (config.INITIAL_INSTRUCTION, config.SAMPLE_TEST_CASES)
+
+
+def test_test_case_candidates_are_scored_with_the_given_instruction():
+    table = ScoreTable()
+    options = settings(1, score_table=table, num_test_candidates=3)
+    improve_test_cases(config.SAMPLE_TEST_CASES, config.MAIN_PROMPT, FakeChatModel(seed=1, responder=by_prompt), config.TEST_CASE_IMPROVEMENT_PROMPT, options, instruction="Answer briefly.")
+
+    scored = {instruction for instruction, _, _ in table.items()}
+    assert scored == {"Answer briefly."}
+    # The current cases and at least one candidate
+    assert len(table) > len(config.SAMPLE_TEST_CASES)
+    assert normalize_instruction(prompt_instruction(config.MAIN_PROMPT)) not in scored
+
+
+@pytest.mark.parametrize("search", SEARCHES)
+def test_resumed_run_matches_uninterrupted_run(search):
+    uninterrupted = adversarial_improvement(*improvement_args(FakeChatModel(seed=1, responder=by_prompt)), settings=settings(6, checkpoint_path="full.json", **search))
+
+    adversarial_improvement(*improvement_args(FakeChatModel(seed=1, responder=by_prompt)), settings=settings(3, checkpoint_path="part.json", **search))
+    resumed_settings = settings(6, checkpoint_path="part.json", resume=True, **search)
+    resumed = adversarial_improvement(*improvement_args(FakeChatModel(seed=1, responder=by_prompt)), settings=resumed_settings)
+
+    assert resumed == uninterrupted
+    # Only the new iterations are appended to the log
+    with open("log.txt") as log_file:
+        iterations = [line for line in log_file if line.startswith("--- Iteration")]
+    assert iterations[-3:] == [f"--- Iteration {i} ---\n" for i in (4, 5, 6)]
+    # The budget carries the calls made before the interruption
+    assert resumed_settings.budget.calls > 0
+
+
+def test_cached_responses_are_not_counted():
+    cache = SQLiteCache("cache.sqlite")
+    first_llm = FakeChatModel(seed=2, responder=by_prompt)
+    first = settings(3, cache=cache)
+    first_result = adversarial_improvement(*improvement_args(first_llm), settings=first)
+    # Calls that reach the model are paid; cache hits reach neither the model nor the budget
+    assert first.budget.calls == len(first_llm.records)
+    first_hits = cache.hits
+
+    second_llm = FakeChatModel(seed=2, responder=by_prompt)
+    second = settings(3, cache=cache)
+    second_result = adversarial_improvement(*improvement_args(second_llm), settings=second)
+    assert second_result == first_result
+    assert cache.hits > first_hits
+    # Scoring calls come from the cache; only the improvement prompts reach the model again
+    assert second.budget.calls == len(second_llm.records) < first.budget.calls
+
+
+def test_call_budget_stops_the_run():
+    llm = FakeChatModel(seed=2)
+    limited = settings(50, budget=RunBudget(max_calls=20))
+    adversarial_improvement(*improvement_args(llm), settings=limited)
+
+    assert 20 <= limited.budget.calls == len(llm.records)
+    with open("log.txt") as log_file:
+        log = log_file.read()
+    assert "Stopped: call limit reached" in log
+    assert "--- Iteration 50 ---" not in log
+
+
+def quoting(role, text, rng):
+    # Every revision adds a sentence, and answers quote more of the context for each one, so each revision scores higher
+    if role == "optimizer":
+        return "Quote the context." + " More." * (text.count("More.") + 1)
+    if role == "target":
+        instruction, _, context = text.partition("Context:")
+        return " ".join(context.split()[:8 * instruction.count("More.")])
+    return by_prompt(role, text, rng)
+
+
+def test_suite_confirmation_keeps_only_the_confirmed_total():
+    suite_cases = [{**test_case, "name": f"suite {i}"} for i, test_case in enumerate(config.SAMPLE_TEST_CASES * 4)]
+    write_jsonl_suite("suite.jsonl", suite_cases)
+    suite = JsonlSuite("suite.jsonl")
+    llm = FakeChatModel(seed=1, responder=quoting)
+    adversarial_improvement(*improvement_args(llm), settings=settings(4, checkpoint_path="run.json", suite=suite, confirm_every=1, minibatch_size=0))
+    suite.close()
+
+    with open("run.json") as checkpoint_file:
+        state = json.load(checkpoint_file)
+    suite_keys = {case_key(test_case) for test_case in suite_cases}
+    assert not suite_keys & {key for _, key, _ in state["scores"]}
+    assert state["confirmed_score"] is not None
+    # Both instructions on the first confirmation, then only the new one
+    with open("log.txt") as log_file:
+        confirmations = sum(1 for line in log_file if "onfirmed on the full suite" in line)
+    assert confirmations > 1
+    calls = sum(1 for record in llm.records if record["phase"] == "confirm")
+    assert calls == (confirmations + 1) * len(suite_cases)
+
+
+def test_summary_lists_the_scheduler_of_every_model(capsys):
+    target = LimitedChatModel(llm=FakeChatModel(seed=1))
+    optimizer = LimitedChatModel(llm=FakeChatModel(seed=2, model_name="fake-mini"))
+    adversarial_improvement(*improvement_args(target), settings=settings(2, optimizer_llm=optimizer, adversary_llm=target))
+
+    rows = [line for line in capsys.readouterr().out.splitlines() if line.startswith("Scheduler")]
+    assert [row.split(":")[0] for row in rows] == ["Scheduler (fake-model)", "Scheduler (fake-mini)"]
+    assert rows[1].startswith("Scheduler (fake-mini): 2 attempts")
@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from fake_llm import FakeChatModel, FakeLLMError
+from jobs import JobFailed, JobQueue, QueuedChatModel
+from worker import run_worker
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / "queue.sqlite")
+
+
+@pytest.fixture
+def queue(queue_path):
+    queue = JobQueue(queue_path, lease_seconds=0.2)
+    yield queue
+    queue.close()
+
+
+def ask(text):
+    return [HumanMessage(content=text)]
+
+
+def test_jobs_are_claimed_in_order_and_by_model(queue):
+    first = queue.submit(ask("1"), model="a")
+    second = queue.submit(ask("2"), model="b")
+    third = queue.submit(ask("3"), ["\n"], model="a")
+
+    assert [job[:2] for job in queue.claim("w1", limit=5, models=["a"])] == [(first, "a"), (third, "a")]
+    (job_id, model, messages, stop), = queue.claim("w2", limit=5)
+    assert (job_id, model, messages[0].content, stop) == (second, "b", "2", None)
+    assert queue.claim("w3") == []
+    assert queue.counts() == {"running": 3}
+
+
+def test_expired_lease_hands_the_job_out_again(queue):
+    job_id = queue.submit(ask("1"))
+    assert [job[0] for job in queue.claim("crashed")] == [job_id]
+    assert queue.claim("w2") == []
+    time.sleep(0.25)
+    assert [job[0] for job in queue.claim("w2")] == [job_id]
+
+    queue.complete(job_id, AIMessage(content="answer"))
+    status, result = queue.poll(job_id)
+    assert status == "done" and "answer" in result
+
+
+def test_removed_job_drops_the_late_answer(queue):
+    job_id = queue.submit(ask("1"))
+    queue.claim("w1")
+    queue.remove(job_id)
+    queue.complete(job_id, AIMessage(content="too late"))
+    assert queue.counts() == {}
+    with pytest.raises(JobFailed, match="no longer in the queue"):
+        queue.poll(job_id)
+
+
+def test_cancelled_call_leaves_the_queue(queue_path, queue):
+    llm = QueuedChatModel(queue_path=queue_path, poll_interval=0.01)
+
+    async def main():
+        task = asyncio.create_task(llm.ainvoke("hello"))
+        while not queue.counts():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert queue.counts() == {}
+
+
+def test_unanswered_call_times_out(queue_path, queue):
+    llm = QueuedChatModel(queue_path=queue_path, poll_interval=0.01, timeout=0.05)
+    with pytest.raises(TimeoutError):
+        llm.invoke("hello")
+    assert queue.counts() == {}
+
+
+class BrokenModel(FakeChatModel):
+    error_rate: float = 1.0
+    error_status_code: int = 400
+
+
+def test_worker_answers_each_job_with_its_model(queue_path, queue):
+    fast = QueuedChatModel(queue_path=queue_path, model_name="fast", poll_interval=0.01)
+    broken = QueuedChatModel(queue_path=queue_path, model_name="broken", poll_interval=0.01)
+
+    def make_model(name):
+        return BrokenModel(model_name=name) if name == "broken" else FakeChatModel(model_name=name, seed=1)
+
+    async def main():
+        worker = asyncio.create_task(run_worker(queue, make_model, "w1", concurrency=2, poll_interval=0.01, idle_exit=0.2))
+        answers = await asyncio.gather(*(fast.ainvoke(f"question {i}") for i in range(5)), broken.ainvoke("question"), return_exceptions=True)
+        return answers, await worker
+
+    answers, handled = asyncio.run(main())
+    assert handled == 6
+    direct = FakeChatModel(model_name="fast", seed=1)
+    assert [answer.content for answer in answers[:5]] == [direct.invoke(f"question {i}").content for i in range(5)]
+    assert isinstance(answers[5], JobFailed)
+    assert FakeLLMError.__name__ in str(answers[5])
+    assert fast.summary().startswith("5 jobs submitted, 0 failed")
+    assert broken.summary().startswith("1 jobs submitted, 1 failed")
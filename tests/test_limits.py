@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+from typing import Any, List
+
+import pytest
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+from budget import with_callbacks
+from fake_llm import FakeLLMError
+from limits import LimitedChatModel
+
+
+class ScriptedModel(BaseChatModel):
+    """Fails with the given status codes, one per call, then answers "ok"; tracks calls in flight."""
+
+    failures: List[int] = []
+    latency: float = 0.0
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _calls: int = PrivateAttr(default=0)
+    _in_flight: int = PrivateAttr(default=0)
+    _most_in_flight: int = PrivateAttr(default=0)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _next(self) -> int:
+        with self._lock:
+            self._calls += 1
+            return self.failures[self._calls - 1] if self._calls <= len(self.failures) else 0
+
+    def _answer(self, status_code: int) -> ChatResult:
+        if status_code:
+            raise FakeLLMError(f"status {status_code}", status_code)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="ok"))])
+
+    def _generate(self, messages: Any, stop: Any = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        return self._answer(self._next())
+
+    async def _agenerate(self, messages: Any, stop: Any = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        status_code = self._next()
+        with self._lock:
+            self._in_flight += 1
+            self._most_in_flight = max(self._most_in_flight, self._in_flight)
+        await asyncio.sleep(self.latency)
+        with self._lock:
+            self._in_flight -= 1
+        return self._answer(status_code)
+
+
+class RetryCounter(BaseCallbackHandler):
+    def __init__(self):
+        self.retries = 0
+
+    def on_retry(self, retry_state: Any, **kwargs: Any) -> None:
+        self.retries += 1
+
+
+def limited(failures=(), **options):
+    options = {"backoff_base": 0.001, "backoff_max": 0.01, **options}
+    return LimitedChatModel(llm=ScriptedModel(failures=list(failures)), **options)
+
+
+def test_rate_limits_and_server_errors_are_retried():
+    llm = limited([429, 503, 504])
+    counter = RetryCounter()
+    assert with_callbacks(llm, counter).invoke("hi").content == "ok"
+
+    stats = llm.stats()
+    assert (stats["calls"], stats["retries"], stats["rate_limited"], stats["failed"]) == (4, 3, 1, 0)
+    # The copy made for the callbacks shares the scheduler's state
+    assert counter.retries == 3
+
+
+@pytest.mark.parametrize("failures, calls", [([400], 1), ([429, 429, 429, 429], 4)])
+def test_final_errors_are_raised(failures, calls):
+    llm = limited(failures, max_retries=3)
+    with pytest.raises(FakeLLMError):
+        llm.invoke("hi")
+    stats = llm.stats()
+    assert (stats["calls"], stats["failed"]) == (calls, 1)
+
+
+def test_adaptive_limit_halves_on_429_and_grows_back():
+    # A long backoff window: the second 429 must not halve the limit again
+    llm = limited([429, 429], max_concurrency=8, adaptive=True, max_retries=0, backoff_base=60.0)
+    for _ in range(2):
+        with pytest.raises(FakeLLMError):
+            llm.invoke("hi")
+    assert llm.stats()["limit"] == 4.0
+
+    limit = 4.0
+    for _ in range(4):
+        llm.invoke("hi")
+        limit += 1 / limit
+    assert llm.stats()["limit"] == pytest.approx(limit)
+    assert llm.stats()["lowest_limit"] == 4.0
+    assert llm.summary().endswith("concurrency 4.9 (lowest 4.0, max 8)")
+
+
+def test_limit_never_exceeds_max_concurrency():
+    llm = limited(max_concurrency=2, adaptive=True)
+    for _ in range(20):
+        llm.invoke("hi")
+    assert llm.stats()["limit"] == 2.0
+
+
+def test_calls_in_flight_are_capped():
+    llm = LimitedChatModel(llm=ScriptedModel(latency=0.02), max_concurrency=3)
+
+    async def main():
+        return await asyncio.gather(*(llm.ainvoke(f"call {i}") for i in range(12)))
+
+    assert [message.content for message in asyncio.run(main())] == ["ok"] * 12
+    assert llm.llm._most_in_flight == 3
+
+
+def test_rate_limit_spaces_out_calls():
+    llm = limited(requests_per_second=50, burst=1)
+    started = time.monotonic()
+    for _ in range(6):
+        llm.invoke("hi")
+    # The first call uses the burst; the other five wait about 20 ms each
+    assert time.monotonic() - started >= 0.09
+    assert llm.stats()["throttled_seconds"] > 0
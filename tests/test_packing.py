@@ -0,0 +1,52 @@
+import json
+
+from packing import compact_test_case, estimate_tokens, pack_test_cases, rank_test_cases
+from scoring import ScoreTable
+
+INSTRUCTION = "Answer briefly."
+CASES = [{"name": f"case {i}", "context": "x" * 1000, "expected": ["a", "b", "c"], "unexpected": ["z"]} for i in range(4)]
+
+
+def scored_table():
+    table = ScoreTable()
+    # Shortfalls: case 0 -> 0, case 1 -> 3, case 2 -> 1; case 3 is not scored
+    for test_case, score, keywords in [(CASES[0], 3, ([], [])), (CASES[1], 0, (["a", "b"], ["z"])), (CASES[2], 2, (["c"], []))]:
+        table.set(INSTRUCTION, test_case, score)
+        table.set_keywords(INSTRUCTION, test_case, *keywords)
+    return table
+
+
+def test_long_fields_are_cut():
+    line = compact_test_case(CASES[0], field_chars=10)
+    assert json.loads(line)["context"] == "x" * 10 + "..."
+    assert "\n" not in line
+
+
+def test_failing_cases_come_first_and_unscored_last():
+    assert rank_test_cases(INSTRUCTION, CASES, scored_table()) == [1, 2, 0, 3]
+    assert rank_test_cases(INSTRUCTION, CASES, None) == [0, 1, 2, 3]
+
+
+def test_annotations_list_the_missed_keywords():
+    text, included = pack_test_cases(INSTRUCTION, CASES, scored_table())
+    lines = text.splitlines()
+    assert included == 4
+    assert lines[0].startswith('- [score 0/3; missed "a", "b"; contains unexpected "z"] {"name": "case 1"')
+    assert lines[1].startswith('- [score 2/3; missed "c"] {"name": "case 2"')
+    assert lines[3].startswith('- [not scored yet] {"name": "case 3"')
+
+
+def test_token_budget_keeps_the_most_informative_cases():
+    full = pack_test_cases(INSTRUCTION, CASES, scored_table())[0].splitlines()
+    # Room for two lines, not three
+    text, included = pack_test_cases(INSTRUCTION, CASES, scored_table(), max_tokens=estimate_tokens(full[0]) + estimate_tokens(full[1]) + 10)
+    lines = text.splitlines()
+    assert included == 2
+    assert [json.loads(line[line.index("{"):])["name"] for line in lines[:2]] == ["case 1", "case 2"]
+    assert lines[2] == "- (2 more test cases left out to save space)"
+
+
+def test_at_least_one_case_is_always_included():
+    text, included = pack_test_cases(INSTRUCTION, CASES, scored_table(), max_tokens=1)
+    assert included == 1
+    assert text.splitlines()[-1] == "- (3 more test cases left out to save space)"
@@ -0,0 +1,83 @@
+import json
+import re
+
+import pytest
+
+import qa_config as config
+from parsing import parse_test_case, parse_test_cases, required_test_case_keys
+# Renamed so that pytest does not mistake it for a test class
+from parsing import TestCaseError as ParseError
+
+KEYS = required_test_case_keys(config.MAIN_PROMPT)
+TEST_CASE = config.SAMPLE_TEST_CASES[0]
+
+
+def prompt_example():
+    # The test case format that TEST_CASE_IMPROVEMENT_PROMPT shows the model, as rendered
+    text = config.TEST_CASE_IMPROVEMENT_PROMPT.messages[-1].prompt.template
+    return text[text.find("{{"):text.rfind("}}") + 2].replace("{{", "{").replace("}}", "}")
+
+
+def test_required_keys_follow_the_main_prompt():
+    assert KEYS[0] == "name" and KEYS[-2:] == ["expected", "unexpected"]
+    assert set(KEYS[1:-2]) == set(config.MAIN_PROMPT.input_variables) - {"instruction"}
+
+
+def test_plain_json():
+    assert parse_test_case(json.dumps(TEST_CASE), KEYS) == TEST_CASE
+
+
+def test_markdown_fence_and_surrounding_text():
+    reply = f"Here is a harder test case:\n```json\n{json.dumps(TEST_CASE, indent=2)}\n```\nIt tests recall."
+    assert parse_test_case(reply, KEYS) == TEST_CASE
+
+
+def test_comments_and_python_literal():
+    reply = "{'name': 'Hash # inside', 'context': 'c', 'input': 'i',  # the question\n 'expected': ['a'], 'unexpected': [],}"
+    assert parse_test_case(reply, KEYS) == {"name": "Hash # inside", "context": "c", "input": "i", "expected": ["a"], "unexpected": []}
+
+
+def test_the_prompts_own_example():
+    test_case = parse_test_case(prompt_example(), KEYS)
+    assert test_case["key_value_pairs"] == {"key1": "value1", "key2": "value2"}
+    assert test_case["knowledge_graph"]["relation1"] == ["node2", "node3"]
+
+
+@pytest.mark.parametrize("reply, reason", [
+    ('{"name": "n", "context": "c", "expected": ["a"], "unexpected": []}', "missing keys: input"),
+    ('{"name": "n", "context": "c", "input": "i", "expected": "a", "unexpected": []}', "'expected' must be a list"),
+    ('{"name": "n", "context": "c", "input": "i", "expected": [], "unexpected": []}', "both empty"),
+    ('["not", "an", "object"]', "no {...} found"),
+    ("I cannot do that.", "no {...} found"),
+    ('{"name": "n", "context": c}', "neither valid JSON nor a Python literal"),
+])
+def test_unusable_replies(reply, reason):
+    with pytest.raises(ParseError, match=re.escape(reason)):
+        parse_test_case(reply, KEYS)
+
+
+def test_nothing_in_the_reply_is_executed(tmp_path):
+    marker = tmp_path / "executed"
+    reply = f'{{"name": __import__("pathlib").Path({str(marker)!r}).write_text("x"), "context": "c", "input": "i", "expected": ["a"], "unexpected": []}}'
+    with pytest.raises(ParseError):
+        parse_test_case(reply, KEYS)
+    with pytest.raises(ParseError):
+        parse_test_cases(f"[{reply}]", KEYS)
+    assert not marker.exists()
+
+
+def test_list_reply():
+    other = config.SAMPLE_TEST_CASES[1]
+    reply = f"```json\n{json.dumps([TEST_CASE, other])}\n```"
+    assert parse_test_cases(reply, KEYS) == [TEST_CASE, other]
+
+
+def test_single_object_counts_as_a_list_of_one():
+    assert parse_test_cases(json.dumps(TEST_CASE), KEYS) == [TEST_CASE]
+
+
+def test_unusable_list_entries_are_dropped():
+    broken = {key: value for key, value in TEST_CASE.items() if key != "expected"}
+    assert parse_test_cases(json.dumps([broken, TEST_CASE]), KEYS) == [TEST_CASE]
+    with pytest.raises(ParseError, match="test case 1: missing keys: expected"):
+        parse_test_cases(json.dumps([broken]), KEYS)
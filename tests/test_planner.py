@@ -0,0 +1,97 @@
+import hashlib
+
+from planner import EvaluationPlanner
+from scoring import ScoreTable
+# Renamed so that pytest does not mistake it for a test
+from scoring import test_case_key as case_key
+
+INSTRUCTIONS = [f"Instruction {i}." for i in range(200)]
+
+
+def rechecks(instruction, key, recheck_every):
+    digest = hashlib.sha1(f"{instruction}\0{key}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % recheck_every == 0
+
+
+def saturated_planner(key="case", score=2, window=3):
+    planner = EvaluationPlanner(window=window, recheck_every=5)
+    for instruction in INSTRUCTIONS[:window]:
+        planner.observe(key, instruction, score)
+    return planner
+
+
+def test_saturation_needs_a_full_window_of_equal_scores():
+    planner = EvaluationPlanner(window=3)
+    planner.observe("case", "a", 1)
+    planner.observe("case", "b", 1)
+    assert not planner.saturated("case")
+    assert planner.skip("case", "c") is None
+    planner.observe("case", "c", 1)
+    assert planner.saturated("case")
+    # Seeing an instruction again is not a new observation
+    planner.observe("case", "c", 0)
+    assert planner.saturated("case")
+    planner.observe("case", "d", 0)
+    assert not planner.saturated("case")
+
+
+def test_saturated_cases_are_skipped_except_for_rechecks():
+    planner = saturated_planner()
+    new = INSTRUCTIONS[3:]
+    skipped = [planner.skip("case", instruction) for instruction in new]
+
+    expected = [None if rechecks(instruction, "case", 5) else 2 for instruction in new]
+    assert skipped == expected
+    assert planner.rechecked == expected.count(None) > 0
+    assert planner.skipped == expected.count(2)
+    # Decisions depend on the instruction only, not on when it is asked
+    assert [planner.skip("case", instruction) for instruction in reversed(new)] == list(reversed(expected))
+
+
+def test_a_recheck_with_a_new_score_ends_saturation():
+    planner = saturated_planner()
+    recheck = next(instruction for instruction in INSTRUCTIONS[3:] if rechecks(instruction, "case", 5))
+    assert planner.skip("case", recheck) is None
+    planner.observe("case", recheck, 0)
+    assert not planner.saturated("case")
+
+
+def test_rollback_forgets_speculative_observations():
+    planner = saturated_planner()
+    mark = planner.mark()
+    planner.observe("case", "speculative", 0)
+    planner.observe("other", "speculative", 1)
+    assert not planner.saturated("case")
+    planner.rollback(mark)
+    assert planner.saturated("case")
+    assert planner.state() == saturated_planner().state()
+
+
+def test_state_round_trip():
+    planner = saturated_planner()
+    planner.observe("other", "a", 1)
+    for instruction in INSTRUCTIONS[3:20]:
+        planner.skip("case", instruction)
+
+    restored = EvaluationPlanner(window=3, recheck_every=5)
+    restored.restore(planner.state())
+    assert restored.state() == planner.state()
+    assert restored.summary() == planner.summary()
+    assert planner.summary().endswith("1/2 test cases saturated")
+
+
+def test_planned_cells_are_not_saved():
+    table = ScoreTable(planner=EvaluationPlanner(window=3, recheck_every=5))
+    test_case = {"name": "case", "expected": ["a"], "unexpected": []}
+    for instruction in INSTRUCTIONS[:3]:
+        table.set(instruction, test_case, 1)
+    key = case_key(test_case)
+    new = next(instruction for instruction in INSTRUCTIONS[3:] if not rechecks(instruction, key, 5))
+
+    assert table.plan(new, test_case, None) == 1
+    assert table.peek(new, test_case) == 1
+    assert (new, key, 1) not in table.items()
+    assert len(table.items()) == 3
+    # A real score replaces the planned one and is saved
+    table.set(new, test_case, 0)
+    assert (new, key, 0) in table.items()
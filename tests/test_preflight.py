@@ -0,0 +1,91 @@
+import argparse
+import types
+
+import pytest
+from langchain_core.prompts import ChatPromptTemplate
+
+import qa_config
+from improvements import set_verbosity
+from main import preflight_report
+from preflight import MAX_LISTED_PROBLEMS, run_preflight
+
+# Only the keys MAIN_PROMPT uses, so that no key draws a warning
+CASES = [{key: test_case[key] for key in ("name", "context", "input", "expected", "unexpected")} for test_case in qa_config.SAMPLE_TEST_CASES]
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    set_verbosity(0)
+
+
+def check(test_cases=CASES, **overrides):
+    prompts = {
+        "main_prompt": qa_config.MAIN_PROMPT,
+        "instruction_improvement_prompt": qa_config.INSTRUCTION_IMPROVEMENT_PROMPT,
+        "test_case_improvement_prompt": qa_config.TEST_CASE_IMPROVEMENT_PROMPT,
+    }
+    options = {key: overrides.pop(key) for key in list(overrides) if key in prompts}
+    return run_preflight("qa_config", instruction=qa_config.INITIAL_INSTRUCTION, test_cases=test_cases, **{**prompts, **options}, **overrides)
+
+
+def config(**settings):
+    return types.SimpleNamespace(**{**vars(qa_config), "SAMPLE_TEST_CASES": CASES, **settings})
+
+
+def test_a_good_config_gets_an_estimate():
+    preflight = check(max_iterations=10, num_candidates=2)
+    assert preflight.errors == [] and preflight.warnings == []
+    assert preflight.estimate["baseline"][0] == len(CASES)
+    assert preflight.estimate["optimizer"][0] == 20
+    assert preflight.estimate["candidate"][0] == 20 * len(CASES)
+    assert preflight.totals()[0] == sum(row[0] for row in preflight.estimate.values())
+
+
+def test_a_missing_prompt_variable_is_an_error():
+    cases = [{key: value for key, value in test_case.items() if key != "context"} for test_case in CASES]
+    preflight = check(cases)
+    assert preflight.errors == [f"{len(CASES)} of {len(CASES)} working set test cases lack {{context}}, which MAIN_PROMPT expects (e.g. {CASES[0]['name']!r})"]
+    # No estimate for a config that must not run
+    assert preflight.estimate == {}
+
+
+def test_an_unused_key_is_only_a_warning():
+    preflight = check([{**CASES[0], "notes": "for reviewers"}, *CASES[1:]])
+    assert preflight.errors == []
+    assert preflight.warnings == ["'notes' in 1 working set test cases is not a MAIN_PROMPT variable and never reaches the model"]
+    assert preflight.estimate
+
+
+def test_many_broken_test_cases_are_counted():
+    preflight = check([{"name": f"case {i}", "context": "", "input": "", "expected": "a", "unexpected": []} for i in range(12)])
+    assert len(preflight.errors) == MAX_LISTED_PROBLEMS + 1
+    assert preflight.errors[-1] == "... and 2 more problems in working set test cases"
+
+
+def test_prompts_that_cannot_render_are_errors():
+    prompt = ChatPromptTemplate.from_messages([("human", "Improve {current_instruction} for {audience}")])
+    preflight = check(instruction_improvement_prompt=prompt)
+    assert len(preflight.errors) == 1
+    assert preflight.errors[0].startswith("INSTRUCTION_IMPROVEMENT_PROMPT expects {audience}, which the loop does not provide")
+
+    main_prompt = ChatPromptTemplate.from_messages([("human", "{input}")])
+    assert check(main_prompt=main_prompt).errors[0].startswith("MAIN_PROMPT has no {instruction} variable")
+    assert check([]).errors == ["no test cases: set SAMPLE_TEST_CASES or TEST_SUITE_FILE"]
+
+
+def test_report_prints_errors_and_blocks_the_run(capsys):
+    assert not preflight_report("broken_config.py", config(SAMPLE_TEST_CASES=[{"name": "only a name"}]))
+    out = capsys.readouterr().out
+    assert out.startswith("Pre-flight check of broken_config.py")
+    assert "error: working set test case 1 ('only a name') has no 'expected'" in out
+
+
+def test_report_prints_only_warnings_unless_dry_run(capsys):
+    noted = config(SAMPLE_TEST_CASES=[{**CASES[0], "notes": "x"}, *CASES[1:]])
+    assert preflight_report("qa_config.py", noted)
+    assert capsys.readouterr().out == "Warning: qa_config.py: 'notes' in 1 working set test cases is not a MAIN_PROMPT variable and never reaches the model\n"
+
+    options = argparse.Namespace(dry_run=True)
+    assert preflight_report("qa_config.py", config(PRICE_PER_MILLION_INPUT_TOKENS=1.0, PRICE_PER_MILLION_OUTPUT_TOKENS=2.0), options)
+    out = capsys.readouterr().out
+    assert "\ntotal " in out and "Estimated cost: " in out
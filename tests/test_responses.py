@@ -0,0 +1,87 @@
+import json
+import random
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+import qa_config as config
+from fake_llm import FakeChatModel, default_responder
+from improvements import ImprovementSettings, adversarial_improvement, set_verbosity
+from responses import ResponseStore, format_rescore, load_overrides, rescore_store
+from scoring import ScoreTable
+
+OLD = "Answer."
+NEW = "Answer in detail."
+CASES = [
+    {"name": "capital", "expected": ["Paris"], "unexpected": ["London"]},
+    {"name": "year", "expected": ["1889"], "unexpected": []},
+]
+
+
+@pytest.fixture(autouse=True)
+def quiet(tmp_path, monkeypatch):
+    set_verbosity(0)
+    monkeypatch.chdir(tmp_path)
+
+
+def recorded_store(path="store.sqlite"):
+    # NEW wins 2 to 1 under the recorded keywords, but only because it says London
+    store = ResponseStore(path)
+    store.start(0)
+    prompt = [HumanMessage(content="question")]
+    store.record("baseline", [(OLD, CASES[0], prompt, "Paris.", 1), (OLD, CASES[1], prompt, "In 1890.", 0)])
+    store.record("candidate", [(NEW, CASES[0], prompt, "Paris, not London.", 0), (NEW, CASES[1], prompt, "In 1889.", 1)])
+    store.record("candidate", [(NEW, CASES[1], prompt, "A later answer is not the one the loop used.", 0)])
+    store.decision("instruction", [(OLD, CASES), (NEW, CASES)], [0])
+    store.decision("instruction", [(OLD, CASES), ("Never scored.", CASES)], [0])
+    store.commit("instruction", 1)
+    store.decision("instruction", [(OLD, CASES), (NEW, CASES)], [1])
+    store.discard("instruction")
+    store.iteration(1, OLD, CASES)
+    store.close()
+    return path
+
+
+def test_rescoring_with_the_same_keywords_changes_nothing():
+    result = rescore_store(recorded_store())
+    assert (result.responses, result.changed_cells, result.decisions, result.incomplete, result.flips) == (5, 0, 2, 1, [])
+    assert result.trajectory == [(1, 1, 1, 2, 2)]
+
+
+def test_new_keywords_flip_a_decision(tmp_path):
+    overrides_path = tmp_path / "keywords.jsonl"
+    overrides_path.write_text(json.dumps({"name": "capital", "unexpected": []}) + "\n")
+    result = rescore_store(recorded_store(), load_overrides(str(overrides_path)))
+
+    assert result.changed_cells == 1
+    (flip,) = result.flips
+    assert (flip.iteration, flip.step, flip.chosen, flip.rescored_chosen, flip.scores, flip.rescores) == (1, "instruction", [0], [1], [1, 1], [1, 2])
+    assert "iteration 1 instruction: kept options [0] with scores [1, 1]; re-scored [1, 2] would keep [1]" in format_rescore(result)
+
+
+def test_a_scoring_function_replaces_the_keywords():
+    result = rescore_store(recorded_store(), scorer=lambda response, test_case: len(response))
+    assert result.changed_cells == 4
+    assert [flip.rescored_chosen for flip in result.flips] == [[1]]
+
+
+def test_overrides_need_an_id_or_a_name(tmp_path):
+    overrides_path = tmp_path / "keywords.jsonl"
+    overrides_path.write_text('{"expected": ["a"]}\n')
+    with pytest.raises(ValueError, match="needs an 'id' or a 'name'"):
+        load_overrides(str(overrides_path))
+
+
+@pytest.mark.parametrize("search", [{}, {"num_candidates": 3, "population_size": 2, "num_test_candidates": 2}])
+def test_a_recorded_run_replays_its_own_decisions(search):
+    store = ResponseStore("store.sqlite")
+    settings = ImprovementSettings(max_iterations=4, log_file_path="log.txt", score_table=ScoreTable(responses=store), rng=random.Random(1), **search)
+    llm = FakeChatModel(seed=1, responder=lambda role, text, rng: default_responder(role, text, random.Random(text)))
+    adversarial_improvement(llm, config.MAIN_PROMPT, config.INITIAL_INSTRUCTION, config.SAMPLE_TEST_CASES, config.INSTRUCTION_IMPROVEMENT_PROMPT, config.TEST_CASE_IMPROVEMENT_PROMPT, settings=settings)
+    store.close()
+
+    result = rescore_store("store.sqlite")
+    assert result.responses > 0 and result.decisions >= 8
+    assert (result.changed_cells, result.incomplete, result.flips) == (0, 0, [])
+    assert [row[0] for row in result.trajectory] == [1, 2, 3, 4]
+    assert all(score == rescore for _, score, rescore, _, _ in result.trajectory)
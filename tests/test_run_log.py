@@ -0,0 +1,82 @@
+import json
+import random
+
+import pytest
+
+import qa_config as config
+from fake_llm import FakeChatModel, default_responder
+from improvements import ImprovementSettings, adversarial_improvement, set_verbosity
+from run_log import RunLog, replay_run_log
+from scoring import ScoreTable
+
+CASES = [{"name": f"case {i}", "expected": [str(i)], "unexpected": []} for i in range(3)]
+
+
+@pytest.fixture(autouse=True)
+def quiet(tmp_path, monkeypatch):
+    set_verbosity(0)
+    monkeypatch.chdir(tmp_path)
+
+
+def by_prompt(role, text, rng):
+    return default_responder(role, text, random.Random(text))
+
+
+def run(max_iterations, run_log, **options):
+    settings = ImprovementSettings(max_iterations=max_iterations, log_file_path="log.txt", score_table=ScoreTable(), rng=random.Random(1), run_log=run_log, **options)
+    llm = FakeChatModel(seed=1, responder=by_prompt)
+    result = adversarial_improvement(llm, config.MAIN_PROMPT, config.INITIAL_INSTRUCTION, config.SAMPLE_TEST_CASES, config.INSTRUCTION_IMPROVEMENT_PROMPT, config.TEST_CASE_IMPROVEMENT_PROMPT, settings=settings)
+    run_log.close()
+    return result
+
+
+def test_replay_follows_the_deltas():
+    log = RunLog("events.jsonl")
+    log.start(0, "First.", CASES)
+    log.instruction(1, "Second.")
+    log.test_cases(1, CASES, [CASES[0], {"name": "new"}, CASES[2]])
+    log.iteration(1, 3, 0.1, 0.1)
+    log.test_cases(2, CASES, CASES[:2])
+    log.iteration(2, 2, 0.1, 0.2)
+    log.close()
+
+    with open("events.jsonl") as log_file:
+        events = [json.loads(line)["event"] for line in log_file]
+    # Only the replaced case is written, unless the number of cases changed
+    assert events == ["start", "instruction", "test_case", "iteration", "test_cases", "iteration"]
+    assert replay_run_log("events.jsonl", 0) == (0, "First.", CASES, None)
+    assert replay_run_log("events.jsonl", 1) == (1, "Second.", [CASES[0], {"name": "new"}, CASES[2]], 3)
+    assert replay_run_log("events.jsonl") == (2, "Second.", CASES[:2], 2)
+
+
+def test_replay_matches_the_run():
+    instruction, test_cases = run(4, RunLog("events.jsonl"))
+    state = replay_run_log("events.jsonl")
+    assert (state.iteration, state.instruction, state.test_cases) == (4, instruction, test_cases)
+
+    shorter = run(2, RunLog("shorter.jsonl"))
+    assert replay_run_log("events.jsonl", 2)[1:3] == shorter
+
+
+def test_resumed_run_appends_to_the_log():
+    interrupted = run(2, RunLog("events.jsonl"), checkpoint_path="run.json")
+    instruction, test_cases = run(4, RunLog("events.jsonl"), checkpoint_path="run.json", resume=True)
+
+    with open("events.jsonl") as log_file:
+        starts = [event["iteration"] for event in map(json.loads, log_file) if event["event"] == "start"]
+    assert starts == [0, 2]
+    assert replay_run_log("events.jsonl")[1:3] == (instruction, test_cases)
+    assert replay_run_log("events.jsonl", 2)[1:3] == interrupted
+
+
+def test_a_new_run_replaces_the_log():
+    run(2, RunLog("events.jsonl"))
+    run(1, RunLog("events.jsonl"))
+    assert replay_run_log("events.jsonl").iteration == 1
+
+
+def test_log_without_start_is_rejected():
+    with open("events.jsonl", "w") as log_file:
+        log_file.write(json.dumps({"event": "instruction", "iteration": 1, "instruction": "x"}) + "\n")
+    with pytest.raises(ValueError, match="does not begin with a start event"):
+        replay_run_log("events.jsonl")
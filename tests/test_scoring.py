@@ -0,0 +1,71 @@
+import random
+
+import pytest
+
+import scoring
+from scoring import KeywordMatcher, ScoringEngine, evaluate_response
+
+WORDS = ["Paris", "paris", "1889", "Eiffel", "tower", "Gustave", "iron", "", "324 meters", "France", "Tower"]
+
+
+def reference_score(result, test_case):
+    # The original scoring: case-insensitive substring counts
+    text = result.lower()
+    expected_found = sum(1 for keyword in test_case["expected"] if keyword.lower() in text)
+    unexpected_found = sum(1 for keyword in test_case["unexpected"] if keyword.lower() in text)
+    return expected_found - unexpected_found, expected_found, unexpected_found
+
+
+def random_cases(rng, count):
+    # Keywords repeat across and within lists, in different cases, so shared keywords are exercised too
+    keywords = [word for word in WORDS if word]
+    return [
+        {"name": f"case {i}", "expected": rng.sample(keywords, rng.randint(0, 4)), "unexpected": rng.sample(keywords, rng.randint(0, 3))}
+        for i in range(count)
+    ]
+
+
+def random_responses(rng, count):
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 8))) for _ in range(count)]
+
+
+@pytest.fixture(params=["ahocorasick", "substring"])
+def matcher_kind(request, monkeypatch):
+    if request.param == "ahocorasick":
+        if scoring.ahocorasick is None:
+            pytest.skip("pyahocorasick is not installed")
+    else:
+        monkeypatch.setattr(scoring, "ahocorasick", None)
+    return request.param
+
+
+def test_matcher_agrees_with_reference(matcher_kind):
+    rng = random.Random(0)
+    for test_case in random_cases(rng, 50):
+        matcher = KeywordMatcher(test_case["expected"], test_case["unexpected"])
+        for response in random_responses(rng, 20):
+            score, expected_found, unexpected_found = reference_score(response, test_case)
+            scored = matcher.evaluate(response)
+            assert (scored.score, scored.expected_found, scored.unexpected_found) == (score, expected_found, unexpected_found)
+            assert matcher.score(response) == score
+            text = response.lower()
+            assert scored.missed == [keyword for keyword in test_case["expected"] if keyword.lower() not in text]
+            assert scored.found == [keyword for keyword in test_case["unexpected"] if keyword.lower() in text]
+
+
+def test_score_matrix_agrees_with_reference(matcher_kind):
+    rng = random.Random(1)
+    test_cases = random_cases(rng, 6)
+    responses = [[None if rng.random() < 0.2 else response for response in random_responses(rng, len(test_cases))] for _ in range(10)]
+    matrix = ScoringEngine(test_cases).score_matrix(responses)
+
+    assert matrix.shape == (10, 6)
+    for row, row_responses in enumerate(responses):
+        for column, response in enumerate(row_responses):
+            assert matrix[row, column] == (0 if response is None else reference_score(response, test_cases[column])[0])
+
+
+def test_evaluate_response():
+    test_case = {"name": "Eiffel", "expected": ["1889", "Gustave Eiffel"], "unexpected": ["1890", "London"]}
+    scored = evaluate_response("Completed in 1889, not 1890.", test_case)
+    assert scored == (0, 1, 1, ["Gustave Eiffel"], ["1890"])
@@ -0,0 +1,204 @@
+import http.client
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from service import EnhancementService, ServiceHandler, parse_args
+
+
+def serve(tmp_path, monkeypatch, *args):
+    """The service with the fake model on a free port; jobs write under ``tmp_path``."""
+    monkeypatch.chdir(tmp_path)
+    service = EnhancementService(parse_args(["--fake", "--fake-latency", "0.01", "--cache-path", "", "--port", "0", *args]))
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), ServiceHandler)
+    http_server.service = service
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    yield http_server
+    http_server.shutdown()
+    http_server.server_close()
+    service.close()
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    yield from serve(tmp_path, monkeypatch, "--models", "solar-pro", "solar-mini")
+
+
+@pytest.fixture
+def one_job_server(tmp_path, monkeypatch):
+    yield from serve(tmp_path, monkeypatch, "--max-jobs", "1")
+
+
+def request(server, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=30)
+    if headers is None:
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+    data = body if isinstance(body, bytes) or body is None else json.dumps(body).encode()
+    connection.request(method, path, body=data, headers=headers)
+    response = connection.getresponse()
+    status, content = response.status, response.read()
+    connection.close()
+    return status, json.loads(content) if content else None
+
+
+def submit(server, payload):
+    status, job = request(server, "POST", "/jobs", payload)
+    assert status == 202, job
+    return job
+
+
+def wait_for(server, job_id, statuses=("done", "failed", "cancelled"), timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status, job = request(server, "GET", f"/jobs/{job_id}")
+        assert status == 200
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} is still {job['status']}")
+
+
+def events(server, job_id, last_event_id=None):
+    """``(id, event, data)`` of every event the stream sends until the job's stream ends."""
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=30)
+    connection.request("GET", f"/jobs/{job_id}/events", headers={"Last-Event-ID": str(last_event_id)} if last_event_id is not None else {})
+    response = connection.getresponse()
+    assert response.status == 200
+    assert response.getheader("Content-Type") == "text/event-stream"
+    received, fields = [], {}
+    for line in response.read().decode().splitlines():
+        if line.startswith(":"):
+            continue
+        if not line:
+            if fields:
+                received.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+            fields = {}
+            continue
+        key, _, value = line.partition(": ")
+        fields[key] = value
+    connection.close()
+    return received
+
+
+def test_submit_runs_a_job_to_completion(server):
+    job = submit(server, {"config": "qa_config", "seed": 1, "settings": {"MAX_ITERATIONS": 2}})
+    assert job["status"] in ("queued", "running")
+    assert job["name"] == f"qa_config_{job['id']}"
+
+    finished = wait_for(server, job["id"])
+    assert finished["status"] == "done", finished["error"]
+    assert finished["iteration"] == 2
+    assert finished["max_iterations"] == 2
+    assert finished["result"]["instruction"]
+    # Every file of a job goes to its own results directory
+    assert finished["result"]["results_file"].startswith(f"results/{job['name']}/")
+
+    status, jobs = request(server, "GET", "/jobs")
+    assert status == 200
+    assert [listed["id"] for listed in jobs] == [job["id"]]
+
+
+def test_event_stream_resumes_after_last_event_id(server):
+    job = submit(server, {"config": "qa_config", "seed": 1, "settings": {"MAX_ITERATIONS": 2}})
+    wait_for(server, job["id"])
+
+    received = events(server, job["id"])
+    assert [event_id for event_id, _, _ in received] == list(range(1, len(received) + 1))
+    names = [name for _, name, _ in received]
+    assert names[0] == "status" and names[-1] == "status"
+    assert {"start", "iteration", "stop"} <= set(names)
+    assert received[-1][2]["status"] == "done"
+
+    assert events(server, job["id"], last_event_id=3) == received[3:]
+
+
+def test_cancel_stops_a_running_job(server):
+    job = submit(server, {"config": "qa_config", "seed": 1, "settings": {"MAX_ITERATIONS": 500}})
+    wait_for(server, job["id"], statuses=("running",))
+
+    status, cancelled = request(server, "POST", f"/jobs/{job['id']}/cancel")
+    assert status == 202
+    assert wait_for(server, job["id"])["status"] == "cancelled"
+
+    status, body = request(server, "POST", f"/jobs/{job['id']}/cancel")
+    assert status == 409
+
+
+def test_cancel_a_queued_job(one_job_server):
+    running = submit(one_job_server, {"config": "qa_config", "seed": 1, "settings": {"MAX_ITERATIONS": 500}})
+    wait_for(one_job_server, running["id"], statuses=("running",))
+    queued = submit(one_job_server, {"config": "qa_config", "seed": 2, "settings": {"MAX_ITERATIONS": 1}})
+    assert queued["status"] == "queued"
+
+    status, cancelled = request(one_job_server, "POST", f"/jobs/{queued['id']}/cancel")
+    assert status == 202
+    assert cancelled["status"] == "cancelled"
+    # The freed slot must not start the cancelled job
+    request(one_job_server, "POST", f"/jobs/{running['id']}/cancel")
+    assert wait_for(one_job_server, running["id"])["status"] == "cancelled"
+    time.sleep(0.2)
+    statuses = [data["status"] for _, name, data in events(one_job_server, queued["id"]) if name == "status"]
+    assert statuses == ["queued", "cancelled"]
+
+
+def test_jobs_may_only_use_the_served_models(server):
+    job = submit(server, {"config": "qa_config", "seed": 1, "settings": {"MAX_ITERATIONS": 1, "ADVERSARY_MODEL": "solar-mini"}})
+    assert wait_for(server, job["id"])["status"] == "done"
+
+    status, body = request(server, "POST", "/jobs", {"config": "qa_config", "settings": {"EVALUATION_MODELS": ["solar-pro", "model-1", "model-2"]}})
+    assert status == 400
+    assert body["error"] == "model model-1, model-2 is not served here; use one of: solar-pro, solar-mini"
+
+
+@pytest.mark.parametrize("payload, message", [
+    ({"config": "os"}, "*_config module"),
+    ({"config": "missing_config"}, "cannot load config"),
+    ({"settings": {"INITIAL_INSTRUCTION": "Answer."}}, "no 'config' module"),
+    ({"config": "qa_config", "settings": {"MAX_ITERATIONS": "5"}}, "MAX_ITERATIONS must be int, not str"),
+    ({"config": "qa_config", "settings": {"NUM_CANDIDATES": True}}, "NUM_CANDIDATES must be int, not bool"),
+    ({"config": "qa_config", "settings": {"SAMPLE_TEST_CASES": ["a case"]}}, "every item of SAMPLE_TEST_CASES"),
+    ({"config": "qa_config", "settings": {"METRICS_FILE": "/tmp/metrics.prom"}}, "METRICS_FILE cannot be set"),
+    ({"config": "qa_config", "settings": {"TEST_SUITE_FILE": "/etc/passwd"}}, "TEST_SUITE_FILE cannot be set"),
+    ({"config": "qa_config", "settings": {"VERBOSITY": 2}}, "cannot be set through the service"),
+    ({"config": "qa_config", "settings": {"MAIN_PROMPT": "{instruction} {missing}"}}, "missing"),
+    ({"config": "qa_config", "seed": "1"}, "'seed' must be an integer"),
+    ([1, 2], "JSON object"),
+])
+def test_bad_payloads_are_rejected(server, payload, message):
+    status, body = request(server, "POST", "/jobs", payload)
+    assert status == 400
+    assert message in body["error"]
+    status, jobs = request(server, "GET", "/jobs")
+    assert jobs == []
+
+
+def test_malformed_json_is_rejected(server):
+    status, body = request(server, "POST", "/jobs", b"{not json", {"Content-Type": "application/json"})
+    assert status == 400
+
+
+@pytest.mark.parametrize("headers", [{}, {"Content-Type": "text/plain"}, {"Content-Type": "application/x-www-form-urlencoded"}])
+def test_submit_requires_json_content_type(server, headers):
+    status, body = request(server, "POST", "/jobs", json.dumps({"config": "qa_config"}).encode(), headers)
+    assert status == 415
+    status, jobs = request(server, "GET", "/jobs")
+    assert jobs == []
+
+
+@pytest.mark.parametrize("last_event_id", ["abc", "-1"])
+def test_bad_last_event_id_is_rejected(server, last_event_id):
+    job = submit(server, {"config": "qa_config", "seed": 1, "settings": {"MAX_ITERATIONS": 1}})
+    status, body = request(server, "GET", f"/jobs/{job['id']}/events", headers={"Last-Event-ID": last_event_id})
+    assert status == 400
+    assert "Last-Event-ID" in body["error"]
+
+
+def test_unknown_jobs_and_routes(server):
+    assert request(server, "GET", "/jobs/nope")[0] == 404
+    assert request(server, "GET", "/jobs/nope/events")[0] == 404
+    assert request(server, "POST", "/jobs/nope/cancel")[0] == 404
+    assert request(server, "GET", "/elsewhere")[0] == 404
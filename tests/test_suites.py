@@ -0,0 +1,38 @@
+import pytest
+
+from suites import JsonlSuite, write_jsonl_suite
+
+CASES = [{"name": f"case {i}", "input": "é" * i, "expected": [str(i)], "unexpected": []} for i in range(40)]
+
+
+@pytest.fixture
+def suite(tmp_path):
+    path = tmp_path / "suite.jsonl"
+    write_jsonl_suite(str(path), CASES)
+    # Blank lines are not cases
+    path.write_text(path.read_text().replace("\n", "\n\n", 3) + "\n  \n")
+    suite = JsonlSuite(str(path))
+    yield suite
+    suite.close()
+
+
+def test_cases_are_read_by_offset(suite):
+    assert len(suite) == len(CASES)
+    assert suite[0] == CASES[0]
+    assert suite[39] == CASES[39]
+    assert suite.read([30, 2, 17]) == [CASES[30], CASES[2], CASES[17]]
+
+
+def test_minibatch_is_seeded_and_in_file_order(suite):
+    batch = suite.minibatch(8, "seed", 3)
+    assert batch == suite.minibatch(8, "seed", 3)
+    assert batch != suite.minibatch(8, "seed", 4)
+    indices = [CASES.index(test_case) for test_case in batch]
+    assert len(set(indices)) == 8 and indices == sorted(indices)
+    assert len(suite.minibatch(100, "seed", 0)) == len(CASES)
+
+
+def test_batches_stream_the_whole_suite(suite):
+    batches = list(suite.batches(batch_size=16))
+    assert [len(batch) for batch in batches] == [16, 16, 8]
+    assert [test_case for batch in batches for test_case in batch] == CASES
@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from jobs import JobQueue
+
+
+async def run_worker(queue: JobQueue, make_model: Callable[[Optional[str]], Any], worker: str, concurrency: int = 8, poll_interval: float = 0.1, idle_exit: Optional[float] = None, models: Optional[List[str]] = None) -> int:
+    """Answer jobs from ``queue``, up to ``concurrency`` at a time.
+
+    Each job is answered by the model it names. ``make_model(name)`` builds
+    that model the first time it is needed (``None`` for jobs that name no
+    model), so every model gets one client and scheduler in this process.
+    With ``models``, only jobs for those models are taken. Returns the
+    number of jobs handled. With ``idle_exit`` the worker stops once the
+    queue has been empty for that many seconds.
+    """
+    llms: Dict[Optional[str], Any] = {}
+    running = {}
+    handled = 0
+    idle_since = time.monotonic()
+    while True:
+        for job_id, model, messages, stop in queue.claim(worker, concurrency - len(running), models):
+            if model not in llms:
+                llms[model] = make_model(model)
+            running[asyncio.create_task(llms[model].ainvoke(messages, stop=stop))] = job_id
+
+        if not running:
+            if idle_exit is not None and time.monotonic() - idle_since >= idle_exit:
+                return handled
+            await asyncio.sleep(poll_interval)
+            continue
+
+        done, _ = await asyncio.wait(running, timeout=poll_interval, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            job_id = running.pop(task)
+            try:
+                queue.complete(job_id, task.result())
+            except Exception as e:
+                # Retryable provider errors were already retried by the model's scheduler
+                queue.fail(job_id, f"{type(e).__name__}: {e}")
+            handled += 1
+        idle_since = time.monotonic()
+
+
+def make_worker_llm(options, model_name=None):
+    if options.fake:
+        from fake_llm import FakeChatModel
+        return FakeChatModel(model_name=model_name or "fake-model", seed=options.seed, latency=options.fake_latency)
+    from main import load_config, make_llm
+    # Jobs that name no model get the config's (or the default) target model
+    return make_llm(load_config(options.config) if options.config else None, options, use_queue=False, model_name=model_name)
+
+
+def worker_process(options) -> None:
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    queue = JobQueue(options.queue_path, options.lease_seconds)
+    try:
+        handled = asyncio.run(run_worker(queue, lambda model_name: make_worker_llm(options, model_name), worker, options.concurrency, options.poll_interval, options.idle_exit, options.models))
+    finally:
+        queue.close()
+    print(f"Worker {worker} handled {handled} jobs")
+
+
+def main(options):
+    # Extra local processes; more workers can be started on other machines sharing the queue file
+    processes = [multiprocessing.Process(target=worker_process, args=(options,)) for _ in range(options.processes - 1)]
+    for process in processes:
+        process.start()
+    try:
+        worker_process(options)
+    finally:
+        for process in processes:
+            process.join()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Answer model calls from a job queue shared with main.py or batch.py.")
+    parser.add_argument("queue_path", help="SQLite job queue, the JOB_QUEUE of the runs")
+    parser.add_argument("--config", help="config module whose model settings to use, e.g. qa_config.py")
+    parser.add_argument("--models", nargs="+", help="only answer jobs for these models (default: every model)")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes to start on this machine (default 1)")
+    parser.add_argument("--concurrency", type=int, default=8, help="jobs each process runs at a time (default 8)")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="seconds between queue checks when idle (default 0.1)")
+    parser.add_argument("--lease-seconds", type=float, default=300.0, help="hand a job out again if its worker has not answered after this long")
+    parser.add_argument("--idle-exit", type=float, help="stop after the queue has been empty for this many seconds")
+    parser.add_argument("--requests-per-second", type=float, help="rate limit for this process's model calls")
+    parser.add_argument("--max-retries", type=int, help="retries for rate-limited, timed out or failed (5xx) calls (default 3)")
+    parser.add_argument("--max-in-flight", type=int, help="upper limit on this process's model calls in flight (default 16)")
+    parser.add_argument("--adaptive-concurrency", action=argparse.BooleanOptionalAction, help="halve the calls in flight on a 429 and grow them back on success (default on)")
+    parser.add_argument("--fake", action="store_true", help="answer with the offline fake model instead of the provider")
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="seconds per fake model call")
+    parser.add_argument("--seed", type=int, default=0, help="fake model seed")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())